@@ -71,7 +71,13 @@ app_name = 'HDFCompass_' + version
 a = Analysis(['HDFCompass.py'],
              pathex=[],
              hiddenimports=['scipy.linalg.cython_blas', 'scipy.linalg.cython_lapack',
-                            'scipy.linalg', 'scipy.integrate'],  # for cartopy
+                            'scipy.linalg', 'scipy.integrate',  # for cartopy
+                            # plugins and plot windows are imported lazily, by name
+                            'hdf_compass.filesystem_model', 'hdf_compass.array_model', 'hdf_compass.hdf5_model',
+                            'hdf_compass.bag_model', 'hdf_compass.asc_model', 'hdf_compass.opendap_model',
+                            'hdf_compass.hdf5rest_model', 'hdf_compass.adios_model',
+                            'hdf_compass.compass_viewer.array.plot', 'hdf_compass.compass_viewer.geo_array.plot',
+                            'hdf_compass.compass_viewer.geo_surface.plot'],
              excludes=["PySide"],  # exclude libraries from being bundled (in case that are installed)
              hookspath=None,
              runtime_hooks=None)
@@ -21,7 +21,9 @@ from itertools import groupby
 import sys
 import os.path as op
 import posixpath as pp
+from collections import OrderedDict
 
+import numpy as np
 import adios
 
 import logging
@@ -32,6 +34,138 @@ log.addHandler(logging.NullHandler())
 from hdf_compass import compass_model
 from hdf_compass.utils import url2path
 
+# Max size of the decoded blocks retained by each store
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+
+
+def normalize_key(key):
+    """ Keys are absolute paths; "" and "/" are the root group """
+    if not key.startswith("/"):
+        key = "/%s" % key
+    return key
+
+
+class KeyIndex(object):
+    """
+    Prefix tree over the variable paths of an ADIOS file, built once.
+
+    Every path (of a variable or of an intermediate group) maps to an entry
+    with its children and, for variables, the name used by the ADIOS API.
+    Attributes are indexed by path as well.  This makes membership tests
+    O(1) and group listings O(number of members).
+    """
+
+    class Entry(object):
+        __slots__ = ('children', 'var')
+
+        def __init__(self):
+            self.children = []
+            self.var = None
+
+    def __init__(self, var_names, attr_names):
+        self._entries = {"/": KeyIndex.Entry()}
+        for name in var_names:
+            self._entry(normalize_key(name)).var = name
+        self._attrs = dict((normalize_key(name), name) for name in attr_names)
+
+    def _entry(self, path):
+        """ Return the entry for *path*, adding it (and its parents) if needed """
+        entry = self._entries.get(path)
+        if entry is None:
+            entry = self._entries[path] = KeyIndex.Entry()
+            self._entry(pp.dirname(path)).children.append(path)
+        return entry
+
+    def __contains__(self, key):
+        return normalize_key(key) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def children(self, key):
+        """ Full paths of the members of a group """
+        return self._entries[normalize_key(key)].children
+
+    def is_group(self, key):
+        key = normalize_key(key)
+        return key == "/" or len(self._entries[key].children) > 0
+
+    def variable(self, key):
+        """ Name of the variable at *key* (as used by the ADIOS API), or None """
+        entry = self._entries.get(normalize_key(key))
+        return None if entry is None else entry.var
+
+    def attribute(self, key):
+        """ Name of the attribute at *key* (as used by the ADIOS API), or None """
+        return self._attrs.get(normalize_key(key))
+
+
+def window(args, shape):
+    """ Split an index into the bounding window to read and the index to apply to it.
+
+    The window is a list of (start, stop) pairs, one per dimension.  Integers, strides and any
+    other selection are applied locally to the window.
+    """
+    if not isinstance(args, tuple):
+        args = (args,)
+    ellipsis = [pos for pos, idx in enumerate(args) if idx is Ellipsis]  # not "in": arrays compare elementwise
+    if len(ellipsis) > 0:
+        pos = ellipsis[0]
+        args = args[:pos] + (slice(None),) * (len(shape) - len(args) + 1) + args[pos + 1:]
+    args = args + (slice(None),) * (len(shape) - len(args))
+    if len(args) > len(shape):
+        raise IndexError("too many indices (%d) for shape %s" % (len(args), shape))
+
+    win = []
+    local = []
+    for idx, size in zip(args, shape):
+        if isinstance(idx, (int, np.integer)):
+            pos = idx + size if idx < 0 else idx
+            if not 0 <= pos < size:
+                raise IndexError("index %d out of range (size %d)" % (idx, size))
+            win.append((pos, pos + 1))
+            local.append(0)
+        elif isinstance(idx, slice) and (idx.step is None or idx.step > 0):
+            start, stop, step = idx.indices(size)
+            stop = max(start, stop)
+            win.append((start, stop))
+            local.append(slice(None, None, step))
+        else:
+            win.append((0, size))
+            local.append(idx)
+    return win, tuple(local)
+
+
+class BlockCache(object):
+    """ Bounded LRU cache of the decoded blocks, keyed by (variable, step, block start). """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._blocks = OrderedDict()
+        self._nbytes = 0
+
+    def get(self, key):
+        block = self._blocks.pop(key, None)
+        if block is not None:
+            self._blocks[key] = block
+        return block
+
+    def can_hold(self, nbytes):
+        """ True if a block of *nbytes* bytes fits in the cache """
+        return nbytes <= self.max_bytes
+
+    def put(self, key, block):
+        if not self.can_hold(block.nbytes) or key in self._blocks:
+            return
+        while self._blocks and self._nbytes + block.nbytes > self.max_bytes:
+            self._nbytes -= self._blocks.popitem(last=False)[1].nbytes
+        self._blocks[key] = block
+        self._nbytes += block.nbytes
+
+    def clear(self):
+        self._blocks.clear()
+        self._nbytes = 0
+
 
 class ADIOSStore(compass_model.Store):
     """
@@ -50,18 +184,7 @@ class ADIOSStore(compass_model.Store):
     file_extensions = {'ADIOS File': ['*.bp']}
 
     def __contains__(self, key):
-        if(self.valid):
-            if(not key.startswith("/") and key != ""):
-                key = "/%s" % key
-            key = key.encode("ascii")
-            keylist = self.f.var.keys()
-            for k in keylist:
-                if(not k.startswith("/") and k != ""):
-                    k = "/%s" % k
-                k = k.encode("ascii")
-                if(k.startswith(key)):
-                    return True
-        return False
+        return self.valid and key in self._index
 
     @property
     def url(self):
@@ -96,6 +219,9 @@ class ADIOSStore(compass_model.Store):
             self._url = url
             path = url2path(url).encode("ascii")
             self.f = adios.file(path)
+            self._index = KeyIndex(self.f.var.keys(), self.f.attr.keys())
+            self._blocks = BlockCache()
+            log.debug("indexed %d paths of %s" % (len(self._index), path))
             self._valid = True
         except:
             self._valid = False
@@ -103,6 +229,7 @@ class ADIOSStore(compass_model.Store):
     def close(self):
         if(self.valid):
             self.f.close()
+            self._blocks.clear()
             self._valid = False
         else:
             print("ADIOS: can't close invalid file")
@@ -118,6 +245,16 @@ class ADIOSStore(compass_model.Store):
 
         return self[pkey]
 
+    @property
+    def index(self):
+        """ KeyIndex of the paths in the file """
+        return self._index
+
+    @property
+    def blocks(self):
+        """ Cache of the decoded blocks """
+        return self._blocks
+
 class ADIOSGroup(compass_model.Container):
     """ Represents an ADIOS group, to be displayed in the browser view. """
 
@@ -125,30 +262,17 @@ class ADIOSGroup(compass_model.Container):
 
     @staticmethod
     def can_handle(store, key):
-        return (key in store and isinstance(store.f[key.encode("ascii")], adios.group))
- 
+        return key in store and store.index.is_group(key)
+
     @property
     def _names(self):
         # Lazily build the list of names; this helps when browsing big files
         if self._xnames is None:
-            self._xnames = []
-            c = self._key.count('/')
-            if(self._key != "/"):
-                c = c + 1
-
-            keylist = self._store.f.var.keys()
-            for k in keylist:
-                if(not k.startswith("/")):
-                    k = "/%s" % k
-
-                while(k != self._key and k != "/"):
-                    if(k.startswith(self._key) and k.count('/') == c and not k in self._xnames):
-                        self._xnames.append(k)
-                    k = pp.dirname(k)
+            self._xnames = self._store.index.children(self._key)
 
             # Natural sort is expensive
             if len(self._xnames) < 1000:
-                self._xnames.sort()
+                self._xnames = sorted(self._xnames)
 
         return self._xnames
 
@@ -196,18 +320,25 @@ class ADIOSGroup(compass_model.Container):
         return self._store[key]
 
 class ADIOSDataset(compass_model.Array):
-    """ Represents an ADIOS dataset. """
+    """ Represents an ADIOS dataset.
+
+    For variables written over several steps, the first dimension is the step.
+    Reads only decode the blocks (as written by each process) that overlap the
+    requested window and step; the decoded blocks are cached in the store.
+    """
 
     class_kind = "ADIOS Dataset"
 
     @staticmethod
     def can_handle(store, key):
-        return (key in store and isinstance(store.f[key.encode("ascii")], adios.var))
+        return key in store and store.index.variable(key) is not None
 
     def __init__(self, store, key):
         self._store = store
         self._key = key
-        self._dset = store.f[key.encode("ascii")]
+        self._dset = store.f.var[store.index.variable(key)]
+        self._nsteps = getattr(self._dset, 'nsteps', 1)
+        self._dims = tuple(self._dset.dims)
 
     @property
     def key(self):
@@ -223,18 +354,87 @@ class ADIOSDataset(compass_model.Array):
 
     @property
     def description(self):
+        if self._nsteps > 1:
+            return 'Dataset "%s" (%d steps)' % (self.display_name, self._nsteps)
         return 'Dataset "%s"' % (self.display_name,)
 
     @property
     def shape(self):
-        return self._dset.shape
+        if self._nsteps > 1:
+            return (self._nsteps,) + self._dims
+        return self._dims
 
     @property
     def dtype(self):
         return self._dset.dtype
 
     def __getitem__(self, args):
-        return self._dset[args]
+        if len(self.shape) == 0:
+            return self._dset.read()[args]
+
+        win, local = window(args, self.shape)
+        if self._nsteps > 1:
+            steps, space = range(*win[0]), win[1:]
+        else:
+            steps, space = [None], win
+
+        counts = tuple(stop - start for start, stop in space)
+        out = np.zeros((len(steps),) + counts, dtype=self.dtype)
+        if 0 not in out.shape:
+            for i, step in enumerate(steps):
+                out[i] = self._read_window(step, space, counts)
+        if self._nsteps <= 1:
+            out = out[0]
+        return out[local]
+
+    def _read(self, step, offset, count):
+        """ Read a hyperslab of a single step """
+        if step is None:
+            data = self._dset.read(offset=offset, count=count)
+        else:
+            data = self._dset.read(offset=offset, count=count, from_steps=step, nsteps=1)
+        return np.asarray(data).reshape(count)
+
+    def _step_blocks(self, step):
+        """ List of (start, count) of the blocks written at *step*, or None if not available """
+        try:
+            info = self._dset.blockinfo[step or 0]
+            return [(tuple(int(x) for x in b.start), tuple(int(x) for x in b.count)) for b in info]
+        except (AttributeError, IndexError, TypeError):
+            return None
+
+    def _read_window(self, step, space, counts):
+        """ Assemble a window of a single step from the overlapping blocks
+
+        Blocks are read whole, and cached, unless they are too large for the cache: then only their
+        intersection with the window is read.
+        """
+        blocks = self._step_blocks(step)
+        if blocks is None:
+            return self._read(step, tuple(start for start, _ in space), counts)
+
+        out = np.zeros(counts, dtype=self.dtype)
+        for b_start, b_count in blocks:
+            lo = [max(start, bs) for (start, _), bs in zip(space, b_start)]
+            hi = [min(stop, bs + bc) for (_, stop), bs, bc in zip(space, b_start, b_count)]
+            if any(l >= h for l, h in zip(lo, hi)):
+                continue
+            target = tuple(slice(l - start, h - start) for l, h, (start, _) in zip(lo, hi, space))
+
+            nbytes = int(np.prod(b_count, dtype=np.int64)) * self.dtype.itemsize
+            if not self._store.blocks.can_hold(nbytes):
+                out[target] = self._read(step, tuple(lo), tuple(h - l for l, h in zip(lo, hi)))
+                continue
+
+            key = (self._key, step, b_start)
+            block = self._store.blocks.get(key)
+            compass_model.instrument.record_cache(self._store, self._key, 'blocks', block is not None)
+            if block is None:
+                block = self._read(step, b_start, b_count)
+                self._store.blocks.put(key, block)
+
+            out[target] = block[tuple(slice(l - bs, h - bs) for l, h, bs in zip(lo, hi, b_start))]
+        return out
 
     def is_plottable(self):
         if self.dtype.kind == 'S':
@@ -245,27 +445,27 @@ class ADIOSDataset(compass_model.Array):
             return False
         return True
 
-class ADIOSText(compass_model.Text):
+class ADIOSText(compass_model.StringArrayText):
     """ Represents a text array (both ASCII and UNICODE). """
 
     class_kind = "ADIOS Dataset[text]"
 
     @staticmethod
     def can_handle(store, key):
-        key = key.encode("ascii")
-        if(key in store and isinstance(store.f[key], adios.var)):
-            if store.f[key].dtype.kind == 'S':
-                log.debug("ASCII String (characters: %d)" % DATA[key].dtype.itemsize)
+        if key in store and store.index.variable(key) is not None:
+            var = store.f.var[store.index.variable(key)]
+            if var.dtype.kind == 'S':
+                log.debug("ASCII String (characters: %d)" % var.dtype.itemsize)
                 return True
-            if store.f[key].dtype.kind == 'U':
-                log.debug("Unicode String (characters: %d)" % DATA[key].dtype.itemsize)
+            if var.dtype.kind == 'U':
+                log.debug("Unicode String (characters: %d)" % var.dtype.itemsize)
                 return True
         return False
 
     def __init__(self, store, key):
         self._store = store
         self._key = key
-        self.data = store.f[key.encode("ascii")]
+        self.data = store.f.var[store.index.variable(key)]
 
     @property
     def key(self):
@@ -284,8 +484,8 @@ class ADIOSText(compass_model.Text):
         return 'Text "%s"' % (self.display_name,)
 
     @property
-    def text(self):
-        return self.data[()];
+    def shape(self):
+        return tuple(self.data.dims)
 
 class ADIOSKV(compass_model.KeyValue):
     """ A KeyValue node used for ADIOS attributes. """
@@ -15,12 +15,33 @@ from __future__ import absolute_import, division, print_function
 
 from hdf_compass.compass_model.test import container, store
 from hdf_compass.adios_model import ADIOSGroup, ADIOSStore
+from hdf_compass.adios_model.model import window
 from hdf_compass.utils import data_url
 
 import os
+import unittest as ut
+
+import numpy as np
 
 url = os.path.join(data_url(), "adios", "adios_test.bp")
 
 s = store(ADIOSStore, url)
 c = container(ADIOSStore, url, ADIOSGroup, "")
 
+
+class TestWindow(ut.TestCase):
+    """ Split of an index into the window read and the local index """
+
+    def test_slices(self):
+        self.assertEqual(window((1, slice(2, 8, 3)), (4, 10)), ([(1, 2), (2, 8)], (0, slice(None, None, 3))))
+        self.assertEqual(window((Ellipsis, 2), (4, 5, 6)),
+                         ([(0, 4), (0, 5), (2, 3)], (slice(None, None, 1), slice(None, None, 1), 0)))
+
+    def test_array_index(self):
+        """ Array indices are applied locally to the whole dimension """
+        rows = np.array([0, 2])
+        win, local = window((rows, slice(None)), (4, 5))
+        self.assertEqual(win, [(0, 4), (0, 5)])
+        self.assertIs(local[0], rows)
+        win, local = window((rows, Ellipsis), (4, 5))
+        self.assertEqual(win, [(0, 4), (0, 5)])
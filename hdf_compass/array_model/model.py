@@ -203,7 +203,7 @@ class Array(compass_model.Array):
         return True
 
 
-class ArrayText(compass_model.Text):
+class ArrayText(compass_model.StringArrayText):
     """ Represents a text array (both ASCII and UNICODE). """
 
     class_kind = "TestArray [text]"
@@ -246,29 +246,6 @@ class ArrayText(compass_model.Text):
     def shape(self):
         return self.data.shape
 
-    @property
-    def text(self):
-        txt = str()
-
-        if len(self.shape) == 0:
-            print(self.data)
-            txt += str(self.data)
-
-        elif len(self.shape) == 1:
-            for el in self.data:
-                txt += el + ",\n"
-
-        elif len(self.shape) == 2:
-            for i in range(self.shape[0]):
-                for j in range(self.shape[1]):
-                    txt += self.data[i, j] + ", "
-                txt += "\n"
-
-        else:
-            txt = ">> display of more than 2D string array not implemented <<"
-
-        return txt
-
 
 class ArrayKV(compass_model.KeyValue):
     class_kind = "Array Key/Value Attrs"
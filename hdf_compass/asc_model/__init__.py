@@ -11,7 +11,7 @@
 ##############################################################################
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from .model import AsciiGrid, ASCFile, Attributes
+from .model import AsciiGrid, ASCFile, ASCGeoArray, Attributes
 
 import logging
 log = logging.getLogger(__name__)
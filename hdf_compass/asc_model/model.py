@@ -20,7 +20,7 @@ the file format
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import os.path as op
-import linecache
+from collections import OrderedDict
 
 import numpy as np
 
@@ -28,7 +28,246 @@ import logging
 log = logging.getLogger(__name__)
 
 from hdf_compass import compass_model
-from hdf_compass.utils import url2path
+from hdf_compass.utils import url2path, sidecar_path, remove_stale_sidecars, replace_file, has_cartopy
+
+# Bytes read at once when indexing or parsing the data section
+CHUNK_SIZE = 16 * 1024 * 1024
+# Grids at least this large (in bytes) get a binary .npy copy in the cache folder, once parsed
+SIDECAR_MIN_SIZE = 8 * 1024 * 1024
+
+# Known header keywords, with the type of their values
+HEADER_KEYWORDS = {'ncols': int, 'nrows': int, 'xllcorner': float, 'yllcorner': float, 'xllcenter': float,
+                   'yllcenter': float, 'cellsize': float, 'dx': float, 'dy': float, 'nodata_value': float}
+
+def read_header(path):
+    """ Parse the header of an ASCII grid.
+
+    Returns an OrderedDict (lower-case keywords, in file order) and the byte offset where the data starts.
+    The header lines are recognized by a leading keyword, so their order does not matter.  Only ncols
+    and nrows are required; other keywords are kept as text.  Raises ValueError for an invalid header.
+    """
+    header = OrderedDict()
+    offset = 0
+    with open(path, 'rb') as fid:
+        for line in fid:
+            tokens = line.split()
+            if len(tokens) > 0 and not tokens[0][:1].isalpha():
+                break
+            offset += len(line)
+            if len(tokens) == 0:
+                continue
+            keyword = tokens[0].decode('ascii', 'replace').lower()
+            convert = HEADER_KEYWORDS.get(keyword)
+            if convert is None:
+                header[keyword] = b' '.join(tokens[1:]).decode('ascii', 'replace')
+                continue
+            if len(tokens) != 2:
+                raise ValueError("invalid header line in %s: %r" % (path, line[:80]))
+            header[keyword] = convert(tokens[1])
+
+    for keyword in ('ncols', 'nrows'):
+        if keyword not in header:
+            raise ValueError("missing %s in %s" % (keyword, path))
+    return header, offset
+
+
+def grid_extent(header):
+    """ Extent of the grid cells as a tuple: (x_min, x_max, y_min, y_max)
+
+    The origin may be given as the lower-left corner, or as the center of the lower-left cell.
+    """
+    dx = header.get('dx', header.get('cellsize', 1.0))
+    dy = header.get('dy', header.get('cellsize', 1.0))
+    if 'xllcenter' in header:
+        x_min = header['xllcenter'] - dx / 2.0
+    else:
+        x_min = header.get('xllcorner', 0.0)
+    if 'yllcenter' in header:
+        y_min = header['yllcenter'] - dy / 2.0
+    else:
+        y_min = header.get('yllcorner', 0.0)
+    return x_min, x_min + header['ncols'] * dx, y_min, y_min + header['nrows'] * dy
+
+
+class ASCReader(object):
+    """ Streaming reader for the data section of an ASCII grid.
+
+    Windows of rows are parsed on demand, using an index of the row offsets
+    built (on first access) with a single vectorized pass over the file.
+    Once the whole grid is parsed, large grids are saved as .npy in the cache
+    folder and memory-mapped by later opens of the same (unmodified) file.
+    """
+
+    def __init__(self, path, header, data_offset):
+        self.path = path
+        self.header = header
+        self.nrows = header['nrows']
+        self.ncols = header['ncols']
+        self.nodata = header.get('nodata_value')
+        self._data_offset = data_offset
+        self._offsets = None
+        self._indexed = False
+        self._data = None
+
+        sidecar = self._sidecar_path()
+        if sidecar is not None and op.exists(sidecar):
+            try:
+                self._data = np.load(sidecar, mmap_mode='r')
+                log.debug("memory-mapped %s" % sidecar)
+            except (IOError, ValueError) as e:
+                log.info("unable to load %s: %s" % (sidecar, e))
+
+    @property
+    def data(self):
+        """ The whole grid, or None if not (yet) parsed """
+        return self._data
+
+    def _sidecar_path(self):
+        """ Path of the .npy copy (see utils.sidecar_path), or None """
+        return sidecar_path('asc', self.path, 'npy')
+
+    def _write_sidecar(self):
+        sidecar = self._sidecar_path()
+        if sidecar is None:
+            return
+        remove_stale_sidecars(sidecar)
+        tmp = sidecar + '.tmp'
+        try:
+            with open(tmp, 'wb') as fod:
+                np.save(fod, self._data)
+            replace_file(tmp, sidecar)
+            log.debug("saved %s" % sidecar)
+        except (IOError, OSError) as e:
+            log.info("unable to save %s: %s" % (sidecar, e))
+
+    def _index(self):
+        """ Build the row offsets, if each row of the grid is on a single line """
+        self._indexed = True
+        size = op.getsize(self.path)
+        starts = [np.array([self._data_offset], dtype=np.int64)]
+        with open(self.path, 'rb') as fid:
+            fid.seek(self._data_offset)
+            pos = self._data_offset
+            while True:
+                chunk = fid.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                starts.append(np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10) + pos + 1)
+                pos += len(chunk)
+        offsets = np.concatenate(starts)
+        if offsets[-1] < size:  # no newline at the end of the last line
+            offsets = np.append(offsets, size)
+
+        if len(offsets) < self.nrows + 1:
+            log.debug("%s: rows span multiple lines, no row index" % self.path)
+            return
+        if size - offsets[self.nrows] > 1024:  # more than some trailing blank lines
+            log.debug("%s: rows span multiple lines, no row index" % self.path)
+            return
+        self._offsets = offsets[:self.nrows + 1]
+        if self.nrows > 0 and self._parse(self._offsets[0], self._offsets[1]).size != self.ncols:
+            log.debug("%s: rows span multiple lines, no row index" % self.path)
+            self._offsets = None
+
+    def _parse(self, start, stop):
+        """ Parse the values between two byte offsets """
+        with open(self.path, 'rb') as fid:
+            fid.seek(start)
+            return np.fromstring(fid.read(stop - start), dtype=np.float64, sep=' ')
+
+    def read_rows(self, start, stop):
+        """ Return the rows in [start, stop) as a 2D array """
+        if self._data is not None:
+            return self._data[start:stop]
+        if start <= 0 and stop >= self.nrows:  # whole grid: also saves the .npy copy
+            return self.load()
+        if not self._indexed:
+            self._index()
+        if self._offsets is None:
+            return self.load()[start:stop]
+
+        start = max(0, min(start, self.nrows))
+        stop = max(start, min(stop, self.nrows))
+        values = self._parse(self._offsets[start], self._offsets[stop])
+        if values.size != (stop - start) * self.ncols:
+            raise ValueError("%s: invalid data in rows %d-%d" % (self.path, start, stop))
+        return values.reshape((stop - start, self.ncols))
+
+    def mask(self, values):
+        """ Return a copy of *values* with the NODATA values replaced by NaN """
+        if self.nodata is None:
+            return values
+        values = np.array(values, dtype=np.float64)
+        values[values == self.nodata] = np.nan
+        return values[()] if values.ndim == 0 else values
+
+    def read(self, args, flip=False):
+        """ Data access, with NODATA as NaN.
+
+        Only the rows selected by the first index are parsed (unless the grid is in memory).
+        With *flip*, rows are counted from the last one (see ASCGeoArray).
+        """
+        if not isinstance(args, tuple):
+            args = (args,)
+        if self._data is not None or len(args) == 0 or any(a is Ellipsis for a in args):
+            data = self.load()
+            return self.mask((data[::-1] if flip else data)[args])
+
+        first, rest = args[0], args[1:]
+        if isinstance(first, (int, np.integer)):
+            idx = first + self.nrows if first < 0 else first
+            if not 0 <= idx < self.nrows:
+                raise IndexError("row index %d out of range" % first)
+            if flip:
+                idx = self.nrows - 1 - idx
+            return self.mask(self.read_rows(idx, idx + 1)[0][rest])
+
+        if isinstance(first, slice):
+            start, stop, step = first.indices(self.nrows)
+            if step > 0:
+                stop = max(start, stop)
+                if flip:
+                    rows = self.read_rows(self.nrows - stop, self.nrows - start)[::-1]
+                else:
+                    rows = self.read_rows(start, stop)
+                return self.mask(rows[::step][(slice(None),) + rest])
+
+        data = self.load()
+        return self.mask((data[::-1] if flip else data)[args])
+
+    def load(self):
+        """ Parse the whole grid, block by block """
+        if self._data is not None:
+            return self._data
+
+        data = np.empty(self.nrows * self.ncols, dtype=np.float64)
+        count = 0
+        rest = b''
+        with open(self.path, 'rb') as fid:
+            fid.seek(self._data_offset)
+            while True:
+                chunk = fid.read(CHUNK_SIZE)
+                if not chunk:
+                    block, rest = rest, b''
+                else:
+                    # only parse up to the last separator, a value may continue in the next chunk
+                    block = rest + chunk
+                    cut = max(block.rfind(b' '), block.rfind(b'\n'), block.rfind(b'\t')) + 1
+                    block, rest = block[:cut], block[cut:]
+                values = np.fromstring(block, dtype=np.float64, sep=' ')
+                if count + values.size > data.size:
+                    raise ValueError("%s: more values than %d x %d" % (self.path, self.nrows, self.ncols))
+                data[count:count + values.size] = values
+                count += values.size
+                if not chunk:
+                    break
+        if count != data.size:
+            raise ValueError("%s: %d values instead of %d x %d" % (self.path, count, self.nrows, self.ncols))
+
+        self._data = data.reshape((self.nrows, self.ncols))
+        if op.getsize(self.path) >= SIDECAR_MIN_SIZE:
+            self._write_sidecar()
+        return self._data
 
 
 class AsciiGrid(compass_model.Store):
@@ -74,9 +313,10 @@ class AsciiGrid(compass_model.Store):
             log.debug("able to handle %s? no, missing .asc extension" % url)
             return False
 
-        first_line = open(url2path(url)).readline()
-        if first_line.split()[0].upper() != "NCOLS":
-            log.debug("able to handle %s? no, invalid first line" % url)
+        try:
+            read_header(url2path(url))
+        except (IOError, ValueError) as e:
+            log.debug("able to handle %s? no, invalid header: %s" % (url, e))
             return False
 
         log.debug("able to handle %s? yes" % url)
@@ -87,6 +327,8 @@ class AsciiGrid(compass_model.Store):
             raise ValueError(url)
         self._url = url
         self._valid = True
+        self._header, self._data_offset = read_header(self.getFilePath())
+        self._reader = None
 
     def close(self):
         self._valid = False
@@ -97,6 +339,18 @@ class AsciiGrid(compass_model.Store):
     def getFilePath(self):
         return url2path(self._url)
 
+    @property
+    def header(self):
+        """ Header values, see read_header() """
+        return self._header
+
+    @property
+    def reader(self):
+        """ ASCReader for the grid, shared by the nodes """
+        if self._reader is None:
+            self._reader = ASCReader(self.getFilePath(), self._header, self._data_offset)
+        return self._reader
+
 
 class ASCFile(compass_model.Array):
     """ Represents a .asc grid file. """
@@ -112,10 +366,7 @@ class ASCFile(compass_model.Array):
     def __init__(self, store, key):
         self._store = store
         self._key = key
-        file_path = self._store.getFilePath()
-        self._nrows = int(linecache.getline(file_path, 1).lstrip("ncols"))
-        self._ncols = int(linecache.getline(file_path, 2).lstrip("nrows"))
-        self._data = None
+        self._reader = store.reader
 
     @property
     def key(self):
@@ -131,20 +382,71 @@ class ASCFile(compass_model.Array):
 
     @property
     def description(self):
-        return 'File "%s", size %d bytes' % (self.display_name, op.getsize(self.key))
+        return 'File "%s", size %d bytes' % (self.display_name, op.getsize(self._store.getFilePath()))
 
     @property
     def shape(self):
-        return self._nrows, self._ncols
+        return self._reader.nrows, self._reader.ncols
 
     @property
     def dtype(self):
         return np.dtype('float')
 
     def __getitem__(self, args):
-        if self._data is None:
-            self._data = np.loadtxt(self._store.getFilePath(), skiprows=6, unpack=True)
-        return self._data[args]
+        return self._reader.read(args)
+
+
+class ASCGeoArray(compass_model.GeoArray):
+    """ Represents a .asc grid with geographic (longitude, latitude) coordinates.
+
+    The rows are flipped, so that the first row is the southernmost (as for BAG).
+    """
+
+    class_kind = "ASCII Grid File [geo array]"
+
+    @staticmethod
+    def can_handle(store, key):
+        if key != '/' or not has_cartopy():
+            return False
+        x_min, x_max, y_min, y_max = grid_extent(store.header)
+        return (-180.0 <= x_min <= x_max <= 360.0) and (-90.0 <= y_min <= y_max <= 90.0)
+
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+        self._reader = store.reader
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def display_name(self):
+        return self._store.display_name
+
+    @property
+    def description(self):
+        return 'File "%s", size %d bytes' % (self.display_name, op.getsize(self._store.getFilePath()))
+
+    @property
+    def shape(self):
+        return self._reader.nrows, self._reader.ncols
+
+    @property
+    def dtype(self):
+        return np.dtype('float')
+
+    @property
+    def extent(self):
+        """ Geographic extent as a tuple: (lon_min, lon_max, lat_min, lat_max) """
+        return grid_extent(self._store.header)
+
+    def __getitem__(self, args):
+        return self._reader.read(args, flip=True)
 
 
 class Attributes(compass_model.KeyValue):
@@ -159,11 +461,7 @@ class Attributes(compass_model.KeyValue):
     def __init__(self, store, key):
         self._store = store
         self._key = key
-        file_path = self._store.getFilePath()
-        self.data = {'NODATA Value': float(linecache.getline(file_path, 6).lstrip("NODATA_value")),
-                     'cellsize': float(linecache.getline(file_path, 5).lstrip("cellsize")),
-                     'yllcorner': float(linecache.getline(file_path, 4).lstrip("yllcorner")),
-                     'xllcorner': float(linecache.getline(file_path, 3).lstrip("xllcorner"))}
+        self.data = store.header
 
     @property
     def key(self):
@@ -186,7 +484,7 @@ class Attributes(compass_model.KeyValue):
 
     @property
     def keys(self):
-        return self.data.keys()
+        return list(self.data.keys())
 
     def __getitem__(self, args):
         return self.data[args]
@@ -194,5 +492,6 @@ class Attributes(compass_model.KeyValue):
 
 AsciiGrid.push(Attributes)  # attribute data
 AsciiGrid.push(ASCFile)  # array
+AsciiGrid.push(ASCGeoArray)  # geo array (if the coordinates are geographic)
 
 compass_model.push(AsciiGrid)
@@ -12,11 +12,90 @@
 from __future__ import absolute_import, division, print_function
 
 import os
+import shutil
+import tempfile
+import unittest as ut
+
+import numpy as np
 
 from hdf_compass.compass_model.test import store
-from hdf_compass.asc_model import AsciiGrid
+from hdf_compass.asc_model import AsciiGrid, ASCFile, ASCGeoArray
+from hdf_compass.asc_model.model import read_header
 from hdf_compass.utils import data_url
 
 url = os.path.join(data_url(), "asc", "sample.asc")
 
 s = store(AsciiGrid, url)
+
+
+class TestASCFile(ut.TestCase):
+    """ The grid is read in file order (one row per line), with NODATA as NaN """
+
+    def setUp(self):
+        self.store = AsciiGrid(url)
+        self.node = ASCFile(self.store, '/')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_shape(self):
+        self.assertEqual(self.node.shape, (6, 4))
+
+    def test_rows(self):
+        np.testing.assert_array_equal(self.node[1], [np.nan, 20, 100, 36])
+        np.testing.assert_array_equal(self.node[2:4, 1:3], [[8, 35], [42, 50]])
+        np.testing.assert_array_equal(self.node[:, :][5], [13, 5, 1, np.nan])
+
+    def test_fancy_index(self):
+        """ Array indices work on a grid not parsed yet """
+        np.testing.assert_array_equal(self.node[np.array([1, 5])], [[np.nan, 20, 100, 36], [13, 5, 1, np.nan]])
+        fresh = AsciiGrid(url)
+        rows = np.zeros(6, dtype=bool)
+        rows[2] = True
+        np.testing.assert_array_equal(ASCGeoArray(fresh, '/')[rows], [[32, 42, 50, 6]])
+        fresh.close()
+
+    def test_geo_array(self):
+        """ The geographic view has the southernmost row first """
+        node = ASCGeoArray(self.store, '/')
+        self.assertEqual(node.extent, (0.0, 200.0, 0.0, 300.0))
+        np.testing.assert_array_equal(node[0], [13, 5, 1, np.nan])
+        np.testing.assert_array_equal(node[0:2, 0], [13, 88])
+
+    def test_geo_array_flip(self):
+        """ Every selection of the geographic view is the flipped grid """
+        node = ASCGeoArray(self.store, '/')
+        full = AsciiGrid(url)
+        grid = ASCFile(full, '/')[:, :][::-1]
+        full.close()
+        for args in [(-1,), (slice(1, 5, 2),), (slice(4, 1, -1),), (slice(None), 2), (Ellipsis, 1),
+                     (np.array([0, 3]),)]:
+            np.testing.assert_array_equal(node[args], grid[args])
+
+
+class TestHeader(ut.TestCase):
+    """ Headers may hold optional lines, in any order """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_optional_lines(self):
+        lines = ["ncols 2", "nrows 1", "xllcorner 0", "yllcorner 0", "cellsize 1", "dx 1", "dy 1",
+                 "nodata_value -9999", "xllcenter 0.5", "yllcenter 0.5", "byteorder LSBFIRST",
+                 "projection Transverse Mercator", "1 2"]
+        path = os.path.join(self.folder, "optional.asc")
+        with open(path, 'w') as fod:
+            fod.write("\n".join(lines) + "\n")
+        header, offset = read_header(path)
+        self.assertEqual(header['ncols'], 2)
+        self.assertEqual(header['projection'], "Transverse Mercator")
+        self.assertEqual(offset, os.path.getsize(path) - len("1 2\n"))
+
+    def test_missing_keyword(self):
+        path = os.path.join(self.folder, "invalid.asc")
+        with open(path, 'w') as fod:
+            fod.write("ncols 2\ncellsize 1\n1 2\n")
+        self.assertRaises(ValueError, read_header, path)
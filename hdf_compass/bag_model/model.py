@@ -25,12 +25,28 @@ from hydroffice.bag import BAGFile
 from hydroffice.bag import BAGError
 
 from hdf_compass import compass_model
-from hdf_compass.utils import url2path
+from hdf_compass.utils import url2path, has_cartopy
 
 import logging
 log = logging.getLogger(__name__)
 
 
+# Results of the probes for the optional dependencies of the geographic surface view
+_probes = {}
+
+
+def has_geo_surface():
+    """ Check (only once) whether the geographic surface view is usable.
+
+    Besides cartopy, it needs a matplotlib function present after 1.5.x.
+    """
+    if 'surface' not in _probes:
+        import matplotlib
+        plt_maj, plt_min = matplotlib.__version__.split('.')[:2]
+        _probes['surface'] = has_cartopy() and not ((int(plt_maj) == 1) and (int(plt_min) < 5))
+    return _probes['surface']
+
+
 def sort_key(name):
     """ Sorting key for names in an BAG group.
 
@@ -333,12 +349,8 @@ class BAGElevationGeoArray(compass_model.GeoArray):
 
     @staticmethod
     def can_handle(store, key):
-        # for GeoSurface we use cartopy that can be challenging to freeze on OSX to dependencies (i.e. geos)
-        try:
-            import cartopy.crs as ccrs
-        except (ImportError, OSError):
-            return False
-        return (key == "/BAG_root/elevation") and (key in store) and (isinstance(store.f[key], h5py.Dataset))
+        return (key == "/BAG_root/elevation") and has_cartopy() and (key in store) and \
+            (isinstance(store.f[key], h5py.Dataset))
 
     def __init__(self, store, key):
         self._store = store
@@ -385,17 +397,8 @@ class BAGElevation(compass_model.GeoSurface):
 
     @staticmethod
     def can_handle(store, key):
-        # for GeoSurface we use cartopy that can be challenging to freeze on OSX to dependencies (i.e. geos)
-        try:
-            import cartopy.crs as ccrs
-        except (ImportError, OSError):
-            return False
-        # for GeoSurface we are using a matplotlib function present after 1.5.x
-        import matplotlib
-        plt_maj, plt_min, _ = matplotlib.__version__.split('.')
-        if (int(plt_maj) == 1) and (int(plt_min) < 5):
-            return False
-        return (key == "/BAG_root/elevation") and (key in store) and (isinstance(store.f[key], h5py.Dataset))
+        return (key == "/BAG_root/elevation") and has_geo_surface() and (key in store) and \
+            (isinstance(store.f[key], h5py.Dataset))
 
     def __init__(self, store, key):
         self._store = store
@@ -702,12 +705,8 @@ class BAGUncertainty(compass_model.GeoArray):
 
     @staticmethod
     def can_handle(store, key):
-        # for GeoSurface we use cartopy that can be challenging to freeze on OSX to dependencies (i.e. geos)
-        try:
-            import cartopy.crs as ccrs
-        except (ImportError, OSError):
-            return False
-        return (key == "/BAG_root/uncertainty") and (key in store) and (isinstance(store.f[key], h5py.Dataset))
+        return (key == "/BAG_root/uncertainty") and has_cartopy() and (key in store) and \
+            (isinstance(store.f[key], h5py.Dataset))
 
     def __init__(self, store, key):
         self._store = store
@@ -844,6 +843,9 @@ class BAGImage(compass_model.Image):
     def data(self):
         return self._obj[:]
 
+    def region(self, rows, cols):
+        return self._obj[rows, cols]
+
 
 # Register handlers
 BAGStore.push(BAGKV)
@@ -11,8 +11,11 @@
 ##############################################################################
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from .model import get_stores, push, Store, Node, Container, KeyValue, \
-    GeoArray, GeoSurface, Array, Text, Xml, Image, Unknown
+from . import instrument, stats
+from .model import get_stores, push, shared_store, forget_store, resource_id, \
+    Plugin, register_plugin, get_plugins, load_plugins, stores_for, get_file_extensions, \
+    decode_strings, string_array_lines, Store, Node, Container, KeyValue, GeoArray, GeoSurface, Array, Text, \
+    StringArrayText, Xml, Image, Unknown
 
 import logging
 log = logging.getLogger(__name__)
@@ -0,0 +1,161 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of the HDF Compass Viewer. The full HDF Compass          #
+# copyright notice, including terms governing use, modification, and         #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+
+"""
+Optional I/O instrumentation for data stores.
+
+When enabled, calls to the entry points of the data model are counted and
+timed, per store and per node:
+
+- "open":   Store.__getitem__ (creating a Node instance)
+- "probe":  Store.gethandlers (asking every handler's can_handle)
+- "read":   __getitem__ of Array-like nodes (bytes read are counted too)
+- "attr":   __getitem__ of KeyValue nodes
+- "child":  __getitem__ of Container nodes
+
+Caches report hits and misses through record_cache().  Instrumentation is
+disabled by default, and costs a flag test per call when disabled.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import functools
+import json
+import threading
+import time
+
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Upper bounds (in ms) of the latency histogram bins; the last bin is open
+BINS_MS = (0.1, 1.0, 10.0, 100.0, 1000.0)
+
+_enabled = False
+_lock = threading.Lock()
+_stats = {}  # (store url, node key, operation) -> OpStats
+
+
+class OpStats(object):
+    """ Counters for a single (store, node, operation) triple. """
+
+    def __init__(self):
+        self.calls = 0
+        self.nbytes = 0
+        self.seconds = 0.0
+        self.histogram = [0] * (len(BINS_MS) + 1)
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, seconds, nbytes):
+        self.calls += 1
+        self.nbytes += nbytes
+        self.seconds += seconds
+        ms = seconds * 1000.0
+        idx = 0
+        while idx < len(BINS_MS) and ms > BINS_MS[idx]:
+            idx += 1
+        self.histogram[idx] += 1
+
+    @property
+    def hit_ratio(self):
+        """ Fraction of cache hits, or None if this is not a cache. """
+        total = self.hits + self.misses
+        if total == 0:
+            return None
+        return self.hits / total
+
+
+def enable(flag=True):
+    """ Turn the instrumentation on (or off, with flag=False). """
+    global _enabled
+    _enabled = flag
+    log.debug("I/O instrumentation %s" % ("enabled" if flag else "disabled"))
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """ Forget all the collected statistics. """
+    with _lock:
+        _stats.clear()
+
+
+def _entry(store, key, op):
+    url = getattr(store, 'url', None) if store is not None else None
+    k = (url, key if key is None else "%s" % (key,), op)
+    s = _stats.get(k)
+    if s is None:
+        s = _stats[k] = OpStats()
+    return s
+
+
+def record(store, key, op, seconds, nbytes=0):
+    """ Record a call of *op* on node *key* of *store*, lasting *seconds*. """
+    if not _enabled:
+        return
+    with _lock:
+        _entry(store, key, op).add(seconds, nbytes)
+
+
+def record_cache(store, key, cache, hit):
+    """ Record a hit (or miss) of the cache named *cache*. """
+    if not _enabled:
+        return
+    with _lock:
+        s = _entry(store, key, "cache:%s" % cache)
+        if hit:
+            s.hits += 1
+        else:
+            s.misses += 1
+
+
+def wrap(cls, op):
+    """ Instrument the __getitem__ method defined by the Node subclass *cls*.
+
+    Inherited (already instrumented) methods are left alone.
+    """
+    func = cls.__dict__.get('__getitem__')
+    if func is None or getattr(func, '_instrumented', False):
+        return
+
+    @functools.wraps(func)
+    def wrapper(self, args):
+        if not _enabled:
+            return func(self, args)
+        t0 = time.time()
+        out = func(self, args)
+        record(getattr(self, 'store', None), getattr(self, 'key', None), op, time.time() - t0,
+               getattr(out, 'nbytes', 0))
+        return out
+
+    wrapper._instrumented = True
+    setattr(cls, '__getitem__', wrapper)
+
+
+def get_stats():
+    """ Return a list of dicts with a snapshot of the statistics. """
+    rows = []
+    with _lock:
+        for (url, key, op), s in sorted(_stats.items(), key=lambda x: tuple("%s" % i for i in x[0])):
+            rows.append({'store': url, 'key': key, 'op': op,
+                         'calls': s.calls, 'bytes': s.nbytes, 'seconds': s.seconds,
+                         'histogram': s.histogram[:], 'hits': s.hits, 'misses': s.misses,
+                         'hit_ratio': s.hit_ratio})
+    return rows
+
+
+def export(path):
+    """ Save the statistics as JSON, for offline analysis. """
+    with open(path, 'w') as fod:
+        json.dump({'bins_ms': BINS_MS, 'stats': get_stats()}, fod, indent=2)
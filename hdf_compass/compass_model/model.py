@@ -71,14 +71,29 @@ person's Store to make your new class useful.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from abc import ABCMeta, abstractmethod, abstractproperty
+from fnmatch import fnmatch
+import importlib
 import os
+import sys
+import time
 import logging
 
+import numpy as np
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
+from hdf_compass.utils import url2path
+from . import instrument
+
 _stores = []
 
+# Plugin manifests, in registration order (see register_plugin)
+_plugins = []
+
+# Open Store instances, keyed by (store class, resource identity)
+_open_stores = {}
+
 
 def push(store):
     """ Register a new data store class """
@@ -90,6 +105,208 @@ def get_stores():
     return _stores[:]
 
 
+class Plugin(object):
+    """
+    Manifest describing a plugin, which can be registered without importing it.
+
+    The manifest holds just enough information to decide whether the plugin
+    may be able to open a resource: URL schemes, file extensions and the magic
+    bytes found at the start of the file (or at some other known offsets).  The plugin module (and its possibly
+    heavy dependencies) is imported the first time it is actually needed, by
+    calling load().
+    """
+
+    def __init__(self, name, module, store, file_extensions=None, schemes=('file',), magic=(), magic_offsets=(0,),
+                 requires=()):
+        """ Describe a new plugin.
+
+        name:               Short name, used for logging.
+        module:             Full name of the module implementing the plugin.
+        store:              Name of the Store subclass defined in *module*.
+        file_extensions:    Dict like Store.file_extensions, for open dialogs.
+        schemes:            URL schemes the plugin understands.
+        magic:              Byte strings, one of which starts every local file
+                            the plugin can open.  Files matching one of the
+                            file extensions are accepted as well.
+        magic_offsets:      Offsets at which the magic bytes are looked for
+                            (e.g. after the user block of an HDF5 file).
+        requires:           Third-party modules whose versions are logged once
+                            the plugin is loaded.
+        """
+        self.name = name
+        self.module = module
+        self.store = store
+        self.file_extensions = file_extensions if file_extensions is not None else {}
+        self.schemes = tuple(schemes)
+        self.magic = tuple(magic)
+        self.magic_offsets = tuple(magic_offsets)
+        self.requires = tuple(requires)
+        self._store_cls = None
+        self._failed = False
+
+    @property
+    def loaded(self):
+        """ True if the plugin module has been imported successfully. """
+        return self._store_cls is not None
+
+    def matches(self, url):
+        """ Cheap test whether the plugin may be able to open *url*.
+
+        This never imports the plugin; a positive answer must still be
+        confirmed by the can_handle() method of the Store class.
+        """
+        scheme = url.split('://', 1)[0] if '://' in url else ''
+        if scheme not in self.schemes:
+            return False
+
+        patterns = [p for pats in self.file_extensions.values() for p in pats]
+        if scheme != 'file' or (len(patterns) == 0 and len(self.magic) == 0):
+            return True
+
+        path = url2path(url)
+        name = os.path.basename(path).lower()
+        if any(fnmatch(name, p.lower()) for p in patterns):
+            return True
+
+        if len(self.magic) > 0:
+            length = max(len(m) for m in self.magic)
+            try:
+                with open(path, 'rb') as fid:
+                    size = os.fstat(fid.fileno()).st_size
+                    for offset in self.magic_offsets:
+                        if offset >= size:
+                            continue
+                        fid.seek(offset)
+                        head = fid.read(length)
+                        if any(head.startswith(m) for m in self.magic):
+                            return True
+            except (IOError, OSError):
+                return False
+
+        return False
+
+    def load(self):
+        """ Import the plugin (once) and return its Store class, or None. """
+        if self._store_cls is not None or self._failed:
+            return self._store_cls
+
+        t0 = time.time()
+        try:
+            mod = importlib.import_module(self.module)
+            for dep in self.requires:
+                importlib.import_module(dep)
+        except (ImportError, OSError) as e:
+            log.warning("%s plugin: NOT loaded (%s)" % (self.name, e))
+            self._failed = True
+            return None
+        self._store_cls = getattr(mod, self.store)
+        log.debug("%s plugin: loaded in %.1f ms" % (self.name, (time.time() - t0) * 1000.0))
+
+        for dep in self.requires:
+            version = getattr(sys.modules[dep], '__version__', None)
+            if version is not None:
+                log.debug("%s %s" % (dep, version))
+
+        return self._store_cls
+
+
+def register_plugin(plugin):
+    """ Register a Plugin manifest.
+
+    As with push(), plugins registered later take precedence.
+    """
+    _plugins.append(plugin)
+
+
+def get_plugins():
+    """ Get a list containing the registered Plugin manifests """
+    return _plugins[:]
+
+
+def load_plugins():
+    """ Import all the registered plugins, e.g. to list their descriptions """
+    for plugin in _plugins:
+        plugin.load()
+
+
+def stores_for(url):
+    """ Return the Store classes which can open *url*, best match first.
+
+    Plugins whose manifest matches the url are imported on demand.  Store
+    classes pushed directly (without a manifest) are considered as well.
+    """
+    candidates = []
+    for plugin in reversed(_plugins):
+        if plugin.matches(url):
+            store_cls = plugin.load()
+            if store_cls is not None:
+                candidates.append(store_cls)
+
+    managed = [p._store_cls for p in _plugins if p.loaded]
+    candidates.extend(s for s in _stores if s not in managed)
+
+    return [s for s in candidates if s.can_handle(url)]
+
+
+def get_file_extensions():
+    """ Return a list of (file kind, patterns) tuples for open dialogs.
+
+    Extensions come from the plugin manifests (loaded or not) and from any
+    Store class pushed directly.
+    """
+    out = []
+    sources = [p.file_extensions for p in _plugins]
+    managed = [p._store_cls for p in _plugins if p.loaded]
+    sources.extend(s.file_extensions for s in _stores if s not in managed)
+    for exts in sources:
+        for kind in exts:
+            if kind not in [k for k, _ in out]:
+                out.append((kind, exts[kind]))
+    return out
+
+
+def resource_id(url):
+    """ Return a hashable identity for the resource at *url*.
+
+    Local files are identified by their canonical path, plus device, inode
+    and modification time (so a file rewritten on disk is not confused with
+    the old one).  Other URLs are identified by the URL itself.
+    """
+    url = url.strip()
+    if not url.startswith('file://'):
+        return url,
+    path = os.path.realpath(os.path.abspath(url2path(url)))
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path,
+    return path, st.st_dev, st.st_ino, st.st_mtime
+
+
+def shared_store(store_cls, url):
+    """ Return an open *store_cls* instance for *url*.
+
+    If the same resource is already open with the same store class, the
+    existing instance (with its caches and file handles) is handed back
+    instead of opening a new one.
+    """
+    key = (store_cls, resource_id(url))
+    store = _open_stores.get(key)
+    if store is not None and store.valid:
+        log.debug("reusing open store for %s" % url)
+        return store
+    store = store_cls(url)
+    _open_stores[key] = store
+    store.start_background_work()
+    return store
+
+
+def forget_store(store):
+    """ Drop *store* from the registry of shared stores (it is not closed). """
+    for key in [k for k, v in _open_stores.items() if v is store]:
+        del _open_stores[key]
+
+
 icon_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), 'icons'))
 
 
@@ -129,6 +346,19 @@ class Store(object):
             cls.__nodeclasses = [Unknown]
         cls.__nodeclasses.insert(0, nodeclass)
 
+        # the data access method is instrumented (no-op, unless instrument.enable() is called)
+        if issubclass(nodeclass, Container):
+            op = 'child'
+        elif issubclass(nodeclass, KeyValue):
+            op = 'attr'
+        else:
+            op = 'read'
+        for klass in nodeclass.__mro__:
+            if '__getitem__' in klass.__dict__:
+                if klass.__module__ != __name__:  # skip the abstract methods in this module
+                    instrument.wrap(klass, op)
+                break
+
     @abstractmethod
     def __contains__(self, key):
         """ Check if a key is valid. """
@@ -140,7 +370,10 @@ class Store(object):
         Figures out the appropriate Node subclass for the object identified by
         "key", creates an instance and returns it.
         """
-        return self.gethandlers(key)[0](self, key)
+        t0 = time.time()
+        node = self.gethandlers(key)[0](self, key)
+        instrument.record(self, key, 'open', time.time() - t0)
+        return node
 
     def gethandlers(self, key=None):
         """ Rather than picking a handler and returning the Node, return a
@@ -156,7 +389,10 @@ class Store(object):
         if key not in self:
             raise KeyError(key)
 
-        return [nc for nc in self.__nodeclasses if nc.can_handle(self, key)]
+        t0 = time.time()
+        handlers = [nc for nc in self.__nodeclasses if nc.can_handle(self, key)]
+        instrument.record(self, key, 'probe', time.time() - t0)
+        return handlers
 
     # End plugin support
     # -------------------------------------------------------------------------
@@ -221,6 +457,13 @@ class Store(object):
         """
         pass
 
+    def start_background_work(self):
+        """ Called once the store is kept open (see shared_store), unlike stores opened just to probe a resource.
+
+        Stores may start background threads here, e.g. to load their caches.
+        """
+        pass
+
     def get_parent(self, key):
         """ Return the parent node of the object identified by *key*.
 
@@ -230,6 +473,31 @@ class Store(object):
         """
         pass
 
+    def load_stats(self, key):
+        """ Statistics of the Array *key* saved by save_stats, as a dict, or None.
+
+        Stores should only return statistics still valid for the resource.
+        """
+        return None
+
+    def save_stats(self, key, stats):
+        """ Persist the statistics (a dict, see compass_model.stats) of the Array *key*, if supported. """
+        pass
+
+    @property
+    def can_search(self):
+        """ True if the store implements search() """
+        return False
+
+    def search(self, query, key):
+        """ Search the objects below the Container *key*, if supported.
+
+        Returns a Container holding the objects matching *query* (whose syntax
+        is defined by the store), or None if not supported.  Raises ValueError
+        for an invalid query, or if the search cannot be run.
+        """
+        return None
+
 
 class Node(object):
     """
@@ -360,6 +628,15 @@ class KeyValue(Node):
         """ Return the raw attribute value """
         raise NotImplementedError
 
+    def metadata(self):
+        """ Optional: describe all the attributes, without reading their values.
+
+        Returns a list of dicts with keys 'name', 'dtype' (NumPy dtype), 'shape'
+        (tuple) and 'size' (storage size in bytes), in the order of .keys; or
+        None if not supported.
+        """
+        return None
+
 
 class Array(Node):
     """
@@ -391,6 +668,29 @@ class Array(Node):
         """ To be overriden in case that there are cases in which the array is not plottable """
         return True
 
+    @property
+    def chunks(self):
+        """ Shape of the storage chunks (reads aligned to them are cheaper), or None """
+        return None
+
+    def read_fields(self, names, args=()):
+        """ Retrieve data elements of compound data, with only the fields *names*.
+
+        Returns a structured array.  Stores able to read a subset of the fields
+        should override this, so that unused fields are never read.
+        """
+        data = np.asarray(self[args])
+        return data[list(names)]
+
+    def scale(self, dim):
+        """ Coordinates along the dimension *dim*, or None if only indices are known.
+
+        Returns a (label, values) tuple, with *values* a 1D NumPy array as long
+        as the dimension.  Implementations should read the coordinates once,
+        as viewers ask for them to label each row and column.
+        """
+        return None
+
 
 class GeoArray(Node):
     """ Represents a NumPy-style regular, rectangular array with a known geographic extent. """
@@ -478,6 +778,17 @@ class Image(Node):
     def data(self):
         """ Image data """
 
+    def region(self, rows, cols):
+        """ Return the pixels of a region of the image.
+
+        rows, cols: slice objects (possibly with a step, to read a downsampled
+        region).  Returns a (h, w, 3) uint8 RGB array.
+
+        Nodes backed by large images should override this, so that viewers
+        never need the whole image.
+        """
+        return np.asarray(self.data)[rows, cols]
+
 
 class Text(Node):
     """ A text. """
@@ -491,6 +802,100 @@ class Text(Node):
     def text(self):
         """ Text data """
 
+    @property
+    def line_count(self):
+        """ Number of lines of text.
+
+        Nodes backed by large data should override this, along with lines(),
+        so that the viewer never needs the whole text.
+        """
+        return len(self.text.splitlines())
+
+    def lines(self, start=0, stop=None):
+        """ Yield the lines of text (without line terminators) in [start, stop) """
+        for line in self.text.splitlines()[start:stop]:
+            yield line
+
+
+# Rows of a string array read at once by string_array_lines
+LINE_CHUNK = 1000
+
+
+def decode_strings(data, encoding='utf-8'):
+    """ Decode a whole array of strings at once, into a unicode ('U') NumPy array.
+
+    Handles fixed-length byte strings ('S'), unicode ('U'), and the object
+    arrays returned for variable-length strings (e.g. by h5py).  Anything else
+    (including object arrays of non-strings) is returned unchanged.
+    """
+    data = np.asarray(data)
+    kind = data.dtype.kind
+    if kind == 'S':
+        return np.char.decode(data, encoding, 'replace')
+    if kind != 'O' or data.size == 0:
+        return data
+
+    flat = data.ravel()
+    if all(isinstance(x, bytes) for x in flat):
+        return np.char.decode(data.astype('S'), encoding, 'replace')
+    if all(isinstance(x, type(u'')) for x in flat):
+        return data.astype('U')
+    if all(isinstance(x, (bytes, type(u''))) for x in flat):
+        return np.array([x.decode(encoding, 'replace') if isinstance(x, bytes) else x for x in flat],
+                        dtype='U').reshape(data.shape)
+    return data
+
+
+def string_array_lines(data, shape, start=0, stop=None):
+    """ Yield the lines of text of a string array, reading LINE_CHUNK rows at a time.
+
+    Each row (or element, for 1D arrays) is a line, with every element followed
+    by ", ".  Scalars are a single line.  *data* is anything that can be sliced
+    along the first axis (NumPy arrays, h5py datasets, ...); each chunk is
+    decoded at once with decode_strings.
+    """
+    if len(shape) == 0:
+        if start == 0 and (stop is None or stop > 0):
+            yield "%s" % decode_strings(data[()])[()]
+        return
+    if len(shape) > 2:
+        if start == 0 and (stop is None or stop > 0):
+            yield ">> display of more than 2D string array not implemented <<"
+        return
+
+    start, stop, _ = slice(start, stop).indices(shape[0])
+    for chunk_start in range(start, stop, LINE_CHUNK):
+        chunk = decode_strings(data[chunk_start:min(chunk_start + LINE_CHUNK, stop)])
+        if len(shape) == 1:
+            for line in np.char.add(chunk.astype('U'), ", ").tolist():
+                yield line
+        else:
+            for row in chunk.tolist():
+                yield ", ".join(row) + ", "
+
+
+class StringArrayText(Text):
+    """ A text backed by a string array: each row (or element, for 1D arrays) is a line.
+
+    Subclasses provide *data* (sliceable along the first axis, see string_array_lines)
+    and *shape*; the lines are read on demand.
+    """
+
+    __metaclass__ = ABCMeta
+
+    @property
+    def line_count(self):
+        if len(self.shape) in (1, 2):
+            return self.shape[0]
+        return 1
+
+    def lines(self, start=0, stop=None):
+        return string_array_lines(self.data, self.shape, start, stop)
+
+    @property
+    def text(self):
+        return "\n".join(self.lines())
+
 
 class Xml(Text):
     """ A XML text. """
@@ -0,0 +1,279 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of the HDF Compass Viewer. The full HDF Compass          #
+# copyright notice, including terms governing use, modification, and         #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+
+"""
+Summary statistics of numeric Array nodes, computed by streaming.
+
+The array is read in blocks of whole chunks (see Array.chunks), so memory
+use is bounded whatever the array size.  Two passes are made:
+
+1. exact min, max, mean, standard deviation and NaN count;
+2. a histogram with BINS bins spanning [min, max].
+
+Statistics are computed on a background thread by a StatsTask, which reports
+its progress after every block.  Results are kept in memory per (store, key)
+until the store is closed, and handed to the store, which may persist them
+(see Store.save_stats).
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Number of bins of the histogram
+BINS = 64
+
+# Approximate number of elements read at once
+BLOCK_ELEMENTS = 4 * 1024 * 1024
+
+# Max number of finished statistics retained in memory
+MAX_CACHED = 256
+
+# Finished statistics, keyed by (store url, node key), least recently used first; see forget
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def as_numbers(block):
+    """ Flat array of the values of a block (booleans are counted as 0 and 1) """
+    block = np.asarray(block).ravel()
+    if block.dtype.kind == 'b':
+        block = block.astype(np.uint8)
+    return block
+
+
+class Stats(object):
+    """ Statistics of an array, possibly still being computed. """
+
+    def __init__(self, size=0):
+        self.size = size  # total number of elements
+        self.count = 0  # non-NaN elements
+        self.nan_count = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        self.m2 = 0.0  # sum of the squared deviations from the mean
+        self.histogram = None
+        self.bin_edges = None
+        self.done = False
+        self.error = None  # message, if the computation failed (done stays False)
+        self.progress = 0.0  # fraction of the work done (both passes)
+
+    @property
+    def std(self):
+        if self.count == 0:
+            return None
+        return float(np.sqrt(self.m2 / self.count))
+
+    def add(self, block):
+        """ First pass: merge the statistics of a block of values """
+        block = as_numbers(block)
+        if block.dtype.kind == 'f':
+            nans = np.isnan(block)
+            nan_count = int(np.count_nonzero(nans))
+            if nan_count > 0:
+                self.nan_count += nan_count
+                block = block[~nans]
+        if block.size == 0:
+            return
+
+        b_min, b_max = block.min().item(), block.max().item()
+        self.min = b_min if self.min is None else min(self.min, b_min)
+        self.max = b_max if self.max is None else max(self.max, b_max)
+
+        # Chan et al. parallel update of the mean and of the squared deviations
+        n = block.size
+        b_mean = float(block.mean(dtype=np.float64))
+        b_m2 = float(np.square(block - b_mean, dtype=np.float64).sum())
+        if self.count == 0:
+            self.mean, self.m2 = b_mean, b_m2
+        else:
+            total = self.count + n
+            delta = b_mean - self.mean
+            self.mean += delta * n / total
+            self.m2 += b_m2 + delta * delta * self.count * n / total
+        self.count += n
+
+    def add_histogram(self, block):
+        """ Second pass: count the values of a block in the histogram bins """
+        if self.histogram is None:
+            lo, hi = (0, 1) if self.min is None else (self.min, self.max)
+            if not (np.isfinite(lo) and np.isfinite(hi)):
+                return
+            self.histogram = np.zeros(BINS, dtype=np.int64)
+            self.bin_edges = np.linspace(lo, hi if hi > lo else lo + 1, BINS + 1)
+        block = as_numbers(block)
+        if block.dtype.kind == 'f':
+            block = block[np.isfinite(block)]
+        counts, _ = np.histogram(block, bins=self.bin_edges)
+        self.histogram += counts
+
+    def to_dict(self):
+        return {'size': self.size, 'count': self.count, 'nan_count': self.nan_count,
+                'min': self.min, 'max': self.max, 'mean': self.mean, 'm2': self.m2,
+                'histogram': None if self.histogram is None else self.histogram.tolist(),
+                'bin_edges': None if self.bin_edges is None else self.bin_edges.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls(d['size'])
+        for name in ('count', 'nan_count', 'min', 'max', 'mean', 'm2'):
+            setattr(s, name, d[name])
+        if d['histogram'] is not None:
+            s.histogram = np.array(d['histogram'], dtype=np.int64)
+            s.bin_edges = np.array(d['bin_edges'])
+        s.done = True
+        s.progress = 1.0
+        return s
+
+
+def can_compute(node):
+    """ True if statistics can be computed for the Array *node* """
+    return node.dtype.names is None and node.dtype.kind in 'biuf'
+
+
+def block_shape(shape, chunks=None):
+    """ Shape of the blocks read: at most BLOCK_ELEMENTS elements, in whole chunks where possible
+
+    Dimensions are split in turn, leading ones first: each is cut down to a multiple of its
+    chunk size, and to a single chunk when even that is too big (the next dimension is split then).
+    If a single chunk holds more than BLOCK_ELEMENTS elements, blocks are cut within the chunks.
+    """
+    if chunks is None:
+        chunks = (1,) * len(shape)
+    block = list(shape)
+    for whole_chunks in (True, False):
+        for dim in range(len(shape)):
+            size = int(np.prod(block, dtype=np.int64))
+            if size <= BLOCK_ELEMENTS:
+                return tuple(block)
+            rest = size // block[dim]
+            extent = max(BLOCK_ELEMENTS // rest, 1)
+            if whole_chunks:
+                chunk = min(chunks[dim], shape[dim])
+                extent = max(extent // chunk, 1) * chunk
+            block[dim] = min(extent, block[dim])
+    return tuple(block)
+
+
+def blocks(shape, chunks=None):
+    """ Yield the selections (tuples of slices) of the blocks covering an array """
+    if len(shape) == 0:
+        yield ()
+        return
+    if 0 in shape:
+        return
+    block = block_shape(shape, chunks)
+    counts = [(s + b - 1) // b for s, b in zip(shape, block)]
+    for idx in np.ndindex(*counts):
+        yield tuple(slice(i * b, min((i + 1) * b, s)) for i, b, s in zip(idx, block, shape))
+
+
+def remember(cache_key, stats):
+    """ Keep finished statistics in memory, dropping the least recently used ones """
+    with _lock:
+        _cache.pop(cache_key, None)
+        _cache[cache_key] = stats
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+
+
+def forget(url):
+    """ Drop the statistics of the store at *url* from memory (called when the store is closed).
+
+    The resource may change before it is opened again: the statistics saved by the store are checked then.
+    """
+    with _lock:
+        for cache_key in [k for k in _cache if k[0] == url]:
+            del _cache[cache_key]
+
+
+def cached(node):
+    """ The finished statistics of *node*, from memory or from the store, or None """
+    cache_key = (node.store.url, node.key)
+    with _lock:
+        stats = _cache.pop(cache_key, None)
+        if stats is not None:
+            _cache[cache_key] = stats  # most recently used
+    if stats is None:
+        d = node.store.load_stats(node.key)
+        if d is not None:
+            try:
+                stats = Stats.from_dict(d)
+            except (KeyError, TypeError, ValueError) as e:
+                log.info("ignoring stored statistics of %s: %s" % (node.key, e))
+                return None
+            remember(cache_key, stats)
+    return stats
+
+
+class StatsTask(object):
+    """
+    Computes the statistics of an Array node on a background thread.
+
+    *callback* is called (in the background thread) with the Stats instance
+    after every block, and a last time once stats.done is True (or stats.error
+    is set, if the array could not be read).
+    """
+
+    def __init__(self, node, callback):
+        self.node = node
+        self.callback = callback
+        self._cancelled = False
+        self.thread = threading.Thread(target=self._run, name="StatsTask")
+        self.thread.daemon = True
+
+    def start(self):
+        stats = cached(self.node)
+        if stats is not None:
+            self.callback(stats)
+            return
+        self.thread.start()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _run(self):
+        node = self.node
+        stats = Stats()
+        try:
+            shape = node.shape
+            stats.size = int(np.prod(shape, dtype=np.int64))
+            selections = list(blocks(shape, node.chunks))
+            total = 2 * max(len(selections), 1)
+            for step, add in enumerate((stats.add, stats.add_histogram)):
+                for idx, sel in enumerate(selections):
+                    if self._cancelled:
+                        return
+                    add(node[sel])
+                    stats.progress = (step * len(selections) + idx + 1) / total
+                    self.callback(stats)
+        except Exception as e:
+            log.warning("unable to compute the statistics of %s: %s" % (node.key, e))
+            stats.error = "%s" % e
+            self.callback(stats)
+            return
+
+        stats.done = True
+        stats.progress = 1.0
+        remember((node.store.url, node.key), stats)
+        try:
+            node.store.save_stats(node.key, stats.to_dict())
+        except Exception as e:
+            log.info("unable to save the statistics of %s: %s" % (node.key, e))
+        self.callback(stats)
@@ -43,9 +43,16 @@ To run unittest, which discovers classes "store_tests" and "container_tests":
 
 from __future__ import absolute_import, division, print_function
 
+import os
+import shutil
+import tempfile
 import unittest as ut
 
-from . import Node, Store
+import numpy as np
+
+from . import Node, Store, Array, StringArrayText, shared_store, forget_store, instrument, stats
+from . import model, Plugin, register_plugin, stores_for, get_file_extensions
+from hdf_compass.utils import path2url
 
 
 # --- Public API --------------------------------------------------------------
@@ -132,6 +139,26 @@ class _TestStore(ut.TestCase):
         # Test for N > 1 because compass_model.Unknown is always present
         self.assertGreater(len(h), 1)
 
+    def test_shared_store(self):
+        """ Opening the same url twice via shared_store gives one instance """
+        s1 = shared_store(self.store_cls, self.url)
+        s2 = shared_store(self.store_cls, self.url)
+        self.assertIs(s1, s2)
+        forget_store(s1)
+        s1.close()
+
+    def test_instrument(self):
+        """ Opening a node is recorded once the instrumentation is enabled """
+        instrument.reset()
+        instrument.enable()
+        try:
+            self.store[self.store.root.key]
+            ops = [row['op'] for row in instrument.get_stats() if row['store'] == self.store.url]
+        finally:
+            instrument.enable(False)
+            instrument.reset()
+        self.assertIn('open', ops)
+
 
 class _TestNode(ut.TestCase):
     """ Base class for testing Node objects. """
@@ -218,3 +245,286 @@ class _TestContainer(_TestNode):
         """ out-of range indices raise IndexError """
         with self.assertRaises(IndexError):
             self.node[len(self.node)]
+
+
+# --- Tests of the compass_model machinery ------------------------------------
+
+class PluginStore(Store):
+    """ Store class loaded by TestPlugin (accepts any url) """
+
+    @staticmethod
+    def can_handle(url):
+        return True
+
+
+class TestPlugin(ut.TestCase):
+    """ Plugin manifests, and the selection of stores by url """
+
+    magic = b'\x89TEST\r\n'
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.plugin = Plugin("Test", __name__, "PluginStore", file_extensions={'Test File': ['*.tst']},
+                             magic=(self.magic,), magic_offsets=(0, 512, 1024))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        if self.plugin in model._plugins:
+            model._plugins.remove(self.plugin)
+
+    def url(self, name, content=b''):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as fid:
+            fid.write(content)
+        return path2url(path)
+
+    def test_extension(self):
+        """ Files are matched by extension, whatever their content """
+        self.assertTrue(self.plugin.matches(self.url("data.TST")))
+        self.assertFalse(self.plugin.matches(self.url("data.dat")))
+
+    def test_magic(self):
+        """ Files are matched by signature at any of the offsets """
+        self.assertTrue(self.plugin.matches(self.url("a.dat", self.magic + b'data')))
+        self.assertTrue(self.plugin.matches(self.url("b.dat", b'\0' * 1024 + self.magic)))
+        self.assertFalse(self.plugin.matches(self.url("c.dat", b'\0' * 100 + self.magic)))
+        self.assertFalse(self.plugin.matches(path2url(os.path.join(self.folder, "missing.dat"))))
+
+    def test_scheme(self):
+        """ Other url schemes are not matched """
+        self.assertFalse(self.plugin.matches("http://example.com/data.tst"))
+
+    def test_stores_for(self):
+        """ Matching plugins are loaded on demand """
+        register_plugin(self.plugin)
+        self.assertFalse(self.plugin.loaded)
+        self.assertNotIn(PluginStore, stores_for(self.url("data.dat")))
+        self.assertFalse(self.plugin.loaded)
+        self.assertIn(PluginStore, stores_for(self.url("data.tst")))
+        self.assertTrue(self.plugin.loaded)
+
+    def test_file_extensions(self):
+        """ Extensions are listed without loading the plugin """
+        register_plugin(self.plugin)
+        self.assertIn(('Test File', ['*.tst']), get_file_extensions())
+        self.assertFalse(self.plugin.loaded)
+
+
+class StringArray(StringArrayText):
+    """ StringArrayText over a NumPy array, for TestStringArrayText """
+
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+
+    key = '/'
+    store = None
+    display_name = 'strings'
+
+
+class TestStringArrayText(ut.TestCase):
+    """ Lines of string arrays, read on demand """
+
+    def test_scalar(self):
+        text = StringArray(np.array(b'hello'))
+        self.assertEqual(text.line_count, 1)
+        self.assertEqual(list(text.lines()), ['hello'])
+        self.assertEqual(list(text.lines(1)), [])
+
+    def test_1d(self):
+        text = StringArray(np.array([b'a', b'b', b'c']))
+        self.assertEqual(text.line_count, 3)
+        self.assertEqual(text.text, "a, \nb, \nc, ")
+        self.assertEqual(list(text.lines(1, 10)), ['b, ', 'c, '])
+
+    def test_2d(self):
+        text = StringArray(np.array([['a', 'b'], ['c', 'd']]))
+        self.assertEqual(text.line_count, 2)
+        self.assertEqual(list(text.lines()), ['a, b, ', 'c, d, '])
+
+    def test_3d(self):
+        text = StringArray(np.zeros((2, 2, 2), dtype='S1'))
+        self.assertEqual(text.line_count, 1)
+        self.assertEqual(len(list(text.lines())), 1)
+
+    def test_chunks(self):
+        """ Lines across LINE_CHUNK boundaries, and past the end """
+        count = 2 * model.LINE_CHUNK + 5
+        text = StringArray(np.array([('%d' % i).encode('ascii') for i in range(count)]))
+        start = model.LINE_CHUNK - 3
+        self.assertEqual(list(text.lines(start, start + 6)), ['%d, ' % i for i in range(start, start + 6)])
+        self.assertEqual(list(text.lines(count - 2, count + 100)), ['%d, ' % (count - 2), '%d, ' % (count - 1)])
+        self.assertEqual(list(text.lines(count + 1)), [])
+        self.assertEqual(len(list(text.lines())), count)
+
+
+class StatsStore(Store):
+    """ In-memory store of arrays, for TestStats """
+
+    def __init__(self, url):
+        self._url = url
+        self.arrays = {}
+        self.saved = {}
+
+    def __contains__(self, key):
+        return key in self.arrays
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def display_name(self):
+        return self._url
+
+    @property
+    def root(self):
+        return None
+
+    @property
+    def valid(self):
+        return True
+
+    def close(self):
+        pass
+
+    def save_stats(self, key, stats_):
+        self.saved[key] = stats_
+
+
+class StatsArray(Array):
+    """ Array of a StatsStore, with the given chunk shape (also used by TestReadFields) """
+
+    def __init__(self, store, key, chunks=None):
+        self._store = store
+        self._key = key
+        self._chunks = chunks
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def display_name(self):
+        return self._key
+
+    @property
+    def shape(self):
+        return self._store.arrays[self._key].shape
+
+    @property
+    def dtype(self):
+        return self._store.arrays[self._key].dtype
+
+    @property
+    def chunks(self):
+        return self._chunks
+
+    def __getitem__(self, args):
+        return self._store.arrays[self._key][args]
+
+
+class TestReadFields(ut.TestCase):
+    """ The default Array.read_fields, used by stores which can't read fields separately """
+
+    def test_read_fields(self):
+        store_ = StatsStore("fields://localhost/%s" % id(self))
+        data = np.zeros((4, 3), dtype=[('a', 'i4'), ('b', 'f8'), ('c', 'f4', (2,))])
+        data['a'] = np.arange(12).reshape(4, 3)
+        data['c'] = np.random.random((4, 3, 2))
+        store_.arrays['compound'] = data
+        node = StatsArray(store_, 'compound')
+        for names in (['c'], ['a', 'c']):
+            for sel in ((), (slice(1, 3), 0), (2,)):
+                fields = node.read_fields(names, sel)
+                self.assertEqual(fields.dtype.names, tuple(names))
+                for name in names:
+                    np.testing.assert_array_equal(fields[name], node[sel][name])
+
+
+class TestStats(ut.TestCase):
+    """ Streaming statistics, computed in small blocks """
+
+    def setUp(self):
+        self.block_elements = stats.BLOCK_ELEMENTS
+
+    def tearDown(self):
+        stats.BLOCK_ELEMENTS = self.block_elements
+
+    def check_block_shape(self, shape, chunks):
+        block = stats.block_shape(shape, chunks)
+        self.assertLessEqual(int(np.prod(block, dtype=np.int64)), stats.BLOCK_ELEMENTS)
+        return block
+
+    def test_block_shape(self):
+        """ Blocks are bounded, and made of whole chunks when the chunks are small enough """
+        for shape, chunks in (((20000, 20000), (20000, 1)), ((1000,) * 3, (64,) * 3),
+                              ((100000,) * 2, (1000,) * 2), ((3, 4096, 4096), (1, 256, 256))):
+            block = self.check_block_shape(shape, chunks)
+            for b, c, s in zip(block, chunks, shape):
+                self.assertTrue(b % c == 0 or b == s, (shape, chunks, block))
+
+    def test_block_shape_big_chunks(self):
+        """ Blocks are cut within chunks bigger than BLOCK_ELEMENTS """
+        self.check_block_shape((20000, 20000), (20000, 20000))
+        self.assertEqual(stats.block_shape((10, 10)), (10, 10))
+
+    def test_stats(self):
+        stats.BLOCK_ELEMENTS = 64
+        store_ = StatsStore("stats://localhost/%s" % id(self))
+        data = np.arange(1000, dtype=np.float64).reshape(10, 10, 10)
+        data[0, 0, 0] = np.nan
+        store_.arrays['a'] = data
+        node = StatsArray(store_, 'a', chunks=(2, 5, 5))
+        updates = []
+        task = stats.StatsTask(node, updates.append)
+        task.start()
+        task.thread.join()
+
+        result = updates[-1]
+        valid = data[~np.isnan(data)]
+        self.assertTrue(result.done)
+        self.assertGreater(len(updates), 2)
+        self.assertEqual((result.min, result.max, result.nan_count), (1, 999, 1))
+        self.assertAlmostEqual(result.mean, valid.mean())
+        self.assertAlmostEqual(result.std, valid.std())
+        self.assertEqual(result.histogram.sum(), valid.size)
+        self.assertIn('a', store_.saved)
+
+    def test_error(self):
+        """ A failed computation still ends with a callback """
+        store_ = StatsStore("stats://localhost/%s" % id(self))
+        store_.arrays['a'] = np.arange(10)
+
+        class FailingArray(StatsArray):
+            def __getitem__(self, args):
+                raise IOError("read error")
+
+        node = FailingArray(store_, 'a')
+        updates = []
+        task = stats.StatsTask(node, updates.append)
+        task.start()
+        task.thread.join()
+        self.assertEqual(updates[-1].error, "read error")
+        self.assertFalse(updates[-1].done)
+
+    def test_cache(self):
+        """ Finished statistics are kept until the store is closed, up to MAX_CACHED """
+        store_ = StatsStore("stats://localhost/%s" % id(self))
+        store_.arrays['a'] = np.arange(10)
+        node = StatsArray(store_, 'a')
+        result = stats.Stats(10)
+        stats.remember((store_.url, 'a'), result)
+        self.assertIs(stats.cached(node), result)
+        stats.forget(store_.url)
+        self.assertIsNone(stats.cached(node))
+
+        for idx in range(stats.MAX_CACHED + 1):
+            stats.remember((store_.url, idx), result)
+        self.assertLessEqual(len(stats._cache), stats.MAX_CACHED)
+        self.assertNotIn((store_.url, 0), stats._cache)
+        stats.forget(store_.url)
@@ -26,8 +26,10 @@ import numpy
 
 log = logging.getLogger(__name__)
 
+from hdf_compass import compass_model
 from ..frame import NodeFrame
-from .plot import LinePlotFrame, LineXYPlotFrame, ContourPlotFrame
+from .. import plotting
+from .stats import StatsFrame
 
 
 # Indicates that the slicing selection may have changed.
@@ -40,6 +42,7 @@ ID_VIS_MENU_PLOT = wx.NewId()
 ID_VIS_MENU_PLOTXY = wx.NewId()
 ID_VIS_MENU_COPY = wx.NewId()
 ID_VIS_MENU_EXPORT = wx.NewId()
+ID_VIS_MENU_STATS = wx.NewId()
 
 def gen_csv(data, delimiters):
     """ converts any N-dimensional array to a CSV-string """
@@ -48,6 +51,36 @@ def gen_csv(data, delimiters):
     else:
         return str(data)
 
+
+def format_values(data, ndim):
+    """ Convert to strings the values of *data* along its first *ndim* axes.
+
+    Numbers and strings are converted all at once; anything else (e.g. the
+    values of array fields) one value at a time.
+    """
+    if data.dtype.kind in 'SO':
+        data = compass_model.decode_strings(data)
+    if data.ndim == ndim and data.dtype.kind in 'biufcUMm':
+        return data.astype('U')
+    out = np.empty(data.shape[:ndim], dtype=object)
+    for idx in np.ndindex(*out.shape):
+        out[idx] = "%s" % (data[idx],)
+    return out
+
+
+def format_tile(tile):
+    """ Strings for a tile of data, as displayed by the grid.
+
+    For compound data, the fields are an extra (last) axis.
+    """
+    if tile.dtype.names is None:
+        return format_values(tile, tile.ndim)
+    out = np.empty(tile.shape + (len(tile.dtype.names),), dtype=object)
+    for idx, name in enumerate(tile.dtype.names):
+        out[..., idx] = format_values(tile[name], tile.ndim)
+    return out
+
+
 class ArrayFrame(NodeFrame):
     """
     Top-level frame displaying objects of type compass_model.Array.
@@ -74,6 +107,8 @@ class ArrayFrame(NodeFrame):
         if self.node.is_plottable():
             vis_menu.Append(ID_VIS_MENU_PLOT, "Plot Data\tCtrl-D")
             vis_menu.Append(ID_VIS_MENU_PLOTXY, "Plot XY\tCtrl-T")
+            if compass_model.stats.can_compute(self.node):
+                vis_menu.Append(ID_VIS_MENU_STATS, "Statistics\tCtrl-I")
             self.add_menu(vis_menu, "Visualize")
         # Initialize the toolbar
         self.init_toolbar()
@@ -94,6 +129,7 @@ class ArrayFrame(NodeFrame):
         if self.node.is_plottable():
             self.Bind(wx.EVT_MENU, self.on_plot, id=ID_VIS_MENU_PLOT)
             self.Bind(wx.EVT_MENU, self.on_plotxy, id=ID_VIS_MENU_PLOTXY)
+            self.Bind(wx.EVT_MENU, self.on_stats, id=ID_VIS_MENU_STATS)
 
         self.Bind(wx.EVT_MENU, self.on_copy, id=ID_VIS_MENU_COPY)
         self.Bind(wx.EVT_MENU, self.on_export, id=ID_VIS_MENU_EXPORT)
@@ -148,6 +184,7 @@ class ArrayFrame(NodeFrame):
             self.slicer.set_spin_max(idx, self.node.shape[x]-1)
             idx = idx + 1
         
+        self.grid.GetTable().update_indices()
         self.grid.ResetView()
 
     def get_selected_data(self):
@@ -166,42 +203,28 @@ class ArrayFrame(NodeFrame):
         if rank == 0:
             return None, None, True
 
+        # The data is compound: read only the fields to plot (those of the selected columns, or all)
+        if self.node.dtype.names is not None:
+            if len(cols) != 0:
+                names = [self.grid.GetColLabelValue(x) for x in cols]
+            else:
+                names = [self.grid.GetColLabelValue(x) for x in xrange(self.grid.GetNumberCols())]
+            data = self.node.read_fields(names, self.slicer.indices)
+            return [data[n] for n in names], names, True
+
         # Get data currently in the grid
-        if rank > 1 and self.node.dtype.names is None:
-            args = []
-            for x in xrange(rank):
-                if x == self.row:
-                    args.append(slice(None, None, None))
-                elif x == self.col:
-                    args.append(slice(None, None, None))
-                else:
-                    idx = 0
-                    for y in self.indices:
-                        if y == x:
-                            args.append(self.slicer.indices[idx])
-                            break
-                        idx = idx + 1
-            data = self.node[tuple(args)]
-            if self.row > self.col:
-                data = np.transpose(data)
+        if rank > 1:
+            data = self.plane_view().read()
         else:
             data = self.node[self.slicer.indices]
 
-        # Columns in the view are selected
+        # Columns in the view are selected: plot multiple columns independently
         if len(cols) != 0:
-            # The data is compound
-            if self.node.dtype.names is not None:
-                names = [self.grid.GetColLabelValue(x) for x in cols]
-                data = [data[n] for n in names]
-                return data, names, True
+            if rank > 1:
+                data = [data[(slice(None, None, None),c)] for c in cols]
 
-            # Plot multiple columns independently
-            else:
-                if rank > 1:
-                    data = [data[(slice(None, None, None),c)] for c in cols]
-
-                names = ["Col %d" % c for c in cols] if len(data) > 1 else None
-                return data, names, True
+            names = ["Col %d" % c for c in cols] if len(data) > 1 else None
+            return data, names, True
 
         # Rows in view are selected
         elif len(rows) != 0:
@@ -212,33 +235,53 @@ class ArrayFrame(NodeFrame):
         
         # No row or column selection.  Plot everything  
         else:
-            # The data is compound
-            if self.node.dtype.names is not None:
-                names = [self.grid.GetColLabelValue(x) for x in xrange(self.grid.GetNumberCols())]
-                data = [data[n] for n in names]
-                return data, names, True
-
             # Plot 1D
-            elif rank == 1:
+            if rank == 1:
                 return [data], [], True
 
             # Plot 2D
             else:
                 return data, [], False
 
+    def get_plot_axes(self):
+        """
+        function to get the coordinates of the plot axes for the selected data
+        (see get_selected_data), from the dimension scales of the node
+        returns (x, y)
+            x: (label, values) for the x axis, or None to use indices
+            y: (label, values) for the y axis of 2D plots, or None
+        """
+        rank = len(self.node.shape)
+        if rank == 0:
+            return None, None
+
+        # 1D data, or compound data (whose grid rows span the last dimension)
+        if rank == 1 or self.node.dtype.names is not None:
+            return self.node.scale(rank - 1), None
+
+        # Columns are plotted along the rows, and rows along the columns
+        if len(self.grid.GetSelectedCols()) != 0:
+            return self.node.scale(self.row), None
+        if len(self.grid.GetSelectedRows()) != 0:
+            return self.node.scale(self.col), None
+        return self.node.scale(self.col), self.node.scale(self.row)
+
     def on_sliced(self, evt):
         """ User has chosen to display a different part of the dataset. """
+        self.grid.GetTable().update_indices()
         self.grid.Refresh()
 
     def on_plot(self, evt):
         """ User has chosen to plot the current selection """
         data, names, line = self.get_selected_data()
         if data != None:
+            plot = plotting.load("array")
+            x, y = self.get_plot_axes()
             if line:
-                f = LinePlotFrame(data, names)
+                f = plot.LinePlotFrame(data, names, x=x)
                 f.Show()
             else:
-                f = ContourPlotFrame(data)
+                f = plot.ContourPlotFrame(data, x=x, y=y)
                 f.Show()
 
     def on_plotxy(self, evt):
@@ -246,9 +289,14 @@ class ArrayFrame(NodeFrame):
         data, names, line = self.get_selected_data()
         if data != None and len(data) != 1:
             if line:
-                f = LineXYPlotFrame(data, names)
+                f = plotting.load("array").LineXYPlotFrame(data, names)
                 f.Show()
 
+    def on_stats(self, evt):
+        """ User has chosen to display the statistics of the whole array """
+        f = StatsFrame(self, self.node)
+        f.Show()
+
     def on_copy(self, evt):
         """ User has chosen to copy the current selection to the clipboard """
 
@@ -330,6 +378,10 @@ class ArrayFrame(NodeFrame):
             l.append(x)
         return tuple(l)
         
+    def plane_view(self):
+        """ The PlaneView of the data currently in the grid (N-D, non-compound data only) """
+        return PlaneView(self.node, self.row, self.col, dict(zip(self.indices, self.slicer.indices)))
+
     @property
     def row(self):
         """ The dimension selected for the row
@@ -514,17 +566,47 @@ class LRUTileCache(object):
         Access is via __getitem__.  Because this class exists specifically
         to support point-based callbacks for the Grid, arguments may
         only be indices, not slices.
+
+        Tiles are converted to strings (see format_tile) when they are
+        read, so the values returned are the strings to display.
     """
 
     TILESIZE = 100  # Tiles will have shape (100,) or (100, 100)
     MAXTILES = 50  # Max number of tiles to retain in the cache
+    MAXBYTES = 64 * 1024 * 1024  # Max size of the (string) tiles retained in the cache
+    FIELDS = 10  # Tiles of compound data hold the fields of 10 columns, see ArrayTable.field_value
 
     def __init__(self, arr):
         """ *arr* is anything implementing compass_model.Array """
         import collections
         self.cache = collections.OrderedDict()
+        self.nbytes = 0
         self.arr = arr
 
+    def tile(self, tile_key, read, *args):
+        """ Return the tile *tile_key*, calling read(*args) to get its data if it is not cached """
+
+        # Case 1: Add tile to cache, ejecting oldest tiles if needed
+        if not tile_key in self.cache:
+
+            compass_model.instrument.record_cache(self.arr.store, self.arr.key, 'tiles', False)
+
+            tile = format_tile(np.asarray(read(*args)))
+            self.cache[tile_key] = tile
+            self.nbytes += tile.nbytes
+
+            while len(self.cache) > 1 and (len(self.cache) > self.MAXTILES or self.nbytes > self.MAXBYTES):
+                _, old = self.cache.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+        # Case 2: Mark the tile as recently accessed
+        else:
+            compass_model.instrument.record_cache(self.arr.store, self.arr.key, 'tiles', True)
+            tile = self.cache.pop(tile_key)
+            self.cache[tile_key] = tile
+
+        return tile
+
     def __getitem__(self, args):
         """ Restricted to an index or tuple of indices. """
 
@@ -547,21 +629,66 @@ class LRUTileCache(object):
         # Index applied to tile to retrieve the desired data point
         tile_data_index = tuple(x % self.TILESIZE for x in fine_position)
 
-        # Case 1: Add tile to cache, ejecting oldest tile if needed
-        if not tile_key in self.cache:
+        return self.tile(tile_key, self.arr.__getitem__, tile_slice)[tile_data_index]
 
-            if len(self.cache) >= self.MAXTILES:
-                self.cache.popitem(last=False)
 
-            tile = self.arr[tile_slice]
-            self.cache[tile_key] = tile
+# Max extent of the tiles of a PlaneView along a dimension (when aligned to large chunks)
+MAX_TILE_EXTENT = 4 * LRUTileCache.TILESIZE
 
-        # Case 2: Mark the tile as recently accessed
-        else:
-            tile = self.cache.pop(tile_key)
-            self.cache[tile_key] = tile
 
-        return tile[tile_data_index]
+def tile_extent(node, dim):
+    """ Tile size along *dim*: LRUTileCache.TILESIZE, rounded to whole chunks if the node is chunked """
+    size = LRUTileCache.TILESIZE
+    chunks = node.chunks
+    if chunks is None:
+        return size
+    if chunks[dim] >= size:
+        return min(chunks[dim], MAX_TILE_EXTENT)
+    return (size // chunks[dim]) * chunks[dim]
+
+
+class PlaneView(object):
+    """
+    The 2D plane of an N-D array displayed by the grid: dimension row_dim
+    along the rows, col_dim along the columns, and fixed indices along all
+    the other dimensions.
+
+    Data is always read from the node in its native dimension order (so
+    that reads follow its storage layout), and transposed once afterwards
+    if row_dim > col_dim.  Tiles are aligned to the chunks of the node.
+    """
+
+    def __init__(self, node, row_dim, col_dim, indices):
+        """ *indices* maps the other dimensions to the index displayed """
+        self.node = node
+        self.row_dim = row_dim
+        self.col_dim = col_dim
+        self.transposed = row_dim > col_dim
+
+        self.template = [indices.get(dim, 0) for dim in xrange(len(node.shape))]
+        self.key = (row_dim, col_dim, tuple(self.template))  # identifies the plane in the tile cache
+        self.tile_shape = (tile_extent(node, row_dim), tile_extent(node, col_dim))
+
+    def selection(self, rows=slice(None), cols=slice(None)):
+        """ Native-order selection of the rows and columns (indices or slices) of the plane """
+        args = self.template[:]
+        args[self.row_dim] = rows
+        args[self.col_dim] = cols
+        return tuple(args)
+
+    def read(self, rows=slice(None), cols=slice(None)):
+        """ Read (slices of) the plane, with the rows along the first axis """
+        data = np.asarray(self.node[self.selection(rows, cols)])
+        if self.transposed:
+            data = data.T
+        return data
+
+    def tile(self, cache, row, col):
+        """ The tile of *cache* holding the cell (row, col), and the index of the cell in it """
+        th, tw = self.tile_shape
+        r, c = row // th, col // tw
+        tile = cache.tile(self.key + (r, c), self.read, slice(r * th, (r + 1) * th), slice(c * tw, (c + 1) * tw))
+        return tile, (row - r * th, col - c * tw)
 
 
 class ArrayTable(wx.grid.PyGridTableBase):
@@ -589,6 +716,37 @@ class ArrayTable(wx.grid.PyGridTableBase):
         self.names = self.node.dtype.names
 
         self.cache = LRUTileCache(self.node)
+        self.labels = {}  # dim -> labels from the dimension scale (or None), see scale_labels
+        self.scalar = None  # strings for scalar data, formatted once
+
+        self.update_indices()
+
+    def update_indices(self):
+        """ Prepare the index tuples of GetValue for the current slicer state.
+
+        To be called when the slicer indices or the displayed dimensions change.
+        """
+        if self.rank < 2:
+            return
+        # Compound data: the slicer indices, followed by the row
+        if self.names is not None:
+            self.prefix = self.slicer.indices
+            return
+        self.plane = self.selecter.plane_view()
+
+    def scale_labels(self, dim):
+        """ Labels for the indices along *dim*, from its dimension scale.
+
+        The coordinates are formatted all at once, the first time they are
+        needed.  Returns None if the node has no coordinates for *dim*.
+        """
+        if dim not in self.labels:
+            scale = self.node.scale(dim)
+            if scale is None:
+                self.labels[dim] = None
+            else:
+                self.labels[dim] = np.char.mod('%g', scale[1])
+        return self.labels[dim]
 
     def GetNumberRows(self):
         """ Callback for number of rows displayed by the grid control """
@@ -618,59 +776,66 @@ class ArrayTable(wx.grid.PyGridTableBase):
         """
         # Scalar case
         if self.rank == 0:
-            data = self.node[()]
+            if self.scalar is None:
+                self.scalar = format_tile(np.asarray(self.node[()]))
             if self.names is None:
-                return data
-            return data[col]
+                return self.scalar[()]
+            return self.scalar[col]
 
         # 1D case
         if self.rank == 1:
-            data = self.cache[row]
             if self.names is None:
-                return data
-            return data[self.names[col]]
+                return self.cache[row]
+            return self.field_value((), row, col)
 
         # ND case.  Watch out for compound mode!
         if self.names is not None:
-            args = self.slicer.indices + (row,)
-        else:
-            l = []
-            for x in xrange(self.rank):
-                if x == self.selecter.row:
-                    l.append(row)
-                elif x == self.selecter.col:
-                    l.append(col)
-                else:
-                    idx = 0
-                    for y in self.selecter.indices:
-                        if y == x:
-                            l.append(self.slicer.indices[idx])
-                            break
-                        idx = idx + 1
-            args = tuple(l)
-        
-        data = self.cache[args]
-        if self.names is None:
-            return data
-        return data[self.names[col]]
+            return self.field_value(self.prefix, row, col)
+
+        tile, idx = self.plane.tile(self.cache, row, col)
+        return tile[idx]
+
+    def field_value(self, prefix, row, col):
+        """ Value for a cell of compound data.
+
+        Tiles span TILESIZE rows (along the last dimension, at the indices
+        *prefix* along the others) and only the FIELDS fields of the nearby
+        columns, which are the only ones read from the node.
+        """
+        size, nfields = self.cache.TILESIZE, self.cache.FIELDS
+        r, f = row // size, col // nfields
+        tile = self.cache.tile(prefix + (r, f), self.node.read_fields, self.names[f * nfields:(f + 1) * nfields],
+                               prefix + (slice(r * size, (r + 1) * size),))
+        return tile[row - r * size, col - f * nfields]
 
     def GetRowLabelValue(self, row):
         """ Callback for row labels.
 
-        Row number is used unless the data is scalar.
+        The coordinate from the dimension scale is used if available, the
+        row number otherwise, unless the data is scalar.
         """
         if self.rank == 0:
             return "Value"
-        return str(row)
+        if self.rank == 1 or self.names is not None:
+            labels = self.scale_labels(self.rank - 1)
+        else:
+            labels = self.scale_labels(self.selecter.row)
+        if labels is None:
+            return str(row)
+        return labels[row]
 
     def GetColLabelValue(self, col):
         """ Callback for column labels.
 
-        Column number is used, except for scalar or 1D data, or if we're
-        displaying field names in the columns.
+        The coordinate from the dimension scale (or the column number) is
+        used, except for scalar or 1D data, or if we're displaying field
+        names in the columns.
         """
         if self.names is not None:
             return self.names[col]
         if self.rank == 0 or self.rank == 1:
             return "Value"
-        return str(col)
+        labels = self.scale_labels(self.selecter.col)
+        if labels is None:
+            return str(col)
+        return labels[col]
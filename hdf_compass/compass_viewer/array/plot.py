@@ -76,12 +76,18 @@ class PlotFrame(BaseFrame):
 
 
 class LinePlotFrame(PlotFrame):
-    def __init__(self, data, names=None, title="Line Plot"):
+    def __init__(self, data, names=None, title="Line Plot", x=None):
+        """ *x* is a (label, values) tuple with the coordinates of the x axis, or None to use indices """
         self.names = names
+        self.x = x
         PlotFrame.__init__(self, data, title)
 
     def draw_figure(self):
-        lines = [self.axes.plot(d)[0] for d in self.data]
+        if self.x is None:
+            lines = [self.axes.plot(d)[0] for d in self.data]
+        else:
+            self.axes.set_xlabel(self.x[0])
+            lines = [self.axes.plot(self.x[1], d)[0] for d in self.data]
         if self.names is not None:
             for n in self.names:
                 self.axes.legend(tuple(lines), tuple(self.names))
@@ -103,10 +109,13 @@ class LineXYPlotFrame(PlotFrame):
                 self.axes.legend(tuple(lines), tuple(self.names[1::]))
 
 class ContourPlotFrame(PlotFrame):
-    def __init__(self, data, names=None, title="Contour Plot"):
+    def __init__(self, data, names=None, title="Contour Plot", x=None, y=None):
+        """ *x* and *y* are (label, values) tuples with the coordinates of the columns and rows, or None """
         # need to be set before calling the parent (need for plotting)
         self.colormap = "jet"
         self.cb = None  # matplotlib color-bar
+        self.x = x
+        self.y = y
 
         PlotFrame.__init__(self, data, title)
 
@@ -181,23 +190,39 @@ class ContourPlotFrame(PlotFrame):
         row_stride = rows // max_elements + 1
         col_stride = cols // max_elements + 1
         data = self.data[::row_stride, ::col_stride]
-        xx = np.arange(0, self.data.shape[1], col_stride)
-        yy = np.arange(0, self.data.shape[0], row_stride)
+        if self.x is None:
+            xx = np.arange(0, self.data.shape[1], col_stride)
+        else:
+            xx = self.x[1][::col_stride]
+            self.axes.set_xlabel(self.x[0])
+        if self.y is None:
+            yy = np.arange(0, self.data.shape[0], row_stride)
+        else:
+            yy = self.y[1][::row_stride]
+            self.axes.set_ylabel(self.y[0])
         img = self.axes.contourf(xx, yy, data, 25, cmap=plt.cm.get_cmap(self.colormap))
-        self.axes.set_aspect('equal')
+        if self.x is None and self.y is None:
+            self.axes.set_aspect('equal')
         if self.cb:
             self.cb.on_mappable_changed(img)
         else:
             self.cb = plt.colorbar(img, ax=self.axes)
         self.cb.ax.tick_params(labelsize=8)
 
+    @staticmethod
+    def index(axis, value):
+        """ Index of the point of *axis* (see __init__) nearest to the plot coordinate *value* """
+        if axis is None:
+            return int(value)
+        return int(np.abs(axis[1] - value).argmin())
+
     def change_cursor(self, event):
         self.canvas.SetCursor(wx.StockCursor(wx.CURSOR_CROSS))
 
     def update_status_bar(self, event):
         msg = str()
         if event.inaxes:
-            x, y = int(event.xdata), int(event.ydata)
+            x, y = self.index(self.x, event.xdata), self.index(self.y, event.ydata)
             z = self.data[y, x]
             msg = "x= %d, y= %d, z= %f" % (x, y, z)
         self.status_bar.SetStatusText(msg, 1)
@@ -0,0 +1,124 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of the HDF Compass Viewer. The full HDF Compass          #
+# copyright notice, including terms governing use, modification, and         #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+
+"""
+Statistics window for compass_model.Array nodes.
+
+The statistics are computed in the background by compass_model.stats, and
+displayed as they progress.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import wx
+
+import logging
+log = logging.getLogger(__name__)
+
+from hdf_compass import compass_model
+
+
+class StatsFrame(wx.Frame):
+    """ Frame displaying the min, max, mean, std, NaN count and histogram of an Array. """
+
+    def __init__(self, parent, node):
+        wx.Frame.__init__(self, parent, title='Statistics of "%s"' % node.display_name, size=(420, 460))
+        self.node = node
+
+        self.panel = p = wx.Panel(self)
+        self.text = wx.StaticText(p, style=wx.ALIGN_LEFT)
+        self.gauge = wx.Gauge(p, range=1000)
+        self.histogram = HistogramPanel(p)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.text, 0, wx.ALL | wx.EXPAND, 10)
+        sizer.Add(self.histogram, 1, wx.LEFT | wx.RIGHT | wx.EXPAND, 10)
+        sizer.Add(self.gauge, 0, wx.ALL | wx.EXPAND, 10)
+        p.SetSizer(sizer)
+
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
+        self.task = compass_model.stats.StatsTask(node, self.on_stats)
+        self.task.start()
+
+    def on_stats(self, stats):
+        """ Called (possibly in the background thread) as the statistics progress """
+        wx.CallAfter(self.display, stats)
+
+    def display(self, stats):
+        if not self:
+            return
+
+        def fmt(value):
+            return "..." if value is None else "%g" % value
+
+        lines = ["Elements: %d" % stats.size,
+                 "NaN count: %d" % stats.nan_count,
+                 "Min: %s" % fmt(stats.min),
+                 "Max: %s" % fmt(stats.max),
+                 "Mean: %s" % fmt(stats.mean),
+                 "Std: %s" % fmt(stats.std)]
+        if stats.error is not None:
+            lines.append("(failed: %s)" % stats.error)
+        elif not stats.done:
+            lines.append("(computing, %.0f%%)" % (stats.progress * 100.0))
+        self.text.SetLabel("\n".join(lines))
+        self.gauge.SetValue(int(stats.progress * 1000))
+        if stats.histogram is not None:
+            self.histogram.set(stats.histogram.copy(), stats.bin_edges)
+        self.panel.Layout()
+
+    def on_close(self, evt):
+        self.task.cancel()
+        evt.Skip()
+
+
+class HistogramPanel(wx.Panel):
+    """ Simple bar chart of a histogram. """
+
+    def __init__(self, parent):
+        wx.Panel.__init__(self, parent, size=(-1, 200))
+        self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
+        self.counts = None
+        self.edges = None
+        self.Bind(wx.EVT_PAINT, self.on_paint)
+        self.Bind(wx.EVT_SIZE, lambda evt: self.Refresh())
+
+    def set(self, counts, edges):
+        self.counts = counts
+        self.edges = edges
+        self.Refresh()
+
+    def on_paint(self, evt):
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.SetBackground(wx.Brush(wx.Colour(255, 255, 255)))
+        dc.Clear()
+        if self.counts is None or len(self.counts) == 0:
+            return
+
+        w, h = self.GetClientSize()
+        label_h = dc.GetTextExtent("0")[1] + 4
+        plot_h = max(h - label_h, 1)
+        top = max(self.counts.max(), 1)
+        bar_w = w / len(self.counts)
+
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.SetBrush(wx.Brush(wx.Colour(70, 110, 170)))
+        for idx, count in enumerate(self.counts):
+            bar_h = int(round(plot_h * count / top))
+            x0 = int(idx * bar_w)
+            x1 = int((idx + 1) * bar_w)
+            dc.DrawRectangle(x0, plot_h - bar_h, max(x1 - x0 - 1, 1), bar_h)
+
+        dc.SetTextForeground(wx.Colour(0, 0, 0))
+        dc.DrawText("%g" % self.edges[0], 0, plot_h + 2)
+        last = "%g" % self.edges[-1]
+        dc.DrawText(last, w - dc.GetTextExtent(last)[0], plot_h + 2)
@@ -16,6 +16,9 @@ Implements a viewer for compass_model.Container instances.
 This frame is a simple browser view with back/forward/up controls.
 
 Currently list and icon views are supported.
+
+For stores supporting it (see Store.search), a search field in the toolbar
+displays the objects below the current container which match a query.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
@@ -35,6 +38,7 @@ ID_GO_MENU_BACK = wx.NewId()
 ID_GO_MENU_NEXT = wx.NewId()
 ID_GO_MENU_UP = wx.NewId()
 ID_GO_MENU_TOP = wx.NewId()
+ID_GO_MENU_SEARCH = wx.NewId()
 
 ID_VIEW_MENU_LIST = wx.NewId()
 ID_VIEW_MENU_ICON = wx.NewId()
@@ -64,6 +68,9 @@ class ContainerFrame(NodeFrame):
         go_menu.Append(ID_GO_MENU_NEXT, "Next")
         go_menu.Append(ID_GO_MENU_UP, "Up")
         go_menu.Append(ID_GO_MENU_TOP, "Top")
+        if node.store.can_search:
+            go_menu.AppendSeparator()
+            go_menu.Append(ID_GO_MENU_SEARCH, "Search...\tCtrl-F")
         self.add_menu(go_menu, "Go")
         self.go_menu = go_menu
 
@@ -82,6 +89,7 @@ class ContainerFrame(NodeFrame):
         self.Bind(wx.EVT_MENU, lambda evt: self.go_next(), id=ID_GO_MENU_NEXT)
         self.Bind(wx.EVT_MENU, lambda evt: self.go_up(), id=ID_GO_MENU_UP)
         self.Bind(wx.EVT_MENU, lambda evt: self.go_top(), id=ID_GO_MENU_TOP)
+        self.Bind(wx.EVT_MENU, lambda evt: self.search.SetFocus(), id=ID_GO_MENU_SEARCH)
         self.Bind(wx.EVT_MENU, lambda evt: self.list_view(), id=ID_VIEW_MENU_LIST)
         self.Bind(wx.EVT_MENU, lambda evt: self.icon_view(), id=ID_VIEW_MENU_ICON)
 
@@ -107,6 +115,17 @@ class ContainerFrame(NodeFrame):
         self.toolbar.AddLabelTool(ID_VIEW_MENU_ICON, "Icon View", icon_bmp, shortHelp="New",
                                   longHelp="Long help for 'New'")
 
+        self.search = None
+        if node.store.can_search:
+            self.toolbar.AddSeparator()
+            self.search = wx.SearchCtrl(self.toolbar, size=(220, -1), style=wx.TE_PROCESS_ENTER)
+            self.search.SetDescriptiveText("Search")
+            self.search.SetToolTipString('Search below this group, e.g.: temp dtype:float ndim:2 attr:units=K\n'
+                                         'Fields: re, kind, dtype, ndim, shape, attr, text')
+            self.toolbar.AddControl(self.search)
+            self.search.Bind(wx.EVT_TEXT_ENTER, self.on_search)
+            self.search.Bind(wx.EVT_SEARCHCTRL_SEARCH_BTN, self.on_search)
+
         self.toolbar.Realize()
 
         self.view = ContainerReportList(self, node)
@@ -169,6 +188,25 @@ class ContainerFrame(NodeFrame):
 
     # --- End history support functions ---------------------------------------
 
+    def on_search(self, evt):
+        """ Search the current container, and browse the results """
+        query = self.search.GetValue().strip()
+        if query == "":
+            return
+        node = self.node
+        busy = wx.BusyCursor()  # the file may have to be indexed first
+        try:
+            results = node.store.search(query, node.key)
+        except ValueError as e:
+            del busy
+            dlg = wx.MessageDialog(self, "%s" % e, "Unable to search", wx.OK | wx.ICON_INFORMATION)
+            dlg.ShowModal()
+            dlg.Destroy()
+            return
+        del busy
+        if results is not None:
+            self.go(results)
+
     def update_view(self):
         """ Refresh the entire contents of the frame according to self.node. """
         self.SetTitle(self.node.display_title)
@@ -29,11 +29,12 @@ from wx.lib.pubsub import pub
 
 log = logging.getLogger(__name__)
 
-from .info import InfoPanel
+from .info import InfoPanel, forget_descriptions
 
 ID_OPEN_RESOURCE = wx.NewId()
 ID_CLOSE_FILE = wx.NewId()
 ID_PLUGIN_INFO = wx.NewId()
+ID_PERFORMANCE = wx.NewId()
 
 MAX_RECENT_FILES = 8
 
@@ -116,6 +117,7 @@ class BaseFrame(wx.Frame):
         help_menu = wx.Menu()
         help_menu.Append(wx.ID_HELP, "Online &Manual", "Open online documentation")
         help_menu.Append(ID_PLUGIN_INFO, "&Plugin Info", "Information about the available plugins")
+        help_menu.Append(ID_PERFORMANCE, "P&erformance", "I/O statistics of the open data stores")
         help_menu.Append(wx.ID_ABOUT, "&About HDFCompass", "Information about this program")
         menubar.Append(help_menu, "&Help")
 
@@ -125,6 +127,7 @@ class BaseFrame(wx.Frame):
         self.Bind(wx.EVT_MENU, self.on_resource_open, id=ID_OPEN_RESOURCE)
         self.Bind(wx.EVT_MENU, self.on_manual, id=wx.ID_HELP)
         self.Bind(wx.EVT_MENU, self.on_plugin_info, id=ID_PLUGIN_INFO)
+        self.Bind(wx.EVT_MENU, self.on_performance, id=ID_PERFORMANCE)
         self.Bind(wx.EVT_MENU, self.on_about, id=wx.ID_ABOUT)
         self.Bind(wx.EVT_MENU, self.on_exit, id=wx.ID_EXIT)
         self.Bind(wx.EVT_MENU, self.on_close, id=wx.ID_CLOSE)
@@ -154,6 +157,11 @@ class BaseFrame(wx.Frame):
         plug_info = PluginInfoFrame(self)
         plug_info.Show()
 
+    def on_performance(self, evt):
+        """ Open a frame with the I/O statistics (this enables the instrumentation) """
+        perf = PerformanceFrame(self)
+        perf.Show()
+
     def on_about(self, evt):
         """ Display an "About" dialog """
         info = wx.AboutDialogInfo()
@@ -172,18 +180,16 @@ class BaseFrame(wx.Frame):
             """ Make a wxPython dialog filter string segment from dict """
             filter_string = []
             hdf_filter_string = []  # put HDF filters in the front
-            for store in compass_model.get_stores():
-                if len(store.file_extensions) == 0:
-                    continue
-                for key in store.file_extensions:
-                    s = "{name} ({pattern_c})|{pattern_sc}".format(
-                        name=key,
-                        pattern_c=",".join(store.file_extensions[key]),
-                        pattern_sc=";".join(store.file_extensions[key]))
-                    if s.startswith("HDF"):
-                        hdf_filter_string.append(s)
-                    else:
-                        filter_string.append(s)
+            # plugin manifests provide the extensions without importing the plugins
+            for key, patterns in compass_model.get_file_extensions():
+                s = "{name} ({pattern_c})|{pattern_sc}".format(
+                    name=key,
+                    pattern_c=",".join(patterns),
+                    pattern_sc=";".join(patterns))
+                if s.startswith("HDF"):
+                    hdf_filter_string.append(s)
+                else:
+                    filter_string.append(s)
             filter_string = hdf_filter_string + filter_string
             filter_string.append('All Files (*.*)|*.*')
             pipe = "|"
@@ -290,6 +296,10 @@ class NodeFrame(BaseFrame):
     menu, the store is closed and a pubsub notification is sent out to all
     other frames.  They check to see if their .node.store's are valid, and
     if not, close themselves.
+
+    Stores are shared between frames through compass_model.shared_store, so
+    reopening a resource that is already open reuses the same store (and
+    reference count).  Closing a store also removes it from that registry.
     """
 
     # --- Store reference-counting methods ------------------------------------
@@ -321,6 +331,9 @@ class NodeFrame(BaseFrame):
     def _close(cls, store):
         """ Manually close the store, and broadcast a pubsub notification. """
         cls._stores.pop(store, None)
+        compass_model.forget_store(store)
+        forget_descriptions(store.url)
+        compass_model.stats.forget(store.url)
         store.close()
         pub.sendMessage('store.close')
 
@@ -468,6 +481,9 @@ class PluginInfoFrame(wx.Frame):
         p = wx.Panel(self)
         nb = wx.Notebook(p)
 
+        # names and descriptions live in the Store classes, so all plugins are needed here
+        compass_model.load_plugins()
+
         for store in compass_model.get_stores():
             try:
                 # log.debug(store.plugin_name())
@@ -507,3 +523,87 @@ class PluginInfoFrame(wx.Frame):
         sizer = wx.BoxSizer()
         sizer.Add(nb, 1, wx.ALL | wx.EXPAND, 3)
         p.SetSizer(sizer)
+
+
+class PerformanceFrame(wx.Frame):
+    """ Frame displaying the I/O statistics collected by compass_model.instrument.
+
+    The instrumentation is enabled when the frame is opened (or at startup, if
+    the HDF_COMPASS_INSTRUMENT environment variable is set), and stays on.
+    The table is refreshed every second, and can be exported as JSON.
+    """
+
+    columns = (("Store", 160), ("Node", 160), ("Operation", 90), ("Calls", 60), ("Bytes", 90),
+               ("Total [ms]", 80), ("Mean [ms]", 80), ("Latency histogram", 150), ("Hit ratio", 70))
+
+    def __init__(self, parent):
+        wx.Frame.__init__(self, parent, title="Performance", size=(980, 400))
+
+        compass_model.instrument.enable()
+
+        p = wx.Panel(self)
+        self.list = wx.ListCtrl(p, style=wx.LC_REPORT | wx.LC_HRULES | wx.LC_VRULES)
+        for idx, (name, width) in enumerate(self.columns):
+            self.list.InsertColumn(idx, name, width=width)
+
+        reset = wx.Button(p, wx.ID_ANY, "Reset")
+        export = wx.Button(p, wx.ID_ANY, "Export...")
+        self.Bind(wx.EVT_BUTTON, self.on_reset, reset)
+        self.Bind(wx.EVT_BUTTON, self.on_export, export)
+
+        btns = wx.BoxSizer(wx.HORIZONTAL)
+        btns.Add(wx.StaticText(p, wx.ID_ANY, "Histogram bins [ms]: <= %s, more" %
+                               ", <= ".join("%g" % b for b in compass_model.instrument.BINS_MS)),
+                 1, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 5)
+        btns.Add(reset, 0, wx.ALL, 3)
+        btns.Add(export, 0, wx.ALL, 3)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.list, 1, wx.ALL | wx.EXPAND, 3)
+        sizer.Add(btns, 0, wx.EXPAND)
+        p.SetSizer(sizer)
+
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_timer, self.timer)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+        self.timer.Start(1000)
+        self.refresh()
+
+    def refresh(self):
+        """ Fill the table with a fresh snapshot of the statistics """
+        self.list.DeleteAllItems()
+        for row in compass_model.instrument.get_stats():
+            idx = self.list.InsertStringItem(self.list.GetItemCount(), "%s" % row['store'])
+            calls = row['calls']
+            values = ("" if row['key'] is None else row['key'], row['op'],
+                      "%d" % calls if calls else "",
+                      "%d" % row['bytes'] if row['bytes'] else "",
+                      "%.1f" % (row['seconds'] * 1000.0) if calls else "",
+                      "%.2f" % (row['seconds'] * 1000.0 / calls) if calls else "",
+                      " ".join("%d" % c for c in row['histogram']) if calls else "",
+                      "%.0f%%" % (row['hit_ratio'] * 100.0) if row['hit_ratio'] is not None else "")
+            for col, value in enumerate(values):
+                self.list.SetStringItem(idx, col + 1, value)
+
+    def on_timer(self, evt):
+        self.refresh()
+
+    def on_reset(self, evt):
+        compass_model.instrument.reset()
+        self.refresh()
+
+    def on_export(self, evt):
+        """ Save the statistics as a JSON file """
+        dlg = wx.FileDialog(self, "Export Statistics", wildcard="JSON files (*.json)|*.json",
+                            defaultFile="compass_stats.json", style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+        if dlg.ShowModal() == wx.ID_OK:
+            path = dlg.GetPath()
+            try:
+                compass_model.instrument.export(path)
+            except IOError as e:
+                log.warning("unable to export statistics to %s: %s" % (path, e))
+        dlg.Destroy()
+
+    def on_close(self, evt):
+        self.timer.Stop()
+        evt.Skip()
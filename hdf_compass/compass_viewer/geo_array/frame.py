@@ -23,8 +23,9 @@ import logging
 
 log = logging.getLogger(__name__)
 
+from hdf_compass import compass_model
 from ..frame import NodeFrame
-from .plot import LinePlotFrame, ContourPlotFrame
+from .. import plotting
 
 
 # Indicates that the slicing selection may have changed.
@@ -101,6 +102,7 @@ class GeoArrayFrame(NodeFrame):
 
     def on_plot(self, evt):
         """ User has chosen to plot the current selection """
+        plot = plotting.load("geo_array")
         cols = self.grid.GetSelectedCols()
         rows = self.grid.GetSelectedRows()
 
@@ -116,7 +118,7 @@ class GeoArrayFrame(NodeFrame):
                 names = [self.grid.GetColLabelValue(x) for x in cols]
                 data = self.node[self.slicer.indices]  # -> 1D compound array
                 data = [data[n] for n in names]
-                f = LinePlotFrame(data, names)
+                f = plot.LinePlotFrame(data, names)
                 f.Show()
 
             # Plot multiple columns independently
@@ -128,7 +130,7 @@ class GeoArrayFrame(NodeFrame):
 
                 names = ["Col %d" % c for c in cols] if len(data) > 1 else None
 
-                f = LinePlotFrame(data, names)
+                f = plot.LinePlotFrame(data, names)
                 f.Show()
 
 
@@ -138,7 +140,7 @@ class GeoArrayFrame(NodeFrame):
             data = [self.node[self.slicer.indices + (slice(None, None, None), r)] for r in rows]
             names = ["Row %d" % r for r in rows] if len(data) > 1 else None
 
-            f = LinePlotFrame(data, names)
+            f = plot.LinePlotFrame(data, names)
             f.Show()
 
 
@@ -151,17 +153,17 @@ class GeoArrayFrame(NodeFrame):
             if self.node.dtype.names is not None:
                 names = [self.grid.GetColLabelValue(x) for x in xrange(self.grid.GetNumberCols())]
                 data = [data[n] for n in names]
-                f = LinePlotFrame(data, names)
+                f = plot.LinePlotFrame(data, names)
                 f.Show()
 
             # Plot 1D
             elif len(self.node.shape) == 1:
-                f = LinePlotFrame([data])
+                f = plot.LinePlotFrame([data])
                 f.Show()
 
             # Plot 2D
             else:
-                f = ContourPlotFrame(data, extent=self.node.extent)
+                f = plot.ContourPlotFrame(data, extent=self.node.extent)
                 f.Show()
 
     def on_workaround_timer(self, evt):
@@ -308,6 +310,8 @@ class LRUTileCache(object):
         # Case 1: Add tile to cache, ejecting oldest tile if needed
         if not tile_key in self.cache:
 
+            compass_model.instrument.record_cache(self.arr.store, self.arr.key, 'tiles', False)
+
             if len(self.cache) >= self.MAXTILES:
                 self.cache.popitem(last=False)
 
@@ -316,6 +320,7 @@ class LRUTileCache(object):
 
         # Case 2: Mark the tile as recently accessed
         else:
+            compass_model.instrument.record_cache(self.arr.store, self.arr.key, 'tiles', True)
             tile = self.cache.pop(tile_key)
             self.cache[tile_key] = tile
 
@@ -11,18 +11,45 @@
 ##############################################################################
 
 """
-Implements a simple true-color image viewer.
+Implements a tiled, zoomable image viewer.
+
+Only the visible part of the image is read, one tile at a time, through
+compass_model.Image.region().  When zoomed out, tiles are read at a coarser
+level of detail (every 2**level pixel), so that the data read is roughly
+proportional to the window size, and not to the image size.
+
+Mouse wheel zooms (around the cursor), dragging pans.  Keys: + and - zoom,
+0 fits the image to the window, 1 shows it at 1:1.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
+import math
+import threading
+
+import numpy as np
 import wx
-import wx.grid
 
 import logging
 log = logging.getLogger(__name__)
 
+from hdf_compass.compass_model import instrument
 from ..frame import NodeFrame
 
+# Size (in pixels, at its level of detail) of the square tiles read from the node
+TILESIZE = 256
+
+# Max size of the bitmaps retained by the tile cache
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+
+# Zoom limits (screen pixels per image pixel) and zoom factor per step
+MIN_ZOOM = 1.0 / 1024
+MAX_ZOOM = 32.0
+ZOOM_STEP = 1.25
+
+# Background of the areas outside of the image (or not loaded yet)
+BACKGROUND = wx.Colour(128, 128, 128)
+
 
 class ImageFrame(NodeFrame):
 
@@ -31,37 +58,296 @@ class ImageFrame(NodeFrame):
     """
 
     def __init__(self, node, **kwds):
-        """ Create a new array viewer, to display *node*. """
-        NodeFrame.__init__(self, node, title=node.display_name, size=(800, 400), **kwds)
+        """ Create a new image viewer, to display *node*. """
+        NodeFrame.__init__(self, node, title=node.display_name, size=(800, 600), **kwds)
         self.node = node
 
+        self.status_bar = wx.StatusBar(self, -1)
+        self.status_bar.SetFieldsCount(2)
+        self.SetStatusBar(self.status_bar)
+
         p = ImagePanel(self, node)
         self.view = p
 
 
+class TileCache(object):
+
+    """
+    LRU cache of the tile bitmaps, bounded by their total size.
+
+    Tiles are keyed by (level, tile row, tile column).
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.tiles = collections.OrderedDict()
+
+    def get(self, key):
+        bmp = self.tiles.pop(key, None)
+        if bmp is not None:
+            self.tiles[key] = bmp  # most recently used
+        return bmp
+
+    def put(self, key, bmp):
+        if key in self.tiles:
+            return
+        self.tiles[key] = bmp
+        self.nbytes += bmp.GetWidth() * bmp.GetHeight() * 3
+        while self.nbytes > self.max_bytes and len(self.tiles) > 1:
+            _, old = self.tiles.popitem(last=False)
+            self.nbytes -= old.GetWidth() * old.GetHeight() * 3
+
+
+def tile_slices(level, row, col, height, width):
+    """ Image rows and columns (as slices with a step) covered by a tile """
+    step = 2 ** level
+    span = TILESIZE * step
+    rows = slice(row * span, min((row + 1) * span, height), step)
+    cols = slice(col * span, min((col + 1) * span, width), step)
+    return rows, cols
+
+
+def to_rgb(data):
+    """ Make a (h, w, 3) contiguous uint8 array out of the pixels returned by a node """
+    data = np.asarray(data)
+    if data.ndim == 2:  # greyscale
+        data = np.repeat(data[:, :, np.newaxis], 3, axis=2)
+    elif data.shape[2] > 3:  # e.g. RGBA
+        data = data[:, :, :3]
+    if data.dtype != np.uint8:
+        data = data.astype(np.uint8)
+    return np.ascontiguousarray(data)
+
+
 class ImagePanel(wx.Panel):
 
     """
     Panel inside the image viewer pane which displays the image.
+
+    Missing tiles of the visible region are read by a background thread; the
+    panel is refreshed as they arrive.
     """
 
     def __init__(self, parent, node):
-        """ Display a true color, pixel-interlaced (not pixel-planar) image
+        """ Display a compass_model.Image, tile by tile.
         """
-        wx.Panel.__init__(self, parent)
-        b = wx.BitmapFromBuffer(node.width, node.height, node.data)
-        b.CopyFromBuffer(node.data)
+        wx.Panel.__init__(self, parent, style=wx.WANTS_CHARS)
+        self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
+
+        self.node = node
+        self.width = node.width
+        self.height = node.height
+
+        self.zoom = None  # screen pixels per image pixel (set on the first paint, to fit)
+        self.origin = (0.0, 0.0)  # image (x, y) shown at the top left corner
+        self.drag_start = None
+
+        self.cache = TileCache()
+        self._shown = set()  # keys of the tiles visible at the last paint (see on_paint)
+
+        # keys of the visible tiles waiting to be read (the last one is read first)
+        self._wanted = collections.OrderedDict()
+        self._lock = threading.Condition()
+        self._stop = False
+
+        worker = threading.Thread(target=self._read_tiles, name="ImagePanel")
+        worker.daemon = True
+        worker.start()
+
+        self.Bind(wx.EVT_PAINT, self.on_paint)
+        self.Bind(wx.EVT_SIZE, self.on_size)
+        self.Bind(wx.EVT_MOUSEWHEEL, self.on_wheel)
+        self.Bind(wx.EVT_LEFT_DOWN, self.on_left_down)
+        self.Bind(wx.EVT_LEFT_UP, self.on_left_up)
+        self.Bind(wx.EVT_MOTION, self.on_motion)
+        self.Bind(wx.EVT_CHAR, self.on_char)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
+
+    # --- Geometry ------------------------------------------------------------
+
+    @property
+    def level(self):
+        """ Level of detail for the current zoom: tiles hold every 2**level pixel """
+        if self.zoom >= 1.0:
+            return 0
+        return int(math.floor(math.log(1.0 / self.zoom, 2)))
+
+    def fit(self):
+        """ Zoom so that the whole image fits the window """
+        w, h = self.GetClientSize()
+        zoom = min(max(w, 1) / self.width, max(h, 1) / self.height)
+        self.zoom = min(max(zoom, MIN_ZOOM), 1.0)
+        self.origin = (0.0, 0.0)
+        self.center()
+
+    def center(self):
+        """ Keep the image centered along the axes where it is smaller than the window """
+        w, h = self.GetClientSize()
+        x, y = self.origin
+        if self.width * self.zoom <= w:
+            x = (self.width - w / self.zoom) / 2
+        if self.height * self.zoom <= h:
+            y = (self.height - h / self.zoom) / 2
+        self.origin = (x, y)
+
+    def set_zoom(self, zoom, pos=None):
+        """ Change the zoom, keeping the image point under *pos* (default: the center) in place """
+        zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+        if pos is None:
+            w, h = self.GetClientSize()
+            pos = (w / 2, h / 2)
+        x, y = self.to_image(pos)
+        self.zoom = zoom
+        self.origin = (x - pos[0] / zoom, y - pos[1] / zoom)
+        self.center()
+        self.Refresh()
+        self.update_status(pos)
+
+    def to_image(self, pos):
+        """ Image (x, y) coordinates of a window position """
+        return self.origin[0] + pos[0] / self.zoom, self.origin[1] + pos[1] / self.zoom
+
+    def update_status(self, pos=None):
+        frame = self.GetTopLevelParent()
+        frame.status_bar.SetStatusText("Zoom: %.1f%%" % (self.zoom * 100.0), 0)
+        if pos is not None:
+            x, y = self.to_image(pos)
+            if 0 <= x < self.width and 0 <= y < self.height:
+                frame.status_bar.SetStatusText("x: %d, y: %d" % (x, y), 1)
+            else:
+                frame.status_bar.SetStatusText("", 1)
+
+    # --- Drawing -------------------------------------------------------------
+
+    def on_paint(self, evt):
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.SetBackground(wx.Brush(BACKGROUND))
+        dc.Clear()
+
+        if self.zoom is None:
+            self.fit()
+            self.update_status()
+
+        w, h = self.GetClientSize()
+        level = self.level
+        step = 2 ** level
+        span = TILESIZE * step
+
+        # visible tiles, clipped to the image
+        x0, y0 = self.to_image((0, 0))
+        x1, y1 = self.to_image((w, h))
+        col0, col1 = max(int(x0 // span), 0), min(int(x1 // span), (self.width - 1) // span)
+        row0, row1 = max(int(y0 // span), 0), min(int(y1 // span), (self.height - 1) // span)
+
+        # Tiles are drawn at their own resolution, scaled by the DC
+        scale = self.zoom * step
+        dc.SetUserScale(scale, scale)
+
+        # Only the tiles coming into view count as cache lookups, not every repaint of the same ones
+        missing = []
+        shown = set()
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                key = (level, row, col)
+                bmp = self.cache.get(key)
+                shown.add(key)
+                if key not in self._shown:
+                    instrument.record_cache(self.node.store, self.node.key, 'image tiles', bmp is not None)
+                if bmp is None:
+                    missing.append(key)
+                    continue
+                dc.DrawBitmap(bmp, int(round(col * TILESIZE - self.origin[0] / step)),
+                              int(round(row * TILESIZE - self.origin[1] / step)))
+        self._shown = shown
+
+        # Tiles no longer visible (e.g. after a pan or a zoom) are not read anymore
+        with self._lock:
+            self._wanted.clear()
+            for key in reversed(missing):
+                self._wanted[key] = None
+            self._lock.notify()
+
+    def on_tile_loaded(self, key, data):
+        """ Called (in the GUI thread) with the pixels of a tile """
+        if not self:
+            return
+        bmp = wx.BitmapFromBuffer(data.shape[1], data.shape[0], data)
+        self.cache.put(key, bmp)
+        if key[0] == self.level:
+            self.Refresh()
+
+    def _read_tiles(self):
+        """ Background thread: read the wanted tiles """
+        while True:
+            with self._lock:
+                while len(self._wanted) == 0 and not self._stop:
+                    self._lock.wait()
+                if self._stop:
+                    return
+                key, _ = self._wanted.popitem()
+
+            level, row, col = key
+            rows, cols = tile_slices(level, row, col, self.height, self.width)
+            try:
+                data = to_rgb(self.node.region(rows, cols))
+            except Exception as e:
+                log.warning("unable to read tile %s: %s" % (key, e))
+                continue
+            wx.CallAfter(self.on_tile_loaded, key, data)
+
+    # --- Events --------------------------------------------------------------
+
+    def on_size(self, evt):
+        if self.zoom is not None:
+            self.center()
+        self.Refresh()
+        evt.Skip()
+
+    def on_wheel(self, evt):
+        if evt.GetWheelRotation() > 0:
+            self.set_zoom(self.zoom * ZOOM_STEP, evt.GetPosition())
+        else:
+            self.set_zoom(self.zoom / ZOOM_STEP, evt.GetPosition())
+
+    def on_left_down(self, evt):
+        self.drag_start = (evt.GetPosition(), self.origin)
+        self.CaptureMouse()
+        self.SetFocus()
 
-        sizer = wx.BoxSizer(wx.HORIZONTAL)
+    def on_left_up(self, evt):
+        if self.HasCapture():
+            self.ReleaseMouse()
+        self.drag_start = None
 
-        sb = wx.StaticBitmap(self, wx.ID_ANY, b)
-        sizer.AddStretchSpacer()
-        sizer.Add(sb, 1, wx.EXPAND | wx.ALIGN_CENTER | wx.ALIGN_CENTER_VERTICAL)
-        sizer.AddStretchSpacer()
+    def on_motion(self, evt):
+        pos = evt.GetPosition()
+        if self.drag_start is not None and evt.Dragging():
+            start, origin = self.drag_start
+            self.origin = (origin[0] - (pos[0] - start[0]) / self.zoom,
+                           origin[1] - (pos[1] - start[1]) / self.zoom)
+            self.center()
+            self.Refresh()
+        if self.zoom is not None:
+            self.update_status(pos)
 
-        sizer2 = wx.BoxSizer(wx.VERTICAL)
-        sizer2.AddStretchSpacer()
-        sizer2.Add(sizer, 1)
-        sizer2.AddStretchSpacer()
+    def on_char(self, evt):
+        key = evt.GetKeyCode()
+        if key in (ord('+'), ord('=')):
+            self.set_zoom(self.zoom * ZOOM_STEP)
+        elif key == ord('-'):
+            self.set_zoom(self.zoom / ZOOM_STEP)
+        elif key == ord('0'):
+            self.fit()
+            self.Refresh()
+            self.update_status()
+        elif key == ord('1'):
+            self.set_zoom(1.0)
+        else:
+            evt.Skip()
 
-        self.SetSizer(sizer2)
+    def on_destroy(self, evt):
+        with self._lock:
+            self._stop = True
+            self._lock.notify()
+        evt.Skip()
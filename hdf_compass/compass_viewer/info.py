@@ -15,6 +15,8 @@ Defines the left-hand side information panel used to display context info.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import threading
+
 import wx
 
 import logging
@@ -30,12 +32,29 @@ PANEL_WIDTH = 200
 # Size of the main title font
 FONTSIZE = 16 if is_win else 18
 
+# Max number of node descriptions retained
+MAX_DESCRIPTIONS = 1000
+
+# Descriptions computed so far: (store url, key, node class) -> text; see forget_descriptions
+_descriptions = {}
+
+
+def forget_descriptions(url):
+    """ Drop the descriptions of the nodes of the store at *url* (called when the store is closed) """
+    for cache_key in [k for k in list(_descriptions) if k[0] == url]:
+        _descriptions.pop(cache_key, None)
+
 
 class InfoPanel(wx.Panel):
     """
     Panel displaying general information about the selected object.
 
     Designed to be displayed vertically; sets its own width (PANEL_WIDTH).
+
+    Describing a node may need I/O (e.g. to count its attributes), so the
+    description is computed on a background thread and cached by key.  Only
+    the latest node displayed is described; results for nodes that are no
+    longer selected are dropped.
     """
 
     def __init__(self, parent):
@@ -50,39 +69,93 @@ class InfoPanel(wx.Panel):
         self.name_text.SetFont(font)
 
         # Sidebar icon (see display method)
-        self.static_bitmap = None
+        self.static_bitmap = wx.StaticBitmap(self, wx.ID_ANY, wx.NullBitmap)
 
         # Descriptive text below the icon
         self.prop_text = wx.StaticText(self, style=wx.ALIGN_LEFT)
 
         self.sizer = sizer = wx.BoxSizer(wx.VERTICAL)
         sizer.Add(self.name_text, 0, wx.LEFT | wx.TOP | wx.RIGHT, border=20)
+        sizer.Add(self.static_bitmap, 0, wx.ALL, border=20)
         sizer.Add(self.prop_text, 0, wx.LEFT | wx.RIGHT, border=20)
         sizer.AddStretchSpacer(1)
         self.SetSizer(sizer)
 
         self.SetBackgroundColour(wx.Colour(255, 255, 255))
 
+        # Background description: (generation, cache key, node) waiting to be described
+        self._generation = 0
+        self._request = None
+        self._stop = False
+        self._cond = threading.Condition()
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
+
+        worker = threading.Thread(target=self._describe_worker, name="InfoPanel")
+        worker.daemon = True
+        worker.start()
+
     def display(self, node):
         """ Update displayed information on the node.
 
         See the get* methods for specifics on what's displayed.
         """
+        self._generation += 1
 
         self.name_text.SetLabel(node.display_name)
-        self.prop_text.SetLabel(describe(node))
 
-        if self.static_bitmap is not None:
-            self.sizer.Remove(self.static_bitmap)
-            self.static_bitmap.Destroy()
+        # The icon comes from the application-wide list of 64 px icons
+        imagelist = wx.GetApp().imagelists[64]
+        self.static_bitmap.SetBitmap(imagelist.GetBitmap(imagelist.get_index(type(node))))
+
+        cache_key = (node.store.url, node.key, type(node))
+        text = _descriptions.get(cache_key)
+        if text is None:
+            self.prop_text.SetLabel("%s\n\n..." % type(node).class_kind)
+            with self._cond:
+                self._request = (self._generation, cache_key, node)
+                self._cond.notify()
+        else:
+            self.prop_text.SetLabel(text)
 
-        # We load the PNG icon directly from the appropriate Node class
-        png = wx.Bitmap(type(node).icons[64], wx.BITMAP_TYPE_ANY)
-        self.static_bitmap = wx.StaticBitmap(self, wx.ID_ANY, png)
-        self.sizer.Insert(1, self.static_bitmap, 0, wx.ALL, border=20)
         self.sizer.Layout()
         self.Layout()
 
+    def _describe_worker(self):
+        """ Background thread: describe the latest requested node """
+        while True:
+            with self._cond:
+                while self._request is None and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                generation, cache_key, node = self._request
+                self._request = None
+
+            try:
+                text = describe(node)
+            except Exception as e:
+                log.info("unable to describe %s: %s" % (node.key, e))
+                text = "%s\n" % type(node).class_kind
+            else:
+                if len(_descriptions) >= MAX_DESCRIPTIONS:
+                    _descriptions.clear()
+                _descriptions[cache_key] = text
+            wx.CallAfter(self.on_described, generation, text)
+
+    def on_described(self, generation, text):
+        """ Called (in the GUI thread) with a description; stale ones are dropped """
+        if not self or generation != self._generation:
+            return
+        self.prop_text.SetLabel(text)
+        self.sizer.Layout()
+        self.Layout()
+
+    def on_destroy(self, evt):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        evt.Skip()
+
 
 def describe(node):
     """ Return a (possibly multi-line) text description of a node. """
@@ -96,19 +169,34 @@ def describe(node):
         desc += "%d items\n" % len(node)
     
     if not isinstance(node, compass_model.KeyValue):    
-        # see if there is a key-value handler for this node
+        # see if there is a key-value handler for this node (only those are instantiated)
         handlers = node.store.gethandlers(node.key)
         for h in handlers:
-            
+            if not issubclass(h, compass_model.KeyValue):
+                continue
+
             kv_node = h(node.store, node.key)
-            if isinstance(kv_node, compass_model.KeyValue):
+            metadata = kv_node.metadata()
+            if metadata is None:
                 num_keys = len(kv_node.keys)
                 if num_keys > 0:
-                    desc += "\n%d %s\n" % (len(kv_node.keys), type(kv_node).class_kind)
-            
+                    desc += "\n%d %s\n" % (num_keys, type(kv_node).class_kind)
+            elif len(metadata) > 0:
+                desc += "\n%d %s\n(%s)\n" % (len(metadata), type(kv_node).class_kind,
+                                             size_text(sum(m['size'] for m in metadata)))
+
     return desc
 
 
+def size_text(nbytes):
+    """ Human-readable storage size """
+    for unit in ("bytes", "KB", "MB"):
+        if nbytes < 1024:
+            return "%d %s" % (nbytes, unit) if unit == "bytes" else "%.1f %s" % (nbytes, unit)
+        nbytes /= 1024.0
+    return "%.1f GB" % nbytes
+
+
 def dtype_text(dt):
     """ String description appropriate for a NumPy dtype """
 
@@ -18,6 +18,9 @@ Presently this means all NumPy types, plus Python str/unicode.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
+import threading
+
 import wx
 
 import logging
@@ -47,9 +50,15 @@ class KeyValueFrame(NodeFrame):
 class KeyValueList(wx.ListCtrl):
 
     """
-    A simple list view of key/value attributes
+    A virtual list view of key/value attributes.
+
+    Values are read on demand: first those of the rows being displayed, then
+    all the others, in batches on a background thread.  Types and shapes come
+    from the node's metadata() when available, so they are shown right away.
     """
 
+    BATCH = 50  # Values read by the background thread before updating the list
+
     def __init__(self, parent, node):
         """ Create a new attribute list view.
 
@@ -57,44 +66,108 @@ class KeyValueList(wx.ListCtrl):
         node:   compass_model.KeyValue instance
         """
 
-        wx.ListCtrl.__init__(self, parent, style=wx.LC_REPORT | wx.LC_SINGLE_SEL | wx.BORDER_NONE | wx.LC_HRULES)
+        wx.ListCtrl.__init__(self, parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL | wx.BORDER_NONE |
+                             wx.LC_HRULES)
 
         self.node = node
-
-        self.InsertColumn(0, "Name")
-        self.InsertColumn(1, "Value")
-        self.InsertColumn(2, "Type")
-        self.InsertColumn(3, "Shape")
-
-        names = node.keys
-        values = [self.node[n] for n in names]
-
-        def itemtext(item, col_id):
-            name = names[item]
-            data = values[item]
-            text = ""
-            if col_id == 0:
-                text = name
-            elif col_id == 1:
-                text = str(data)
-            elif col_id == 2:
-                if hasattr(data, 'dtype'):
-                    text = str(data.dtype)
-                else:
-                    text = str(type(data))
-            elif col_id == 3:
-                if hasattr(data, 'shape'):
-                    text = str(data.shape)
-                else:
-                    text = "()"
-            return text
-
-        for n in names:
-            row = self.InsertStringItem(9999, n)
-            for col in xrange(1, 4):
-                self.SetStringItem(row, col, itemtext(row, col))
-
-        self.SetColumnWidth(0, 200)
-        self.SetColumnWidth(1, wx.LIST_AUTOSIZE)
-        self.SetColumnWidth(2, wx.LIST_AUTOSIZE)
-        self.SetColumnWidth(3, wx.LIST_AUTOSIZE)
+        self.names = list(node.keys)
+        self.texts = {}  # row -> (value, type, shape) texts, once the value is read
+
+        self.meta = {}
+        metadata = node.metadata()
+        if metadata is not None:
+            self.meta = dict((m['name'], m) for m in metadata)
+
+        self.InsertColumn(0, "Name", width=200)
+        self.InsertColumn(1, "Value", width=300)
+        self.InsertColumn(2, "Type", width=120)
+        self.InsertColumn(3, "Shape", width=100)
+        self.SetItemCount(len(self.names))
+
+        # rows requested by the list, to be read before the others
+        self._wanted = collections.deque()
+        self._requested = set()
+        self._lock = threading.Lock()
+        self._stop = False
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
+
+        worker = threading.Thread(target=self._load_values, name="KeyValueList")
+        worker.daemon = True
+        worker.start()
+
+    def _value_texts(self, row):
+        """ Read the value of a row, and return the texts for the Value, Type and Shape columns """
+        try:
+            data = self.node[self.names[row]]
+        except Exception as e:
+            log.info("unable to read %s: %s" % (self.names[row], e))
+            return "<%s>" % e, "", ""
+        if hasattr(data, 'dtype'):
+            type_text = str(data.dtype)
+        else:
+            type_text = str(type(data))
+        if hasattr(data, 'shape'):
+            shape_text = str(data.shape)
+        else:
+            shape_text = "()"
+        return str(data), type_text, shape_text
+
+    def _load_values(self):
+        """ Background thread: read all the values, the requested rows first """
+        pending = set(range(len(self.names)))
+        next_row = 0
+        while len(pending) > 0 and not self._stop:
+            batch = []
+            with self._lock:
+                while len(self._wanted) > 0 and len(batch) < self.BATCH:
+                    row = self._wanted.popleft()
+                    if row in pending:
+                        batch.append(row)
+                        pending.discard(row)
+            while len(batch) < self.BATCH and next_row < len(self.names):
+                if next_row in pending:
+                    batch.append(next_row)
+                    pending.discard(next_row)
+                next_row += 1
+
+            results = {}
+            for row in batch:
+                if self._stop:
+                    return
+                results[row] = self._value_texts(row)
+            wx.CallAfter(self.on_values_loaded, results)
+
+    def on_values_loaded(self, results):
+        """ Called (in the GUI thread) with a batch of value texts """
+        if not self:  # the list has been destroyed meanwhile
+            return
+        self.texts.update(results)
+        self.RefreshItems(min(results), max(results))
+
+    def on_destroy(self, evt):
+        self._stop = True
+        evt.Skip()
+
+    def OnGetItemText(self, item, col):
+        """ Callback providing the text of a cell """
+        name = self.names[item]
+        if col == 0:
+            return name
+
+        texts = self.texts.get(item)
+        if texts is not None:
+            return texts[col - 1]
+
+        if item not in self._requested:
+            self._requested.add(item)
+            with self._lock:
+                self._wanted.append(item)
+
+        if col == 1:
+            return "..."
+        meta = self.meta.get(name)
+        if meta is None:
+            return ""
+        if col == 2:
+            return str(meta['dtype'])
+        return str(meta['shape'])
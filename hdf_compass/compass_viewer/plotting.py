@@ -0,0 +1,55 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of the HDF Compass Viewer. The full HDF Compass          #
+# copyright notice, including terms governing use, modification, and         #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+
+"""
+Deferred loading of the Matplotlib-based plot windows.
+
+Importing matplotlib.pyplot, its wx backend and (for the geographic views)
+cartopy is slow, so the plot modules are only imported the first time the
+user asks for a plot.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import importlib
+import sys
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+_backend_set = False
+
+
+def init_matplotlib():
+    """ Select the WXAgg backend (only once), before pyplot gets imported. """
+    global _backend_set
+    if _backend_set:
+        return
+
+    import matplotlib
+    matplotlib.use('WXAgg')
+    log.debug("matplotlib %s" % matplotlib.__version__)
+    _backend_set = True
+
+
+def load(viewer):
+    """ Return the plot module of a viewer package (e.g. "array" or "geo_array").
+
+    Matplotlib is initialized, and the module imported, on the first call.
+    """
+    name = "hdf_compass.compass_viewer.%s.plot" % viewer
+    if name not in sys.modules:
+        t0 = time.time()
+        init_matplotlib()
+        importlib.import_module(name)
+        log.debug("%s loaded in %.1f ms" % (name, (time.time() - t0) * 1000.0))
+    return sys.modules[name]
@@ -17,6 +17,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import os
 import logging
+from collections import OrderedDict
 
 import wx
 
@@ -41,7 +42,7 @@ class TextFrame(NodeFrame):
     From top to bottom, has:
 
     1. Toolbar (see TextFrame.init_toolbar)
-    2. A TextCtrl, which displays the text.
+    2. A LineList, which displays the text (only the visible lines are read).
     """
 
     def __init__(self, node, pos=None):
@@ -51,8 +52,7 @@ class TextFrame(NodeFrame):
 
         self.node = node
 
-        self.txt = wx.TextCtrl(self, 1, style=wx.TE_MULTILINE | wx.TE_READONLY)
-        self.txt.SetValue(node.text)
+        self.txt = LineList(self, node)
 
         save_menu = wx.Menu()
         save_menu.Append(ID_SAVE_TEXT_MENU, "Save Text\tCtrl-T")
@@ -90,10 +90,67 @@ class TextFrame(NodeFrame):
         if save_file_dialog.ShowModal() == wx.ID_CANCEL:
             return     # the user changed idea...
 
-        # save the current contents in the file
-        # this can be done with e.g. wxPython output streams:
+        # the lines are written as they are read, without building the whole text
         with open(save_file_dialog.GetPath(), 'w') as fod:
-            fod.write(self.node.text)
+            for line in self.node.lines():
+                fod.write(line + "\n")
+
+
+class LineList(wx.ListCtrl):
+    """
+    Virtual list displaying the lines of a compass_model.Text node.
+
+    Lines are requested to the node only when shown, in chunks of CHUNK lines;
+    the most recently used chunks are cached.  Ctrl-C copies the selected lines.
+    """
+
+    CHUNK = 1000  # Lines requested at once
+    MAXCHUNKS = 20  # Max number of chunks to retain in the cache
+
+    def __init__(self, parent, node):
+        wx.ListCtrl.__init__(self, parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_NO_HEADER)
+        self.node = node
+        self.cache = OrderedDict()
+
+        self.SetFont(wx.Font(10, wx.FONTFAMILY_TELETYPE, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+        self.SetItemCount(node.line_count)
+
+        # virtual lists cannot auto-size: use the longest line of the first chunk
+        width = 400
+        if node.line_count > 0:
+            width = max(width, max(self.GetTextExtent(line)[0] for line in self.get_chunk(0)) + 20)
+        self.InsertColumn(0, "Text", width=width)
+
+        self.Bind(wx.EVT_MENU, self.on_copy, id=wx.ID_COPY)
+        self.SetAcceleratorTable(wx.AcceleratorTable([(wx.ACCEL_CTRL, ord('C'), wx.ID_COPY)]))
+
+    def get_chunk(self, start):
+        """ Lines starting at *start* (a multiple of CHUNK) """
+        chunk = self.cache.pop(start, None)
+        if chunk is None:
+            chunk = list(self.node.lines(start, start + self.CHUNK))
+            if len(self.cache) >= self.MAXCHUNKS:
+                self.cache.popitem(last=False)
+        self.cache[start] = chunk
+        return chunk
+
+    def OnGetItemText(self, item, col):
+        start = (item // self.CHUNK) * self.CHUNK
+        chunk = self.get_chunk(start)
+        if item - start >= len(chunk):
+            return ""
+        return chunk[item - start]
+
+    def on_copy(self, evt):
+        """ Copy the selected lines to the clipboard """
+        lines = []
+        item = self.GetFirstSelected()
+        while item != -1:
+            lines.append(self.OnGetItemText(item, 0))
+            item = self.GetNextSelected(item)
+        if len(lines) > 0 and wx.TheClipboard.Open():
+            wx.TheClipboard.SetData(wx.TextDataObject("\n".join(lines)))
+            wx.TheClipboard.Close()
 
 
 class XmlFrame(NodeFrame):
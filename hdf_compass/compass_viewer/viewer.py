@@ -17,13 +17,17 @@ Defines the App class, along with supporting infrastructure.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-# Must be at the top, to ensure we're the first to call matplotlib.use.
-import matplotlib
-matplotlib.use('WXAgg')
+import time
+_t_start = time.time()  # used to measure the startup time
 
+import os
 import sys
 import wx
 
+# Matplotlib is imported lazily (see plotting.py); the environment variable makes
+# sure WXAgg is picked even if some plugin imports matplotlib first.
+os.environ.setdefault('MPLBACKEND', 'WXAgg')
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -155,12 +159,14 @@ def open_node(node, pos=None):
 def open_store(url):
     """ Open the url using the first matching registered Store class.
 
+    If the resource is already open, the existing store is reused.
+
     Returns True if the url was successfully opened, False otherwise.
     """
-    stores = [x for x in compass_model.get_stores() if x.can_handle(url)]
+    stores = compass_model.stores_for(url)
 
     if len(stores) > 0:
-        instance = stores[0](url)
+        instance = compass_model.shared_store(stores[0], url)
         open_node(instance.root)
         return True
 
@@ -171,18 +177,32 @@ def can_open_store(url):
     """ checks url for first matching registered Store class.
 
     Returns True if the url can be successfully opened, False otherwise.
+
+    The store opened for the check is closed again, and not shared: it is up
+    to open_store to open (or reuse) the one which is kept.
     """
-    stores = [x for x in compass_model.get_stores() if x.can_handle(url)]
+    stores = compass_model.stores_for(url)
 
     if len(stores) > 0:
         instance = stores[0](url)
+        instance.close()
         return True
 
     return False
 
 
+# Signature of HDF5 files, found at offset 0, or after a user block of 512, 1024, 2048... bytes
+HDF5_MAGIC = b'\x89HDF\r\n\x1a\n'
+HDF5_MAGIC_OFFSETS = (0,) + tuple(512 << i for i in range(32))
+
+
 def load_plugins():
-    """ Helper function that attempts to load all the plugins """
+    """ Helper function that registers all the plugins.
+
+    Only the plugin manifests are registered here: each plugin module (and
+    its dependencies) is imported the first time a matching resource is
+    opened.  The import timings are logged at that point.
+    """
 
     # provide some info about the env in use
     import platform
@@ -190,64 +210,28 @@ def load_plugins():
                                               platform.uname()[0], platform.uname()[2], platform.uname()[4]))
     import numpy
     log.debug("numpy %s" % numpy.__version__)
-    log.debug("matplotlib %s" % matplotlib.__version__)
     log.debug("wxPython %s" % wx.__version__)
 
-    from hdf_compass import compass_model
-
-    try:
-        from hdf_compass import filesystem_model
-    except ImportError:
-        log.warning("Filesystem plugin: NOT loaded")
-
-    try:
-        from hdf_compass import array_model
-    except ImportError:
-        log.warning("Array plugin: NOT loaded")
-
-    try:
-        from hdf_compass import hdf5_model
-        import h5py
-        log.debug("h5py %s" % h5py.__version__)
-    except ImportError:
-        log.warning("HDF5 plugin: NOT loaded")
-
-    try:
-        from hdf_compass import bag_model
-        from hydroffice import bag
-        from lxml import etree
-        log.debug("hydroffice.bag %s" % bag.__version__)
-        log.debug("lxml %s (libxml %s, libxslt %s)"
-                  % (etree.__version__, ".".join(str(i) for i in etree.LIBXML_VERSION),
-                     ".".join(str(i) for i in etree.LIBXSLT_VERSION)))
-    except (ImportError, OSError):
-        log.warning("BAG plugin: NOT loaded")
-
-    try:
-        from hdf_compass import asc_model
-    except ImportError:
-        log.warning("Ascii grid plugin: NOT loaded")
-
-    try:
-        from hdf_compass import opendap_model
-        from pydap import lib
-        log.debug("pydap %s (protocol %s)"
-                  % (".".join(str(i) for i in lib.__version__), ".".join(str(i) for i in lib.__dap__)))
-    except ImportError:
-        log.warning("Opendap plugin: NOT loaded")
-    
-    from hdf_compass import hdf5rest_model    
-    try:
-        from hdf_compass import hdf5rest_model
-    except ImportError:
-        log.warning("HDF5 REST plugin: NOT loaded")
-
-    try:
-        from hdf_compass import adios_model
-        import adios
-        log.debug("ADIOS %s" % adios.__version__)
-    except ImportError:
-        log.warning("ADIOS plugin: NOT loaded")
+    # Later entries take precedence (e.g. BAG over HDF5 for a .bag file)
+    plugins = [
+        compass_model.Plugin("Filesystem", "hdf_compass.filesystem_model", "Filesystem"),
+        compass_model.Plugin("Array", "hdf_compass.array_model", "ArrayStore", schemes=('array',)),
+        compass_model.Plugin("HDF5", "hdf_compass.hdf5_model", "HDF5Store",
+                             file_extensions={'HDF5 File': ['*.hdf5', '*.h5']}, magic=(HDF5_MAGIC,),
+                             magic_offsets=HDF5_MAGIC_OFFSETS, requires=('h5py',)),
+        compass_model.Plugin("BAG", "hdf_compass.bag_model", "BAGStore",
+                             file_extensions={'BAG File': ['*.bag']}, requires=('hydroffice.bag', 'lxml.etree')),
+        compass_model.Plugin("Ascii grid", "hdf_compass.asc_model", "AsciiGrid",
+                             file_extensions={'ASC File': ['*.asc']}),
+        compass_model.Plugin("Opendap", "hdf_compass.opendap_model", "Server", schemes=('http', 'https'),
+                             requires=('pydap.lib',)),
+        compass_model.Plugin("HDF5 REST", "hdf_compass.hdf5rest_model", "HDF5RestStore", schemes=('http', 'https'),
+                             requires=('requests',)),
+        compass_model.Plugin("ADIOS", "hdf_compass.adios_model", "ADIOSStore",
+                             file_extensions={'ADIOS File': ['*.bp']}, requires=('adios',)),
+    ]
+    for plugin in plugins:
+        compass_model.register_plugin(plugin)
 
 
 def run():
@@ -257,6 +241,10 @@ def run():
 
     app = CompassApp(False)
 
+    # I/O statistics can also be enabled from Help > Performance
+    if os.environ.get('HDF_COMPASS_INSTRUMENT'):
+        compass_model.instrument.enable()
+
     load_plugins()
 
     urls = sys.argv[1:]
@@ -275,4 +263,13 @@ def run():
     else:
         f.Show()
 
+    # Matplotlib (and cartopy) are only loaded on the first plot; see plotting.py
+    wx.CallAfter(on_startup_done)
+
     app.MainLoop()
+
+
+def on_startup_done():
+    """ Called once the event loop runs, with the initial frame shown: logs the startup time. """
+    elapsed = time.time() - _t_start
+    log.debug("startup: initial frame shown after %.1f ms" % (elapsed * 1000.0))
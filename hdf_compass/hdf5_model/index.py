@@ -0,0 +1,177 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of the HDF Compass Viewer. The full HDF Compass          #
+# copyright notice, including terms governing use, modification, and         #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+
+"""
+Metadata index of an HDF5 file.
+
+The file is walked once (with visititems), and for each object the index
+records its type, shape, dtype, chunking, filters and attributes (with the
+values of short scalar and string ones, see attr_value), as well as the
+member names of each group.  The index is saved as gzipped JSON
+in the per-user cache folder (see HDF5Store.sidecar_path, which keys it by
+file path, modification time and size), so that later opens of the same
+file can answer most questions without touching the file.
+
+Objects reachable only through soft links, or through a second hard link,
+are not indexed: the index is only trusted for the paths it knows about.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import namedtuple
+import gzip
+import json
+import numbers
+import posixpath as pp
+
+import numpy as np
+import h5py
+
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from hdf_compass.utils import replace_file
+
+# Bumped when the format of the index changes
+VERSION = 2
+
+# Longest string attribute value recorded in the index
+MAX_ATTR_CHARS = 256
+
+# Information about an object (attrs: name -> value or None; text: the dataset holds strings, see is_text_dtype)
+IndexEntry = namedtuple('IndexEntry', 'kind shape dtype chunks filters attrs text')
+
+
+def is_text_dtype(dtype):
+    """ True for (fixed or variable length) string dtypes """
+    if dtype.kind in 'SU':
+        return True
+    return h5py.check_dtype(vlen=dtype) in (bytes, type(u''))
+
+
+def dataset_filters(dset):
+    """ Names of the filters of a dataset, e.g. ['gzip:4', 'shuffle'] """
+    filters = []
+    if dset.compression is not None:
+        if dset.compression_opts is not None:
+            filters.append("%s:%s" % (dset.compression, dset.compression_opts))
+        else:
+            filters.append("%s" % dset.compression)
+    if dset.shuffle:
+        filters.append('shuffle')
+    if dset.fletcher32:
+        filters.append('fletcher32')
+    if dset.scaleoffset is not None:
+        filters.append('scaleoffset:%s' % dset.scaleoffset)
+    return filters
+
+
+def attr_value(attrs, name):
+    """ Value of a scalar number or short string attribute, as a JSON-compatible type; otherwise None """
+    try:
+        value = attrs[name]
+    except Exception:  # unsupported types
+        return None
+    if isinstance(value, np.ndarray):
+        if value.size != 1:
+            return None
+        value = value.reshape(())[()]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if isinstance(value, type(u'')):
+        return value if len(value) <= MAX_ATTR_CHARS else None
+    if isinstance(value, numbers.Real):
+        return value
+    return None
+
+
+def describe(obj):
+    """ The index record of an HDF5 object (a list, see IndexEntry) """
+    attrs = dict((name, attr_value(obj.attrs, name)) for name in obj.attrs)
+    if isinstance(obj, h5py.Dataset):
+        shape = None if obj.shape is None else list(obj.shape)
+        chunks = None if obj.chunks is None else list(obj.chunks)
+        return ['dataset', shape, "%s" % obj.dtype, chunks, dataset_filters(obj), attrs, is_text_dtype(obj.dtype)]
+    if isinstance(obj, h5py.Group):
+        return ['group', None, None, None, [], attrs, False]
+    return ['datatype', None, "%s" % obj.dtype, None, [], attrs, False]
+
+
+class FileIndex(object):
+    """ Index of the objects of an HDF5 file, keyed by full path (e.g. "/group/dataset"). """
+
+    def __init__(self, objects, children):
+        self.objects = objects  # path -> record (see describe)
+        self.children = children  # group path -> member names, in file order
+
+    @classmethod
+    def build(cls, f):
+        """ Walk the whole file *f* (an open h5py.File) """
+        objects = {'/': describe(f['/'])}
+        children = {'/': list(f['/'])}
+
+        def visit(name, obj):
+            path = '/' + name
+            objects[path] = describe(obj)
+            if isinstance(obj, h5py.Group):
+                children[path] = list(obj)
+
+        f.visititems(visit)
+        return cls(objects, children)
+
+    @classmethod
+    def load(cls, path):
+        """ Load an index saved by save(), or return None """
+        try:
+            with gzip.open(path, 'rb') as fid:
+                content = json.loads(fid.read().decode('utf-8'))
+        except (IOError, OSError, ValueError) as e:
+            log.info("unable to load %s: %s" % (path, e))
+            return None
+        if content.get('version') != VERSION:
+            return None
+        return cls(content['objects'], content['children'])
+
+    def save(self, path):
+        """ Save the index (atomically, through a temporary file) """
+        tmp = path + '.tmp'
+        content = {'version': VERSION, 'objects': self.objects, 'children': self.children}
+        try:
+            with gzip.open(tmp, 'wb') as fod:
+                fod.write(json.dumps(content, separators=(',', ':')).encode('utf-8'))
+            replace_file(tmp, path)
+            log.debug("saved %s" % path)
+        except (IOError, OSError) as e:
+            log.info("unable to save %s: %s" % (path, e))
+
+    def __len__(self):
+        return len(self.objects)
+
+    def entry(self, key):
+        """ The IndexEntry of *key*, or None if the object is not indexed """
+        record = self.objects.get(key)
+        if record is None:
+            return None
+        return IndexEntry(*record)
+
+    def contains(self, key):
+        """ True if *key* is known to exist (False means "unknown") """
+        if key in self.objects:
+            return True
+        names = self.children.get(pp.dirname(key))
+        return names is not None and pp.basename(key) in names
+
+    def names(self, key):
+        """ Member names of the group *key*, or None if not indexed """
+        return self.children.get(key)
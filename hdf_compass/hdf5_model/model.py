@@ -16,10 +16,15 @@ Implementation of compass_model classes for HDF5 files.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from itertools import groupby
+import json
+import os
 import sys
+import threading
+import time
 import os.path as op
 import posixpath as pp
 
+import numpy as np
 import h5py
 
 import logging
@@ -28,7 +33,12 @@ log.addHandler(logging.NullHandler())
 
 # Py2App can't successfully import otherwise
 from hdf_compass import compass_model
-from hdf_compass.utils import url2path
+from hdf_compass.utils import url2path, sidecar_path, remove_stale_sidecars, replace_file
+from .index import FileIndex, is_text_dtype
+from .search import Searcher, QueryError
+
+# If set, files without a metadata index are indexed in the background when opened (see HDF5Store.start_indexing)
+AUTO_INDEX = bool(os.environ.get('HDF_COMPASS_INDEX'))
 
 
 def sort_key(name):
@@ -44,6 +54,12 @@ class HDF5Store(compass_model.Store):
     Data store implementation using an HDF5 file.
 
     Keys are the full names of objects in the file.
+
+    Once a metadata index of the file is available (see index.py), it is used
+    to answer __contains__, gethandlers and group listings without reading
+    the file.  The index saved by a previous session is loaded in the
+    background once the store is kept open (see start_background_work); a new
+    one is built with start_indexing().
     """
     @staticmethod
     def plugin_name():
@@ -56,8 +72,29 @@ class HDF5Store(compass_model.Store):
     file_extensions = {'HDF5 File': ['*.hdf5', '*.h5']}
 
     def __contains__(self, key):
+        index = self.index
+        if index is not None and index.contains(key):
+            return True
         return key in self.f
 
+    def gethandlers(self, key=None):
+        index = self.index
+        entry = index.entry(key) if key is not None and index is not None else None
+        if entry is None:
+            return compass_model.Store.gethandlers(self, key)
+
+        # Handlers may decide from the index entry alone (None means they need the file)
+        t0 = time.time()
+        handlers = []
+        for nc in compass_model.Store.gethandlers(self):
+            answer = nc.can_handle_entry(entry) if hasattr(nc, 'can_handle_entry') else None
+            if answer is None:
+                answer = nc.can_handle(self, key)
+            if answer:
+                handlers.append(nc)
+        compass_model.instrument.record(self, key, 'probe', time.time() - t0)
+        return handlers
+
     @property
     def url(self):
         return self._url
@@ -92,10 +129,124 @@ class HDF5Store(compass_model.Store):
         self._url = url
         path = url2path(url)
         self.f = h5py.File(path, 'r')
+        self.scales = {}  # (dataset key, dim) -> (label, values) or None, see HDF5Dataset.scale
+
+        self.index = None  # FileIndex, once loaded or built
+        self._loading = None
+        self._indexing = None
+        self._searcher = None
 
     def close(self):
+        self.scales.clear()
         self.f.close()
 
+    def start_background_work(self):
+        if self._loading is None:
+            self._loading = threading.Thread(target=self._load_index, name="HDF5Index")
+            self._loading.daemon = True
+            self._loading.start()
+
+    def _load_index(self):
+        """ Background thread: load the saved index of the file, or build one if AUTO_INDEX is set """
+        path = self.sidecar_path('index', 'json.gz')
+        if path is not None and op.exists(path):
+            t0 = time.time()
+            index = FileIndex.load(path)
+            if index is not None:
+                log.debug("loaded index of %d objects in %.1f ms" % (len(index), (time.time() - t0) * 1000.0))
+                self.index = index
+                return
+        if AUTO_INDEX:
+            self._build_index()
+
+    def start_indexing(self):
+        """ Build (and save) the metadata index of the file in the background, unless already available.
+
+        Returns the thread doing the work, or None.
+        """
+        if self.index is not None or self._indexing is not None:
+            return self._indexing
+        self._indexing = threading.Thread(target=self._build_index, name="HDF5Indexer")
+        self._indexing.daemon = True
+        self._indexing.start()
+        return self._indexing
+
+    @property
+    def can_search(self):
+        return True
+
+    def search(self, query, key="/"):
+        """ Objects below the group *key* matching *query* (see search.py), as an HDF5SearchResults container.
+
+        The file is indexed first if needed, which may take a while for big files.
+        """
+        if self.index is None and self._loading is not None:
+            self._loading.join()  # the saved index may be about to be available
+        if self.index is None:
+            indexing = self.start_indexing()
+            if indexing is not None:
+                indexing.join()
+        if self.index is None:
+            raise QueryError("unable to index %s" % self.url)
+        searcher = self._searcher
+        if searcher is None or searcher.index is not self.index:
+            searcher = self._searcher = Searcher(self.index)
+        t0 = time.time()
+        paths = searcher.search(query, key)
+        log.debug("search '%s' in %s: %d results in %.1f ms" % (query, key, len(paths), (time.time() - t0) * 1000.0))
+        return HDF5SearchResults(self, key, query, paths)
+
+    def _build_index(self):
+        t0 = time.time()
+        try:
+            index = FileIndex.build(self.f)
+        except Exception as e:  # e.g. the file was closed meanwhile
+            log.info("unable to index %s: %s" % (self.url, e))
+            return
+        log.debug("indexed %d objects in %.1f ms" % (len(index), (time.time() - t0) * 1000.0))
+        self.index = index
+        path = self.sidecar_path('index', 'json.gz')
+        if path is not None:
+            remove_stale_sidecars(path)
+            index.save(path)
+
+    def sidecar_path(self, name, ext):
+        """ Path of a per-file cache in the *name* cache folder (see utils.sidecar_path), or None """
+        return sidecar_path(name, self.f.filename, ext)
+
+    def _load_sidecar(self, path):
+        if path is None or not op.exists(path):
+            return {}
+        try:
+            with open(path) as fid:
+                return json.load(fid)
+        except (IOError, OSError, ValueError) as e:
+            log.info("unable to load %s: %s" % (path, e))
+            return {}
+
+    def _write_sidecar(self, path, content):
+        """ Write a JSON sidecar, removing those of older versions of the file """
+        remove_stale_sidecars(path)
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as fod:
+                json.dump(content, fod)
+            replace_file(tmp, path)
+            log.debug("saved %s" % path)
+        except (IOError, OSError) as e:
+            log.info("unable to save %s: %s" % (path, e))
+
+    def load_stats(self, key):
+        return self._load_sidecar(self.sidecar_path('stats', 'json')).get(key)
+
+    def save_stats(self, key, stats):
+        path = self.sidecar_path('stats', 'json')
+        if path is None:
+            return
+        content = self._load_sidecar(path)
+        content[key] = stats
+        self._write_sidecar(path, content)
+
     def get_parent(self, key):
         # HDFCompass requires the parent of the root container be None
         if key == "" or key == "/":
@@ -115,13 +266,18 @@ class HDF5Group(compass_model.Container):
     def can_handle(store, key):
         return key in store and isinstance(store.f[key], h5py.Group)
 
+    @staticmethod
+    def can_handle_entry(entry):
+        return entry.kind == 'group'
+
     @property
     def _names(self):
 
         # Lazily build the list of names; this helps when browsing big files
         if self._xnames is None:
 
-            self._xnames = list(self._group)
+            names = self.store.index.names(self.key) if self.store.index is not None else None
+            self._xnames = list(self._group) if names is None else names[:]
 
             # Natural sort is expensive
             if len(self._xnames) < 1000:
@@ -132,9 +288,16 @@ class HDF5Group(compass_model.Container):
     def __init__(self, store, key):
         self._store = store
         self._key = key
-        self._group = store.f[key]
+        self._xgroup = None
         self._xnames = None
 
+    @property
+    def _group(self):
+        # Opened on demand, as the listing may come from the index
+        if self._xgroup is None:
+            self._xgroup = self.store.f[self.key]
+        return self._xgroup
+
     @property
     def key(self):
         return self._key
@@ -159,6 +322,10 @@ class HDF5Group(compass_model.Container):
         return 'Group "%s" (%d members)' % (self.display_name, len(self))
 
     def __len__(self):
+        if self._xnames is None and self.store.index is not None:
+            names = self.store.index.names(self.key)
+            if names is not None:
+                return len(names)
         return len(self._group)
 
     def __iter__(self):
@@ -170,6 +337,55 @@ class HDF5Group(compass_model.Container):
         return self.store[pp.join(self.key, name)]
 
 
+class HDF5SearchResults(compass_model.Container):
+    """ The objects found by HDF5Store.search, displayed like the members of a group.
+
+    Not registered as a handler: instances only come from HDF5Store.search.
+    """
+
+    class_kind = "HDF5 Search Results"
+
+    @staticmethod
+    def can_handle(store, key):
+        return False
+
+    def __init__(self, store, key, query, paths):
+        self._store = store
+        self._key = key  # the group searched
+        self.query = query
+        self.paths = paths
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def display_name(self):
+        return 'Search "%s"' % self.query
+
+    @property
+    def display_title(self):
+        return '%s %s (search "%s")' % (self.store.display_name, self.key, self.query)
+
+    @property
+    def description(self):
+        return 'Search "%s" in %s (%d results)' % (self.query, self.key, len(self))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        for path in self.paths:
+            yield self.store[path]
+
+    def __getitem__(self, idx):
+        return self.store[self.paths[idx]]
+
+
 class HDF5Dataset(compass_model.Array):
     """ Represents an HDF5 dataset. """
 
@@ -179,6 +395,10 @@ class HDF5Dataset(compass_model.Array):
     def can_handle(store, key):
         return key in store and isinstance(store.f[key], h5py.Dataset)
 
+    @staticmethod
+    def can_handle_entry(entry):
+        return entry.kind == 'dataset'
+
     def __init__(self, store, key):
         self._store = store
         self._key = key
@@ -208,9 +428,25 @@ class HDF5Dataset(compass_model.Array):
     def dtype(self):
         return self._dset.dtype
 
+    @property
+    def chunks(self):
+        return self._dset.chunks
+
     def __getitem__(self, args):
         return self._dset[args]
 
+    def read_fields(self, names, args=()):
+        if not isinstance(args, tuple):
+            args = (args,)
+        data = self._dset[tuple(names) + args]
+        if len(names) == 1:
+            # h5py returns a single field as a plain array
+            field_dtype = self.dtype.fields[names[0]][0]
+            out = np.empty(data.shape[:data.ndim - len(field_dtype.shape)], dtype=[(names[0], field_dtype)])
+            out[names[0]] = data
+            data = out
+        return data
+
     def is_plottable(self):
         if self.dtype.kind == 'S':
             log.debug("Not plottable since ASCII String (characters: %d)" % self.dtype.itemsize)
@@ -220,8 +456,30 @@ class HDF5Dataset(compass_model.Array):
             return False
         return True
 
+    def scale(self, dim):
+        """ The first dimension scale attached to *dim* (read once per store) """
+        cache_key = (self.key, dim)
+        if cache_key not in self.store.scales:
+            self.store.scales[cache_key] = self._read_scale(dim)
+        return self.store.scales[cache_key]
+
+    def _read_scale(self, dim):
+        try:
+            dims = self._dset.dims[dim]
+            if len(dims) == 0:
+                return None
+            sc = dims[0]
+            if len(sc.shape) != 1 or sc.shape[0] != self.shape[dim] or sc.dtype.kind not in 'iuf':
+                log.debug("ignoring scale %s of %s: not a numeric vector as long as dim %d" % (sc.name, self.key, dim))
+                return None
+            label = dims.label or pp.basename(sc.name)
+            return label, sc[...]
+        except Exception as e:
+            log.debug("unable to read the scale of dim %d of %s: %s" % (dim, self.key, e))
+            return None
+
 
-class HDF5Text(compass_model.Text):
+class HDF5Text(compass_model.StringArrayText):
     """ Represents a text array (both ASCII and UNICODE). """
 
     class_kind = "HDF5 Dataset[text]"
@@ -229,15 +487,13 @@ class HDF5Text(compass_model.Text):
     @staticmethod
     def can_handle(store, key):
         if key in store and isinstance(store.f[key], h5py.Dataset):
-            if store.f[key].dtype.kind == 'S':
-                # log.debug("ASCII String (characters: %d)" % DATA[key].dtype.itemsize)
-                return True
-            if store.f[key].dtype.kind == 'U':
-                # log.debug("Unicode String (characters: %d)" % DATA[key].dtype.itemsize)
-                return True
-
+            return is_text_dtype(store.f[key].dtype)
         return False
 
+    @staticmethod
+    def can_handle_entry(entry):
+        return entry.kind == 'dataset' and entry.text
+
     def __init__(self, store, key):
         self._store = store
         self._key = key
@@ -263,29 +519,6 @@ class HDF5Text(compass_model.Text):
     def shape(self):
         return self.data.shape
 
-    @property
-    def text(self):
-        txt = str()
-
-        if len(self.shape) == 0:
-            # print(type(self.data))
-            txt += str(self.data[()])
-
-        elif len(self.shape) == 1:
-            for el in self.data:
-                txt += el + ", \n"
-
-        elif len(self.shape) == 2:
-            for i in range(self.shape[0]):
-                for j in range(self.shape[1]):
-                    txt += self.data[i, j] + ", "
-                txt += "\n"
-
-        else:
-            txt = ">> display of more than 2D string array not implemented <<"
-
-        return txt
-
 
 class HDF5KV(compass_model.KeyValue):
     """ A KeyValue node used for HDF5 attributes. """
@@ -296,11 +529,15 @@ class HDF5KV(compass_model.KeyValue):
     def can_handle(store, key):
         return key in store.f
 
+    @staticmethod
+    def can_handle_entry(entry):
+        return True
+
     def __init__(self, store, key):
         self._store = store
         self._key = key
         self._obj = store.f[key]
-        self._names = self._obj.attrs.keys()
+        self._names = list(self._obj.attrs.keys())
 
     @property
     def key(self):
@@ -326,6 +563,58 @@ class HDF5KV(compass_model.KeyValue):
     def __getitem__(self, name):
         return self._obj.attrs[name]
 
+    def metadata(self):
+        """ Names, types, shapes and storage sizes, from the attribute headers only """
+        md = []
+        for name in self._names:
+            aid = self._obj.attrs.get_id(name)
+            if aid.shape is None or 0 in aid.shape:  # empty (null dataspace) or zero-size attribute
+                size = 0
+            else:
+                try:
+                    size = aid.get_storage_size()
+                except RuntimeError as e:
+                    log.debug("unable to get the storage size of attribute %s: %s" % (name, e))
+                    size = 0
+            md.append({'name': name, 'dtype': aid.dtype, 'shape': aid.shape if aid.shape is not None else (),
+                       'size': size})
+        return md
+
+
+def image_attr(obj, name):
+    """ String attribute of the HDF5 image standard (e.g. CLASS), or None """
+    value = obj.attrs.get(name)
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    return value
+
+
+def read_region(dset, rows, cols, planes=False):
+    """ Read dset[rows, cols] (dset[:, rows, cols] for an image with *planes*)
+
+    A strided selection of a chunked dataset still reads every chunk it crosses, and HDF5
+    then picks the pixels one by one: the wanted rows are instead read as contiguous
+    bands, one chunk row at a time (which bounds the memory used), and subsampled in memory.
+    """
+    lead = (slice(None),) if planes else ()
+    r0, r1, r_step = rows.indices(dset.shape[-2])
+    c0, c1, c_step = cols.indices(dset.shape[-1])
+    if dset.chunks is None or (r_step == 1 and c_step == 1) or r0 >= r1 or c0 >= c1:
+        return dset[lead + (rows, cols)]
+
+    c1 = c0 + (c1 - 1 - c0) // c_step * c_step + 1  # just past the last wanted column
+    band = dset.chunks[-2]
+    parts = []
+    start = r0
+    while start < r1:
+        # wanted rows up to the end of the chunk row holding *start*
+        end = min((start // band + 1) * band, r1)
+        stop = start + (end - 1 - start) // r_step * r_step + 1
+        block = dset[lead + (slice(start, stop), slice(c0, c1))]
+        parts.append(block[..., ::r_step, ::c_step])
+        start = stop - 1 + r_step
+    return np.concatenate(parts, axis=-2)
+
 
 class HDF5Image(compass_model.Image):
     """
@@ -339,14 +628,21 @@ class HDF5Image(compass_model.Image):
         if key not in store:
             return False
         obj = store.f[key]
-        if obj.attrs.get('CLASS') != 'IMAGE':
+        if image_attr(obj, 'CLASS') != 'IMAGE':
             return False
-        if obj.attrs.get('IMAGE_SUBCLASS') != 'IMAGE_TRUECOLOR':
+        if image_attr(obj, 'IMAGE_SUBCLASS') != 'IMAGE_TRUECOLOR':
             return False
-        if obj.attrs.get('INTERLACE_MODE') != 'INTERLACE_PIXEL':
+        if image_attr(obj, 'INTERLACE_MODE') != 'INTERLACE_PIXEL':
             return False
         return True
 
+    @staticmethod
+    def can_handle_entry(entry):
+        # The attribute values are not indexed: only datasets with a CLASS attribute need checking
+        if entry.kind != 'dataset' or 'CLASS' not in entry.attrs:
+            return False
+        return None
+
     def __init__(self, store, key):
         self._store = store
         self._key = key
@@ -385,6 +681,98 @@ class HDF5Image(compass_model.Image):
     def data(self):
         return self._obj[:]
 
+    def region(self, rows, cols):
+        return read_region(self._obj, rows, cols)
+
+
+class HDF5PlaneImage(HDF5Image):
+    """
+    True-color images stored plane by plane, as a (3, height, width) dataset.
+    """
+
+    class_kind = "HDF5 Truecolor Image (planes)"
+
+    @staticmethod
+    def can_handle(store, key):
+        if key not in store:
+            return False
+        obj = store.f[key]
+        if image_attr(obj, 'CLASS') != 'IMAGE':
+            return False
+        if image_attr(obj, 'IMAGE_SUBCLASS') != 'IMAGE_TRUECOLOR':
+            return False
+        if image_attr(obj, 'INTERLACE_MODE') != 'INTERLACE_PLANE':
+            return False
+        return isinstance(obj, h5py.Dataset) and len(obj.shape) == 3
+
+    @property
+    def width(self):
+        return self._obj.shape[2]
+
+    @property
+    def height(self):
+        return self._obj.shape[1]
+
+    @property
+    def data(self):
+        return self.region(slice(None), slice(None))
+
+    def region(self, rows, cols):
+        # the three planes of the region are interleaved by a single transpose
+        return np.ascontiguousarray(np.transpose(read_region(self._obj, rows, cols, planes=True), (1, 2, 0)))
+
+
+# Colors of indexed images without a palette
+GREY_RAMP = np.repeat(np.arange(256, dtype=np.uint8)[:, np.newaxis], 3, axis=1)
+
+
+class HDF5IndexedImage(HDF5Image):
+    """
+    Indexed images: each pixel is an index in the palette referenced by the
+    PALETTE attribute (a grey ramp is used if there is none).
+    """
+
+    class_kind = "HDF5 Indexed Image"
+
+    @staticmethod
+    def can_handle(store, key):
+        if key not in store:
+            return False
+        obj = store.f[key]
+        if image_attr(obj, 'CLASS') != 'IMAGE':
+            return False
+        subclass = image_attr(obj, 'IMAGE_SUBCLASS')
+        if subclass != 'IMAGE_INDEXED' and not (subclass is None and 'PALETTE' in obj.attrs):
+            return False
+        return isinstance(obj, h5py.Dataset) and len(obj.shape) == 2
+
+    def __init__(self, store, key):
+        HDF5Image.__init__(self, store, key)
+        self._palette = None
+
+    @property
+    def palette(self):
+        """ The default palette (the first one referenced), as a (n, 3) uint8 array """
+        if self._palette is None and 'PALETTE' in self._obj.attrs:
+            try:
+                ref = np.asarray(self._obj.attrs['PALETTE']).flat[0]
+                pal = self._obj.file[ref][...]
+                self._palette = np.ascontiguousarray(pal.reshape(-1, 3).astype(np.uint8))
+            except Exception as e:
+                log.warning("unable to read the palette of %s: %s" % (self.key, e))
+        return self._palette
+
+    @property
+    def data(self):
+        return self.region(slice(None), slice(None))
+
+    def region(self, rows, cols):
+        lut = self.palette
+        if lut is None:
+            lut = GREY_RAMP
+        # a single lookup for the whole region (out-of-range indices get the last color)
+        return np.take(lut, read_region(self._obj, rows, cols), axis=0, mode='clip')
+
 
 # Register handlers    
 HDF5Store.push(HDF5KV)
@@ -392,5 +780,7 @@ HDF5Store.push(HDF5Dataset)
 HDF5Store.push(HDF5Text)
 HDF5Store.push(HDF5Group)
 HDF5Store.push(HDF5Image)
+HDF5Store.push(HDF5PlaneImage)
+HDF5Store.push(HDF5IndexedImage)
 
 compass_model.push(HDF5Store)
@@ -0,0 +1,307 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of the HDF Compass Viewer. The full HDF Compass          #
+# copyright notice, including terms governing use, modification, and         #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+
+"""
+Search of the objects of an HDF5 file, using its metadata index (see index.py).
+
+A query is a list of terms separated by spaces, all of which must match:
+
+    temp                 path contains "temp" (case insensitive)
+    re:^/data/.*_[0-9]$  path matches the regular expression
+    kind:dataset         object kind: group, dataset or datatype
+    dtype:float          dtype name starts with "float" (e.g. float32, float64)
+    ndim:2               number of dimensions
+    shape:*x1024         shape, with * for any extent
+    attr:units           has an attribute "units"
+    attr:units=K         attribute "units" equals "K" (or the number K)
+    attr:title~storm     attribute "title" contains "storm" (case insensitive)
+    text:storm           some string attribute contains "storm" (case insensitive)
+
+Values with spaces can be quoted, e.g. attr:title~"storm track".
+
+Paths and string attribute values (one line per value) are each kept as one
+newline-separated string, so that matching them is a single regular
+expression scan; the other terms use
+tables built on first use.  Terms are combined as boolean masks over the
+objects, so queries take milliseconds even for millions of objects.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from bisect import bisect_left
+import re
+import numbers
+
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from .index import IndexEntry
+
+# A term of a query: optional "field:", then a quoted or unquoted value
+TERM = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+
+KINDS = ('group', 'dataset', 'datatype')
+
+
+class QueryError(ValueError):
+    """ Invalid search query """
+    pass
+
+
+class Term(object):
+    """ A parsed query term. """
+
+    def __init__(self, field, value):
+        self.field = field  # None for a path substring
+        self.value = value
+        self.name = None  # attribute name, for 'attr'
+        self.op = None  # None, '=' or '~', for 'attr'
+        self.pattern = None  # compiled regular expression, for path and text matching
+
+        if field is None:
+            self.pattern = re.compile(re.escape(value.lower()))
+        elif field == 're':
+            try:
+                self.pattern = re.compile(value)
+            except re.error as e:
+                raise QueryError('invalid regular expression "%s": %s' % (value, e))
+        elif field == 'text':
+            self.pattern = re.compile(re.escape(value.lower()))
+        elif field == 'kind':
+            if value not in KINDS:
+                raise QueryError('unknown kind "%s" (one of: %s)' % (value, ", ".join(KINDS)))
+        elif field == 'ndim':
+            try:
+                self.value = int(value)
+            except ValueError:
+                raise QueryError('invalid number of dimensions "%s"' % value)
+        elif field == 'shape':
+            self.value = parse_shape(value)
+        elif field == 'attr':
+            match = re.match(r'([^=~]+)(?:([=~])(.*))?$', value)
+            if match is None:
+                raise QueryError('invalid attribute term "%s"' % value)
+            self.name, self.op, self.value = match.groups()
+            if self.op == '~':
+                self.value = self.value.lower()
+        elif field != 'dtype':
+            raise QueryError('unknown search field "%s"' % field)
+
+
+def parse_shape(text):
+    """ Parse a shape such as "100x*x3" into a tuple of extents (None for *) """
+    if text in ('()', 'scalar'):
+        return ()
+    shape = []
+    for extent in text.lower().split('x'):
+        if extent == '*':
+            shape.append(None)
+            continue
+        try:
+            shape.append(int(extent))
+        except ValueError:
+            raise QueryError('invalid shape "%s"' % text)
+    return tuple(shape)
+
+
+def parse(query):
+    """ Parse a query string into a list of Term """
+    terms = []
+    for field, value in TERM.findall(query):
+        if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+        terms.append(Term(field.lower() or None, value))
+    if len(terms) == 0:
+        raise QueryError("empty query")
+    return terms
+
+
+def attr_matches(value, op, expected):
+    """ True if an indexed attribute value satisfies the operation of an 'attr' term """
+    if op is None:
+        return True
+    if value is None:  # value not indexed
+        return False
+    if op == '~':
+        return isinstance(value, type(u'')) and expected in value.lower()
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        try:
+            return value == float(expected)
+        except ValueError:
+            return False
+    return ("%s" % value) == expected
+
+
+class Lines(object):
+    """ Strings (one per object) searched together by regular expression. """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.text = "\n".join(lines)
+        lengths = np.fromiter((len(line) + 1 for line in lines), dtype=np.int64, count=len(lines))
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lines) else lengths
+
+    def search(self, pattern, lo=0, hi=None):
+        """ Sorted indices of the lines matched by *pattern*, among lines lo to hi (excluded) """
+        if hi is None:
+            hi = len(self.lines)
+        if lo >= hi:
+            return np.zeros(0, dtype=np.intp)
+        pos = int(self.starts[lo])
+        endpos = int(self.starts[hi]) - 1 if hi < len(self.lines) else len(self.text)
+        scan = re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
+        spans = np.array([m.span() for m in scan.finditer(self.text, pos, endpos)], dtype=np.int64).reshape(-1, 2)
+        first = np.searchsorted(self.starts, spans[:, 0], side='right') - 1
+        last = np.searchsorted(self.starts, np.maximum(spans[:, 1] - 1, spans[:, 0]), side='right') - 1
+        if np.any(first != last):
+            # Some matches span lines (e.g. with [^x]), and may hide others: match the lines one by one
+            return np.array([idx for idx in range(lo, hi) if pattern.search(self.lines[idx]) is not None],
+                            dtype=np.intp)
+        return np.unique(first).astype(np.intp)
+
+
+class Searcher(object):
+    """ Runs queries over a FileIndex. """
+
+    def __init__(self, index):
+        self.index = index
+        self.paths = sorted(index.objects)
+        self.records = [IndexEntry(*index.objects[path]) for path in self.paths]
+        self._path_lines = None
+        self._lower_path_lines = None
+        self._text_lines = None
+        self._tables = {}
+
+    @property
+    def path_lines(self):
+        if self._path_lines is None:
+            self._path_lines = Lines(self.paths)
+        return self._path_lines
+
+    @property
+    def lower_path_lines(self):
+        """ Lower-case paths, for case insensitive substring matching """
+        if self._lower_path_lines is None:
+            self._lower_path_lines = Lines([path.lower() for path in self.paths])
+        return self._lower_path_lines
+
+    @property
+    def text_lines(self):
+        """ Lower-case string attribute values, one line per value (so that no match spans two values)
+
+        Returns the Lines, the index of the object of each line, and the first line of each object
+        (with an extra item, the number of lines).
+        """
+        if self._text_lines is None:
+            lines = []
+            owners = []
+            firsts = []
+            for idx, record in enumerate(self.records):
+                firsts.append(len(lines))
+                for value in record.attrs.values():
+                    if isinstance(value, type(u'')):
+                        lines.append(value.lower().replace("\n", " "))
+                        owners.append(idx)
+            firsts.append(len(lines))
+            self._text_lines = (Lines(lines), np.array(owners, dtype=np.intp), np.array(firsts, dtype=np.intp))
+        return self._text_lines
+
+    def table(self, name):
+        """ Map of a property value (kind, dtype, ndim or attribute name) to the indices of the objects """
+        if name not in self._tables:
+            table = {}
+            for idx, record in enumerate(self.records):
+                if name == 'attr':
+                    keys = record.attrs
+                elif name == 'ndim':
+                    keys = [] if record.shape is None else [len(record.shape)]
+                else:
+                    keys = [record.kind if name == 'kind' else record.dtype]
+                for key in keys:
+                    table.setdefault(key, []).append(idx)
+            self._tables[name] = dict((k, np.array(v, dtype=np.intp)) for k, v in table.items())
+        return self._tables[name]
+
+    def attr_values(self, name):
+        """ Map of the indexed values of the attribute *name* to the indices of the objects """
+        key = ('attr', name)
+        if key not in self._tables:
+            table = {}
+            for idx in self.table('attr').get(name, ()):
+                table.setdefault(self.records[idx].attrs[name], []).append(idx)
+            self._tables[key] = dict((k, np.array(v, dtype=np.intp)) for k, v in table.items())
+        return self._tables[key]
+
+    def shapes(self, ndim):
+        """ Indices of the objects with *ndim* dimensions, and their shapes as an array """
+        key = ('shape', ndim)
+        if key not in self._tables:
+            indices = self.table('ndim').get(ndim, np.zeros(0, dtype=np.intp))
+            shapes = np.array([self.records[idx].shape for idx in indices], dtype=np.int64).reshape(-1, ndim)
+            self._tables[key] = (indices, shapes)
+        return self._tables[key]
+
+    def select(self, term, lo=0, hi=None):
+        """ Indices of the objects matching a term (only those from lo to hi, for the scans) """
+        empty = np.zeros(0, dtype=np.intp)
+        field = term.field
+        if field is None:
+            return self.lower_path_lines.search(term.pattern, lo, hi)
+        if field == 're':
+            return self.path_lines.search(term.pattern, lo, hi)
+        if field == 'text':
+            lines, owners, firsts = self.text_lines
+            if hi is None:
+                hi = len(self.records)
+            return np.unique(owners[lines.search(term.pattern, int(firsts[lo]), int(firsts[hi]))])
+        if field in ('kind', 'ndim'):
+            return self.table(field).get(term.value, empty)
+        if field == 'dtype':
+            parts = [v for k, v in self.table('dtype').items() if k is not None and k.startswith(term.value)]
+            return np.concatenate(parts) if parts else empty
+        if field == 'shape':
+            indices, shapes = self.shapes(len(term.value))
+            matching = np.ones(len(indices), dtype=bool)
+            for dim, extent in enumerate(term.value):
+                if extent is not None:
+                    matching &= shapes[:, dim] == extent
+            return indices[matching]
+        if field == 'attr':
+            if term.op is None:
+                return self.table('attr').get(term.name, empty)
+            parts = [v for k, v in self.attr_values(term.name).items() if attr_matches(k, term.op, term.value)]
+            return np.concatenate(parts) if parts else empty
+        raise QueryError('unknown search field "%s"' % field)
+
+    def search(self, query, scope="/"):
+        """ Sorted paths of the objects matching *query*, among those below the group *scope* """
+        terms = parse(query)
+        lo, hi = 0, len(self.paths)
+        if scope != "/":
+            prefix = scope.rstrip("/") + "/"
+            # The paths are sorted, so the objects below the scope are contiguous
+            lo = bisect_left(self.paths, prefix)
+            hi = bisect_left(self.paths, prefix[:-1] + "0")  # '0' follows '/'
+        mask = np.zeros(len(self.paths), dtype=bool)
+        mask[lo:hi] = True
+
+        # Cheapest terms first, so the scans are skipped when nothing is left
+        terms.sort(key=lambda t: t.field in (None, 're', 'text', 'shape'))
+        for term in terms:
+            if not mask.any():
+                break
+            selected = np.zeros(len(self.paths), dtype=bool)
+            selected[self.select(term, lo, hi)] = True
+            mask &= selected
+        return [self.paths[idx] for idx in np.flatnonzero(mask)]
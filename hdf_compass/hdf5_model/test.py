@@ -12,13 +12,231 @@
 from __future__ import absolute_import, division, print_function
 
 from hdf_compass.compass_model.test import container, store
-from hdf_compass.hdf5_model import HDF5Group, HDF5Store
-from hdf_compass.utils import data_url
+from hdf_compass.hdf5_model import HDF5Group, HDF5Store, HDF5Dataset, HDF5KV
+from hdf_compass.hdf5_model.model import HDF5Image, HDF5PlaneImage, HDF5IndexedImage
+from hdf_compass.hdf5_model.index import FileIndex
+from hdf_compass.hdf5_model.search import Searcher, QueryError
+from hdf_compass.utils import data_url, path2url
 
 import os
+import shutil
+import tempfile
+import unittest as ut
+
+import h5py
+import numpy as np
 
 url = os.path.join(data_url(), "hdf5", "tall.h5")
 
 s = store(HDF5Store, url)
 c = container(HDF5Store, url, HDF5Group, "/")
 
+
+class TestAttributeMetadata(ut.TestCase):
+    """ Attribute metadata, including attributes without data """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        path = os.path.join(self.folder, "attrs.h5")
+        with h5py.File(path, 'w') as f:
+            f.attrs['value'] = np.arange(4, dtype='i4')
+            f.attrs['empty'] = h5py.Empty('f8')
+            f.attrs['zero'] = np.zeros((0,), dtype='i4')
+        self.store = HDF5Store(path2url(path))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.folder)
+
+    def test_metadata(self):
+        md = dict((m['name'], m) for m in HDF5KV(self.store, '/').metadata())
+        self.assertEqual(md['value']['size'], 16)
+        self.assertEqual(md['value']['shape'], (4,))
+        self.assertEqual(md['empty']['size'], 0)
+        self.assertEqual(md['zero']['size'], 0)
+
+
+class TestReadFields(ut.TestCase):
+    """ Reads of a subset of the fields of a compound dataset """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        path = os.path.join(self.folder, "compound.h5")
+        dtype = np.dtype([('a', 'i4'), ('b', 'f8'), ('c', 'f4', (2,))])
+        data = np.zeros((6, 5), dtype=dtype)
+        data['a'] = np.arange(30).reshape(6, 5)
+        data['b'] = np.random.random((6, 5))
+        data['c'] = np.random.random((6, 5, 2))
+        with h5py.File(path, 'w') as f:
+            f.create_dataset('compound', data=data)
+        self.store = HDF5Store(path2url(path))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.folder)
+
+    def test_read_fields(self):
+        node = HDF5Dataset(self.store, '/compound')
+        for names in (['b'], ['c'], ['a', 'c']):
+            for sel in ((), (slice(1, 4), slice(None, None, 2)), (2,), (np.s_[::2], 3)):
+                data = node.read_fields(names, sel)
+                self.assertEqual(data.dtype.names, tuple(names))
+                for name in names:
+                    np.testing.assert_array_equal(data[name], node[sel][name])
+
+
+class TestImages(ut.TestCase):
+    """ Images of the HDF5 image standard, read whole or tile by tile """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        path = os.path.join(self.folder, "images.h5")
+        rgb = np.random.randint(0, 256, size=(40, 50, 3)).astype(np.uint8)
+        self.rgb = rgb
+        self.indices = np.random.randint(0, 256, size=(40, 50)).astype(np.uint8)
+        self.lut = np.random.randint(0, 256, size=(256, 3)).astype(np.uint8)
+        with h5py.File(path, 'w') as f:
+            pixel = f.create_dataset('pixel', data=rgb)
+            plane = f.create_dataset('plane', data=np.transpose(rgb, (2, 0, 1)), chunks=(3, 16, 16))
+            for dset, mode in ((pixel, b'INTERLACE_PIXEL'), (plane, b'INTERLACE_PLANE')):
+                dset.attrs['CLASS'] = np.bytes_(b'IMAGE')
+                dset.attrs['IMAGE_SUBCLASS'] = np.bytes_(b'IMAGE_TRUECOLOR')
+                dset.attrs['INTERLACE_MODE'] = np.bytes_(mode)
+            palette = f.create_dataset('palette', data=self.lut)
+            palette.attrs['CLASS'] = np.bytes_(b'PALETTE')
+            indexed = f.create_dataset('indexed', data=self.indices, chunks=(16, 16))
+            indexed.attrs['CLASS'] = np.bytes_(b'IMAGE')
+            indexed.attrs['IMAGE_SUBCLASS'] = np.bytes_(b'IMAGE_INDEXED')
+            indexed.attrs['PALETTE'] = palette.ref
+        self.store = HDF5Store(path2url(path))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.folder)
+
+    def test_can_handle(self):
+        for key, cls in (('/pixel', HDF5Image), ('/plane', HDF5PlaneImage), ('/indexed', HDF5IndexedImage)):
+            self.assertEqual([c for c in (HDF5Image, HDF5PlaneImage, HDF5IndexedImage)
+                              if c.can_handle(self.store, key)], [cls])
+        self.assertFalse(HDF5IndexedImage.can_handle(self.store, '/palette'))
+
+    def test_planes(self):
+        """ Planes are interleaved, for the whole image and for subsampled tiles """
+        node = HDF5PlaneImage(self.store, '/plane')
+        np.testing.assert_array_equal(node.data, self.rgb)
+        rows, cols = slice(16, 40, 2), slice(0, 50, 4)
+        np.testing.assert_array_equal(node.region(rows, cols), node.data[rows, cols])
+
+    def test_palette(self):
+        """ Indices are looked up in the palette """
+        node = HDF5IndexedImage(self.store, '/indexed')
+        np.testing.assert_array_equal(node.palette, self.lut)
+        np.testing.assert_array_equal(node.data, self.lut[self.indices])
+        rows, cols = slice(5, 37, 3), slice(16, 32)
+        np.testing.assert_array_equal(node.region(rows, cols), node.data[rows, cols])
+
+
+class TestIndex(ut.TestCase):
+    """ The metadata index answers as the file does, and is saved as a sidecar """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.env = os.environ.get('HDF_COMPASS_CACHE')
+        os.environ['HDF_COMPASS_CACHE'] = os.path.join(self.folder, "cache")
+        path = os.path.join(self.folder, "index.h5")
+        with h5py.File(path, 'w') as f:
+            f.attrs['title'] = 'Index test'
+            grid = f.create_group('grid')
+            grid.create_dataset('temp', data=np.zeros((10, 20), dtype='f4'), chunks=(5, 20)).attrs['units'] = 'K'
+            grid.create_dataset('names', data=np.array([b'a', b'bb']))
+            image = grid.create_dataset('image', data=np.zeros((4, 5, 3), dtype=np.uint8))
+            image.attrs['CLASS'] = np.bytes_(b'IMAGE')
+            image.attrs['IMAGE_SUBCLASS'] = np.bytes_(b'IMAGE_TRUECOLOR')
+            image.attrs['INTERLACE_MODE'] = np.bytes_(b'INTERLACE_PIXEL')
+            for idx in (2, 10, 1):
+                f.create_group('runs/run%d' % idx)
+        self.url = path2url(path)
+
+    def tearDown(self):
+        if self.env is None:
+            del os.environ['HDF_COMPASS_CACHE']
+        else:
+            os.environ['HDF_COMPASS_CACHE'] = self.env
+        shutil.rmtree(self.folder)
+
+    def describe(self, store):
+        """ Handlers of every object, and listings of every group """
+        keys = ['/']
+        store.f.visit(lambda name: keys.append('/' + name))
+        handlers = dict((key, store.gethandlers(key)) for key in keys)
+        listings = {}
+        for key in keys:
+            if HDF5Group in handlers[key]:
+                group = HDF5Group(store, key)
+                listings[key] = [group[idx].key for idx in range(len(group))]
+        return keys, handlers, listings
+
+    def test_round_trip(self):
+        live = HDF5Store(self.url)
+        keys, handlers, listings = self.describe(live)
+        sidecar = live.sidecar_path('index', 'json.gz')
+        stale = sidecar.rsplit('-', 2)[0] + '-1-1.json.gz'  # made for an older version of the file
+        with open(stale, 'wb') as fod:
+            fod.write(b'stale')
+        live.start_indexing().join()
+        self.assertEqual(len(live.index), len(keys))
+        live.close()
+        self.assertTrue(os.path.exists(sidecar))
+        self.assertFalse(os.path.exists(stale))
+
+        store_ = HDF5Store(self.url)
+        self.assertIsNone(store_.index)  # only loaded for the stores kept open
+        store_.start_background_work()
+        store_._loading.join()
+        self.assertIsNotNone(store_.index)
+        for key in keys:
+            self.assertTrue(store_.index.contains(key))
+            self.assertIn(key, store_)
+        self.assertEqual(self.describe(store_), (keys, handlers, listings))
+        store_.close()
+
+
+class TestSearch(ut.TestCase):
+    """ Queries over a hand-made index """
+
+    def setUp(self):
+        objects = {'/': ['group', None, None, None, [], {'title': 'Storm data', 'source': 'model run'}, False],
+                   '/grid': ['group', None, None, None, [], {}, False],
+                   '/grid/Temp': ['dataset', [10, 20], 'float32', [5, 20], ['gzip:4'], {'units': 'K'}, False],
+                   '/grid/mask': ['dataset', [10, 20], 'uint8', None, [], {'units': None}, False],
+                   '/names': ['dataset', [3], '|S8', None, [], {}, True]}
+        self.searcher = Searcher(FileIndex(objects, {}))
+
+    def test_paths(self):
+        self.assertEqual(self.searcher.search("temp"), ['/grid/Temp'])
+        self.assertEqual(self.searcher.search("re:^/grid/[a-z]+$"), ['/grid/mask'])
+
+    def test_metadata(self):
+        self.assertEqual(self.searcher.search("kind:dataset ndim:2"), ['/grid/Temp', '/grid/mask'])
+        self.assertEqual(self.searcher.search("dtype:float shape:*x20"), ['/grid/Temp'])
+        self.assertEqual(self.searcher.search("attr:units"), ['/grid/Temp', '/grid/mask'])
+        self.assertEqual(self.searcher.search("attr:units=K"), ['/grid/Temp'])
+        self.assertEqual(self.searcher.search("text:storm"), ['/'])
+        self.assertEqual(self.searcher.search('text:"data | model"'), [])
+        self.assertEqual(self.searcher.search("text:storm", "/grid"), [])
+
+    def test_scope(self):
+        self.assertEqual(self.searcher.search("kind:dataset", "/grid"), ['/grid/Temp', '/grid/mask'])
+
+    def test_invalid(self):
+        self.assertRaises(QueryError, self.searcher.search, "re:(")
+        self.assertRaises(QueryError, self.searcher.search, "size:3")
+
+
+class TestStoreSearch(ut.TestCase):
+    """ Search of a file which cannot be indexed """
+
+    def test_unable_to_index(self):
+        store_ = HDF5Store(url)
+        store_.close()
+        self.assertRaises(QueryError, store_.search, "temp")
@@ -20,6 +20,7 @@ import sys
 import os.path as op
 import posixpath as pp
 import json
+import time
 import requests
 import numpy as np
 
@@ -213,8 +214,12 @@ class HDF5RestStore(compass_model.Store):
         
         if uri in self.cache:
             rsp = self.cache[uri]
+            compass_model.instrument.record_cache(self, None, 'http', True)
         else:
+            t0 = time.time()
             rsp = get_json(self.endpoint, domain=self.domain, uri=uri)
+            compass_model.instrument.record(self, None, 'http', time.time() - t0)
+            compass_model.instrument.record_cache(self, None, 'http', False)
             self.cache[uri] = rsp
         return rsp
         
@@ -428,9 +433,9 @@ class HDF5RestKV(compass_model.KeyValue):
         self._uri = store.f[key]
         
         rsp = store.get(self._uri + "/attributes")
-        attributes = rsp["attributes"]
+        self._attributes = rsp["attributes"]
         names = []
-        for attr in attributes:
+        for attr in self._attributes:
             names.append(attr["name"])
         self._names = names
 
@@ -463,6 +468,23 @@ class HDF5RestKV(compass_model.KeyValue):
         arr = np.array(value_json, dtype=arr_dtype)
         return arr
 
+    def metadata(self):
+        """ Names, types and shapes, from the single /attributes response """
+        md = []
+        for attr in self._attributes:
+            dtype = hdf5dtype.createDataType(attr["type"])
+            shape_json = attr.get("shape", {})
+            if shape_json.get("class") == "H5S_SIMPLE":
+                shape = tuple(shape_json["dims"])
+            else:
+                shape = ()
+            if shape_json.get("class") == "H5S_NULL":  # no data, as for HDF5KV.metadata
+                size = 0
+            else:
+                size = int(np.prod(shape)) * dtype.itemsize
+            md.append({'name': attr["name"], 'dtype': dtype, 'shape': shape, 'size': size})
+        return md
+
 
 
 
@@ -11,29 +11,216 @@
 ##############################################################################
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
 import posixpath as pp
+import hashlib
+import json
+import socket
+import threading
+from collections import OrderedDict
+try:
+    from urlparse import urlsplit, urlunsplit
+except ImportError:
+    from urllib.parse import urlsplit, urlunsplit
 
 import numpy as np
+import httplib2
 import pydap as dap
-from pydap.client import open_url
-from pydap.proxy import ArrayProxy
+import pydap.model
+from pydap.lib import walk
+from pydap.parsers.dds import DDSParser
+from pydap.parsers.das import DASParser
+from pydap.proxy import ArrayProxy, SequenceProxy
+from pydap.util.http import request
 
 import logging
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 from hdf_compass import compass_model
+from hdf_compass.utils import cache_folder
 
 
-def check_key(key, dataset):
-    if '/' not in key:
-        return key, dataset
-    new_dataset = dataset[key.split('/')[0]]
-    return key.split('/')[1], new_dataset
+# Keep an on-disk copy of the DDS/DAS of the datasets served with a Last-Modified header
+DISK_CACHE = True
+# Max size of the blocks of remote data retained by each store
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+_metadata = {}  # url -> (dds, das)
+
+
+def _metadata_url(url, ext):
+    """ Url of the DDS or DAS (*ext* is ".dds" or ".das") of a dataset, keeping any selection """
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    return urlunsplit((scheme, netloc, path + ext, query, fragment))
+
+
+def _metadata_path(url):
+    """ Path of the on-disk copy of the DDS/DAS, or None if caching on disk is not possible """
+    if not DISK_CACHE:
+        return None
+    folder = cache_folder('opendap')
+    if folder is None:
+        return None
+    key = url if isinstance(url, bytes) else url.encode('utf-8')
+    return os.path.join(folder, hashlib.sha1(key).hexdigest() + '.json')
+
+
+def fetch_metadata(url):
+    """ Return the DDS and DAS of a dataset, downloading them only once per session.
+
+    With DISK_CACHE, a copy is also saved when the server provides a Last-Modified header.  Later
+    sessions reuse it (with a single HEAD request) as long as that header does not change.
+    """
+    if url in _metadata:
+        return _metadata[url]
+
+    path = _metadata_path(url)
+    if path is not None and os.path.exists(path):
+        try:
+            with open(path) as fid:
+                saved = json.load(fid)
+            resp, _ = httplib2.Http().request(_metadata_url(url, '.dds'), 'HEAD')
+            if saved['url'] == url and resp.get('last-modified') == saved['last_modified']:
+                log.debug("DDS/DAS of %s from %s" % (url, path))
+                _metadata[url] = saved['dds'], saved['das']
+                return _metadata[url]
+        except (IOError, ValueError, KeyError, httplib2.HttpLib2Error, socket.error) as e:
+            log.debug("unable to use %s: %s" % (path, e))
+
+    # the DDS and the DAS are requested concurrently
+    responses = {}
+
+    def get(ext):
+        try:
+            responses[ext] = request(_metadata_url(url, ext))
+        except Exception as e:
+            responses[ext] = e
+
+    threads = [threading.Thread(target=get, args=(ext,)) for ext in ('.dds', '.das')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for ext in ('.dds', '.das'):
+        if isinstance(responses[ext], Exception):
+            raise responses[ext]
+    (resp, dds), (_, das) = responses['.dds'], responses['.das']
+    _metadata[url] = dds, das
+
+    last_modified = resp.get('last-modified')
+    if path is not None and last_modified is not None:
+        try:
+            with open(path, 'w') as fod:
+                json.dump({'url': url, 'last_modified': last_modified, 'dds': dds, 'das': das}, fod)
+        except (IOError, OSError) as e:
+            log.debug("unable to save %s: %s" % (path, e))
+    return _metadata[url]
+
+
+def open_dataset(url):
+    """ Build the Pydap dataset from the (cached) DDS and DAS, as pydap.client.open_url does """
+    dds, das = fetch_metadata(url)
+    dataset = DDSParser(dds).parse()
+    dataset = DASParser(das, dataset).parse()
+    for var in walk(dataset, dap.model.BaseType):
+        var.data = ArrayProxy(var.id, url, var.shape)
+    for var in walk(dataset, dap.model.SequenceType):
+        var.data = SequenceProxy(var.id, url)
+    return dataset
+
+
+def hyperslab(index, shape):
+    """ Split an index into the hyperslab to request and the index to apply to the returned block.
+
+    The hyperslab is a tuple of (start, stop, step) triples, one per dimension, that maps to a DAP
+    constraint expression.  Integers keep the dimension in the request, and are applied locally (as
+    are negative steps and any other index that cannot be expressed as a hyperslab).
+    """
+    if not isinstance(index, tuple):
+        index = (index,)
+    ellipsis = [pos for pos, idx in enumerate(index) if idx is Ellipsis]  # not "in": arrays compare elementwise
+    if len(ellipsis) > 0:
+        pos = ellipsis[0]
+        index = index[:pos] + (slice(None),) * (len(shape) - len(index) + 1) + index[pos + 1:]
+    index = index + (slice(None),) * (len(shape) - len(index))
+    if len(index) > len(shape):
+        raise IndexError("too many indices (%d) for shape %s" % (len(index), shape))
+
+    slab = []
+    local = []
+    for idx, size in zip(index, shape):
+        if isinstance(idx, (int, np.integer)):
+            pos = idx + size if idx < 0 else idx
+            if not 0 <= pos < size:
+                raise IndexError("index %d out of range (size %d)" % (idx, size))
+            slab.append((pos, pos + 1, 1))
+            local.append(0)
+        elif isinstance(idx, slice) and (idx.step is None or idx.step > 0):
+            start, stop, step = idx.indices(size)
+            count = len(range(start, stop, step))
+            if count == 0:
+                slab.append((0, 0, 1))
+            else:
+                slab.append((start, start + (count - 1) * step + 1, step))
+            local.append(slice(None))
+        else:
+            slab.append((0, size, 1))
+            local.append(idx)
+    return tuple(slab), tuple(local)
+
+
+class BlockCache(object):
+    """ Bounded LRU cache of the blocks of remote data, keyed by variable id and hyperslab.
+
+    A request is also served by any cached block, with unit steps, that contains it.
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._blocks = OrderedDict()
+        self._nbytes = 0
+
+    def get(self, var_id, slab):
+        key = (var_id, slab)
+        if key in self._blocks:
+            block = self._blocks.pop(key)
+            self._blocks[key] = block
+            return block
+
+        for (cached_id, cached_slab), block in self._blocks.items():
+            if cached_id != var_id or any(c_step != 1 for _, _, c_step in cached_slab):
+                continue
+            if all(c_start <= start and stop <= c_stop
+                   for (c_start, c_stop, _), (start, stop, _) in zip(cached_slab, slab)):
+                return block[tuple(slice(start - c_start, stop - c_start, step)
+                                   for (c_start, _, _), (start, stop, step) in zip(cached_slab, slab))]
+        return None
+
+    def put(self, var_id, slab, block):
+        if block.nbytes > self.max_bytes:
+            return
+        key = (var_id, slab)
+        if key in self._blocks:
+            self._nbytes -= self._blocks.pop(key).nbytes
+        while self._blocks and self._nbytes + block.nbytes > self.max_bytes:
+            self._nbytes -= self._blocks.popitem(last=False)[1].nbytes
+        self._blocks[key] = block
+        self._nbytes += block.nbytes
+
+    def clear(self):
+        self._blocks.clear()
+        self._nbytes = 0
 
 
 class Server(compass_model.Store):
-    """ Represents the remote OpENDAP server to be accessed """
+    """ Represents the remote OpENDAP server to be accessed.
+
+    The DDS and DAS are fetched once (see fetch_metadata), and all the
+    variables are indexed by key when the store is opened, so browsing the
+    dataset needs no further requests.  Keys are the names of the variables
+    joined by '/' (e.g. "struct/var"), and '' is the dataset itself.
+    """
     @staticmethod
     def plugin_name():
         return "OpENDAP"
@@ -43,18 +230,12 @@ class Server(compass_model.Store):
         return "A plugin used to access OpENDAP Servers."
 
     def __contains__(self, key):
-        if '/' not in key:
-            return key in self.dataset
-
-        new_dset = self.dataset[key.split('/')[0]]
-        new_key = key.rsplit('/')[1]
-
-        return new_key in new_dset
+        return key in self._variables
 
     @staticmethod
     def can_handle(url):
         try:
-            flag = isinstance(open_url(url), dap.model.DatasetType)
+            flag = isinstance(open_dataset(url), dap.model.DatasetType)
             log.debug("able to handle %s? %r" % (url, flag))
             return flag
         except Exception:
@@ -66,12 +247,28 @@ class Server(compass_model.Store):
             raise ValueError(url)
         self._url = url
         self._valid = True
-        self._dataset = open_url(self.url)
-        self._datalength = len(self._dataset.data)
-        self._dataset.setdefault('')
+        self._dataset = open_dataset(self.url)
+        self._variables = {'': self._dataset}
+        self._children = {}
+        self._index(self._dataset, '')
+        self._blocks = BlockCache()
+
+    def _index(self, parent, parent_key):
+        """ Index the variables below *parent*, recursively """
+        children = []
+        for name in parent.keys():
+            var = parent[name]
+            key = pp.join(parent_key, name) if parent_key else name
+            self._variables[key] = var
+            children.append(key)
+            if isinstance(var, dap.model.StructureType):
+                self._index(var, key)
+        self._children[parent_key] = children
 
     def close(self):
         self._valid = False
+        self._blocks.clear()
+        _metadata.pop(self._url, None)  # a reopen checks for changes
 
     def get_parent(self, key):
         return None
@@ -98,7 +295,20 @@ class Server(compass_model.Store):
 
     @property
     def datalength(self):
-        return self._datalength
+        return len(self._children[''])
+
+    @property
+    def blocks(self):
+        """ Cache of the data blocks fetched from the server """
+        return self._blocks
+
+    def variable(self, key):
+        """ The Pydap variable for *key* """
+        return self._variables[key]
+
+    def children(self, key):
+        """ List of the keys of the members of a dataset or structure """
+        return self._children.get(key, [])
 
 
 class Dataset(compass_model.Container):
@@ -110,8 +320,7 @@ class Dataset(compass_model.Container):
         return self._store.datalength
 
     def __getitem__(self, index):
-        name = self._dset.keys()[index]
-        return self.store[pp.join(self.key, name)]
+        return self.store[self._store.children(self.key)[index]]
 
     def __iter__(self):
         pass
@@ -155,30 +364,23 @@ class Structure(compass_model.Container):
     class_kind = "Structure/Grid/Sequence"
 
     def __len__(self):
-        return len(self._dset.data)
+        return len(self._store.children(self.key))
 
     def __getitem__(self, index):
-        name = self._dset.keys()[index]
-        return self.store[pp.join(self.key, name)]
+        return self.store[self._store.children(self.key)[index]]
 
     def __iter__(self):
         pass
 
     @staticmethod
     def can_handle(store, key):
-        new_key, new_dset = check_key(key, store.dataset)
-        try:
-            return new_key in new_dset and isinstance(new_dset[new_key], dap.model.StructureType)
-        except isinstance(new_dset[new_key], dap.model.DatasetType):
-            return False
+        return key != '' and key in store and isinstance(store.variable(key), dap.model.StructureType)
 
     def __init__(self, store, key):
-        new_key, new_dset = check_key(key, store.dataset)
-
         self._store = store
-        self._key = new_key
+        self._key = key
         self._url = store.url
-        self._dset = new_dset[new_key]
+        self._dset = store.variable(key)
 
     @property
     def key(self):
@@ -211,28 +413,41 @@ class Base(compass_model.Array):
         return np.dtype(self._dtype.typecode)
 
     def __getitem__(self, index):
-        if self._data is None:
-            self._data = ArrayProxy(self._id, self._url, self._shape)[:]
-        return self._data[index]
+        """ Only the requested hyperslab (with stride) is fetched from the server """
+        if len(self._shape) == 0:
+            slab, local = (), index
+        else:
+            slab, local = hyperslab(index, self._shape)
+
+        block = self._store.blocks.get(self._id, slab)
+        compass_model.instrument.record_cache(self._store, self._id, 'hyperslab', block is not None)
+        if block is None:
+            expected = tuple(len(range(start, stop, step)) for start, stop, step in slab)
+            if 0 in expected:
+                block = np.empty(expected, dtype=self.dtype)
+            else:
+                proxy = ArrayProxy(self._id, self._url, self._shape)
+                selection = tuple(slice(*s) for s in slab) if len(slab) > 0 else slice(None)
+                # pydap may drop the dimensions of size 1
+                block = np.asarray(proxy[selection]).reshape(expected)
+            self._store.blocks.put(self._id, slab, block)
+        return block[local]
 
     @staticmethod
     def can_handle(store, key):
-        new_key, new_dset = check_key(key, store.dataset)
-        return new_key in new_dset and isinstance(new_dset[new_key], dap.model.BaseType)
+        return key in store and isinstance(store.variable(key), dap.model.BaseType)
 
     def __init__(self, store, key):
-        new_key, new_dset = check_key(key, store.dataset)
+        var = store.variable(key)
 
         self._store = store
-        self._key = new_key
+        self._key = key
         self._url = store.url
-        self._id = new_dset[new_key].id
-
-        self._shape = new_dset[new_key].shape
-        self._dtype = new_dset[new_key].type
-        self._name = new_dset[new_key].name
+        self._id = var.id
 
-        self._data = None
+        self._shape = var.shape
+        self._dtype = var.type
+        self._name = var.name
 
     @property
     def key(self):
@@ -267,22 +482,19 @@ class Attributes(compass_model.KeyValue):
 
     @property
     def keys(self):
-        return self._keys.keys()
+        return list(self._keys.keys())
 
     def __getitem__(self, name):
         return self._keys[name]
 
     @staticmethod
     def can_handle(store, key):
-        new_key, new_dset = check_key(key, store.dataset)
-        return new_key != ''
+        return key != '' and key in store
 
     def __init__(self, store, key):
-        new_key, new_dset = check_key(key, store.dataset)
-
         self._store = store
-        self._key = new_key
-        self._keys = new_dset[self._key].attributes
+        self._key = key
+        self._keys = store.variable(key).attributes
 
     @property
     def key(self):
@@ -1,8 +1,31 @@
+import unittest as ut
+
+import numpy as np
+
 from hdf_compass.compass_model.test import container, store
 from hdf_compass.opendap_model import Server, Dataset
+from hdf_compass.opendap_model.model import hyperslab
 
 url = "http://test.opendap.org/opendap/hyrax/data/hdf5/grid_1_2d.h5"
 s_1 = store(Server, url)
 
 url = "http://test.opendap.org/opendap/hyrax/data/nc/bears.nc"
-s_2 = store(Server, url)
\ No newline at end of file
+s_2 = store(Server, url)
+
+
+class TestHyperslab(ut.TestCase):
+    """ Split of an index into the requested hyperslab and the local index """
+
+    def test_slices(self):
+        self.assertEqual(hyperslab((1, slice(2, 8, 3)), (4, 10)), (((1, 2, 1), (2, 6, 3)), (0, slice(None))))
+        self.assertEqual(hyperslab((Ellipsis, 2), (4, 5, 6)),
+                         (((0, 4, 1), (0, 5, 1), (2, 3, 1)), (slice(None), slice(None), 0)))
+
+    def test_array_index(self):
+        """ Array indices are applied locally, whole dimensions being requested """
+        rows = np.array([0, 2])
+        slab, local = hyperslab((rows, slice(None)), (4, 5))
+        self.assertEqual(slab, ((0, 4, 1), (0, 5, 1)))
+        self.assertIs(local[0], rows)
+        slab, local = hyperslab((rows, Ellipsis), (4, 5))
+        self.assertEqual(slab, ((0, 4, 1), (0, 5, 1)))
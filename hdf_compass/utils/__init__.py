@@ -16,7 +16,8 @@ import logging
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
-from .utils import is_darwin, is_win, is_linux, url2path, path2url, data_url
+from .utils import is_darwin, is_win, is_linux, url2path, path2url, data_url, cache_folder, sidecar_path, \
+    remove_stale_sidecars, replace_file, has_cartopy
 
 
 __version__ = "0.7.0b1"
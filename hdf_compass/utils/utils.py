@@ -16,6 +16,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import sys
 import os
+import glob
+import hashlib
 
 import logging
 log = logging.getLogger(__name__)
@@ -24,6 +26,9 @@ is_darwin = sys.platform == 'darwin'
 is_win = sys.platform == 'win32'
 is_linux = sys.platform == 'linux2'
 
+# Results of the probes for optional dependencies, see has_cartopy()
+_probes = {}
+
 
 def url2path(url):
     """ Helper function that returns the file path from an url, dealing with Windows peculiarities """
@@ -50,3 +55,82 @@ def data_url():
         raise RuntimeError("data path %s does not exist" % data_folder)
 
     return path2url(data_folder)
+
+
+def cache_folder(name):
+    """ Helper function that returns a per-user folder for cached data (e.g. binary copies of parsed files)
+
+    The base folder can be set with the HDF_COMPASS_CACHE environment variable. Returns None if the folder
+    cannot be created, so that callers can simply skip caching.
+    """
+    base = os.environ.get('HDF_COMPASS_CACHE')
+    if not base:
+        if is_win:
+            base = os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'HDFCompass', 'cache')
+        elif is_darwin:
+            base = os.path.join(os.path.expanduser('~'), 'Library', 'Caches', 'HDFCompass')
+        else:
+            base = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                                'hdf_compass')
+
+    folder = os.path.join(base, name)
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError as e:
+            log.warning("unable to create cache folder %s: %s" % (folder, e))
+            return None
+    return folder
+
+
+def sidecar_path(name, path, ext):
+    """ Path of a per-file cache (with extension *ext*) in the *name* cache folder, or None
+
+    The name is keyed by the real path of the file, its modification time and size, so that a modified
+    file gets a new sidecar (the old ones can be removed with remove_stale_sidecars).
+    """
+    folder = cache_folder(name)
+    if folder is None:
+        return None
+    real_path = os.path.realpath(path)
+    if not isinstance(real_path, bytes):
+        real_path = real_path.encode('utf-8')
+    st = os.stat(path)
+    prefix = os.path.join(folder, hashlib.sha1(real_path).hexdigest()[:16])
+    return "%s-%d-%d.%s" % (prefix, int(st.st_mtime * 1000), st.st_size, ext)
+
+
+def remove_stale_sidecars(path):
+    """ Remove the sidecars like *path* (see sidecar_path) made for older versions of the same file """
+    prefix, _, rest = path.rsplit('-', 2)
+    for stale in glob.glob(prefix + '-*.' + rest.split('.', 1)[1]):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def replace_file(src, dst):
+    """ Rename *src* to *dst*, replacing *dst* if it exists (a plain os.rename fails then on Windows) """
+    if hasattr(os, 'replace'):  # Python 3.3+
+        os.replace(src, dst)
+        return
+    if is_win and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def has_cartopy():
+    """ Check (only once) whether cartopy is usable.
+
+    The geographic views (GeoArray and GeoSurface) use cartopy, that can be challenging to freeze on OSX
+    due to its dependencies (i.e. geos).
+    """
+    if 'cartopy' not in _probes:
+        try:
+            import cartopy.crs
+            _probes['cartopy'] = True
+        except (ImportError, OSError):
+            _probes['cartopy'] = False
+    return _probes['cartopy']
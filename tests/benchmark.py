@@ -0,0 +1,367 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of the HDF Compass Viewer. The full HDF Compass          #
+# copyright notice, including terms governing use, modification, and         #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+"""
+Benchmark suite for HDF Compass.
+
+Generates synthetic HDF5 (and BAG) fixtures of configurable size, then times
+the operations that matter for interactive use: store open, group listing,
+attribute listing, first grid paint, scrolling through tiles, plotting and
+exporting.  Results are written as JSON, so that two runs (e.g. on different
+commits) can be compared.
+
+By default only the model layer is driven, so no display is needed:
+
+    $ python tests/benchmark.py -o bench.json
+
+With --gui, the wx viewer itself is used as well (cold start, grid paint,
+plot windows).  On a headless machine, run it under Xvfb:
+
+    $ xvfb-run python tests/benchmark.py --gui -o bench.json
+
+To compare against a previous run:
+
+    $ python tests/benchmark.py -o new.json --compare bench.json
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import h5py
+
+prj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, prj_root)
+
+from hdf_compass.utils import path2url
+
+TILESIZE = 100  # same as LRUTileCache.TILESIZE in the array viewer
+
+# Run in a new interpreter by the cold start benchmark: starts the viewer, prints the time until the
+# initial frame is shown (see viewer.on_startup_done), and exits
+COLD_START = """
+import time
+t0 = time.time()
+import wx
+from hdf_compass.compass_viewer import viewer
+
+def startup_done():
+    print("startup_time %.6f" % (time.time() - t0))
+    wx.GetApp().Exit()
+
+viewer.on_startup_done = startup_done
+viewer.run()
+"""
+
+
+# --- Fixtures ----------------------------------------------------------------
+
+def make_hdf5(path, members, rows, cols, attrs):
+    """ Create a synthetic HDF5 file.
+
+    /group      Group with *members* small datasets.
+    /data       (rows, cols) chunked float dataset, with *attrs* attributes.
+    /strings    (rows,) fixed-length string dataset.
+    """
+    with h5py.File(path, 'w') as f:
+        grp = f.create_group('group')
+        for i in range(members):
+            grp.create_dataset('dset_%d' % i, data=i)
+
+        chunks = (min(rows, TILESIZE), min(cols, TILESIZE))
+        dset = f.create_dataset('data', shape=(rows, cols), dtype='f8', chunks=chunks)
+        for r in range(0, rows, TILESIZE):
+            stop = min(r + TILESIZE, rows)
+            dset[r:stop] = np.random.random((stop - r, cols))
+        for i in range(attrs):
+            dset.attrs['attr_%d' % i] = np.arange(i % 10 + 1)
+
+        f.create_dataset('strings', data=np.array([b'line %d' % i for i in range(rows)]))
+
+
+def make_bag(path, rows, cols):
+    """ Create a minimal synthetic BAG file (elevation, uncertainty, metadata). """
+    with h5py.File(path, 'w') as f:
+        root = f.create_group('BAG_root')
+        root.attrs['Bag Version'] = b'1.5.3'
+        chunks = (min(rows, TILESIZE), min(cols, TILESIZE))
+        for name in ('elevation', 'uncertainty'):
+            dset = root.create_dataset(name, shape=(rows, cols), dtype='f4', chunks=chunks)
+            for r in range(0, rows, TILESIZE):
+                stop = min(r + TILESIZE, rows)
+                dset[r:stop] = np.random.random((stop - r, cols)).astype('f4')
+        xml = b'<?xml version="1.0"?><gmi:MI_Metadata/>'
+        root.create_dataset('metadata', data=np.frombuffer(xml, dtype='S1'))
+        root.create_dataset('tracking_list', shape=(0,), maxshape=(None,),
+                            dtype=[('row', 'u4'), ('col', 'u4'), ('depth', 'f4'), ('uncertainty', 'f4'),
+                                   ('track_code', 'u1'), ('list_series', 'u2')])
+
+
+# --- Timing helpers ----------------------------------------------------------
+
+def timed(func, repeat):
+    """ Run *func* (a callable taking no arguments) *repeat* times.
+
+    Returns a dict with all the timings (in seconds) and their summary.
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return {'seconds': times, 'min': min(times), 'median': float(np.median(times))}
+
+
+def gen_csv(data):
+    """ CSV export, as done by the array viewer (see array.frame.gen_csv) """
+    try:
+        from hdf_compass.compass_viewer.array.frame import gen_csv as viewer_gen_csv
+    except ImportError:
+        return "\n".join(",".join(str(x) for x in row) for row in data)
+    return viewer_gen_csv(data, ['\n', ','])
+
+
+# --- Benchmarks --------------------------------------------------------------
+
+def bench_hdf5(url, args, results):
+    """ Model-layer benchmarks on the synthetic HDF5 file """
+    from hdf_compass.hdf5_model import HDF5Store, HDF5KV
+
+    def store_open():
+        HDF5Store(url).close()
+
+    results['hdf5.store_open'] = timed(store_open, args.repeat)
+
+    store = HDF5Store(url)
+
+    def group_listing():
+        # what ContainerReportList asks for every row
+        node = store['/group']
+        for idx in range(len(node)):
+            sub = node[idx]
+            sub.display_name
+            type(sub).class_kind
+
+    results['hdf5.group_listing'] = timed(group_listing, args.repeat)
+
+    def attribute_listing():
+        kv = HDF5KV(store, '/data')
+        [kv[n] for n in kv.keys]
+
+    results['hdf5.attribute_listing'] = timed(attribute_listing, args.repeat)
+
+    def first_tile():
+        node = store['/data']
+        node[0:TILESIZE, 0:TILESIZE]
+
+    results['hdf5.first_tile'] = timed(first_tile, args.repeat)
+
+    def scroll_tiles():
+        node = store['/data']
+        for k in range(args.tiles):
+            row = (k * TILESIZE) % node.shape[0]
+            node[row:row + TILESIZE, 0:TILESIZE]
+
+    results['hdf5.scroll_tiles'] = timed(scroll_tiles, args.repeat)
+
+    def plot_data():
+        # the contour plot reads the whole 2D slice, then decimates it
+        data = store['/data'][:, :]
+        stride = data.shape[0] // 500 + 1
+        data[::stride, ::stride]
+
+    results['hdf5.plot_data'] = timed(plot_data, args.repeat)
+
+    def export():
+        gen_csv(store['/data'][:, :])
+
+    results['hdf5.export'] = timed(export, args.repeat)
+
+    store.close()
+
+
+def bench_bag(url, args, results):
+    """ Model-layer benchmarks on the synthetic BAG file """
+    try:
+        from hdf_compass.bag_model import BAGStore
+    except ImportError as e:
+        print("skipping BAG benchmarks: %s" % e)
+        return
+
+    def store_open():
+        BAGStore(url).close()
+
+    results['bag.store_open'] = timed(store_open, args.repeat)
+
+    store = BAGStore(url)
+
+    def first_tile():
+        node = store['/BAG_root/elevation']
+        node[0:TILESIZE, 0:TILESIZE]
+
+    results['bag.first_tile'] = timed(first_tile, args.repeat)
+
+    def scroll_tiles():
+        node = store['/BAG_root/elevation']
+        for k in range(args.tiles):
+            row = (k * TILESIZE) % node.shape[0]
+            node[row:row + TILESIZE, 0:TILESIZE]
+
+    results['bag.scroll_tiles'] = timed(scroll_tiles, args.repeat)
+
+    store.close()
+
+
+def bench_gui(url, args, results):
+    """ Benchmarks driving the wx viewer (needs a display, e.g. Xvfb) """
+
+    def cold_start():
+        out = subprocess.check_output([sys.executable, '-c', COLD_START], cwd=prj_root)
+        for line in out.decode('ascii', 'replace').splitlines():
+            if line.startswith('startup_time'):
+                return float(line.split()[1])
+        raise RuntimeError("no startup time reported")
+
+    times = [cold_start() for _ in range(args.repeat)]
+    results['gui.cold_start'] = {'seconds': times, 'min': min(times), 'median': float(np.median(times))}
+
+    import wx
+    from hdf_compass import compass_viewer
+    from hdf_compass.compass_viewer import plotting
+    from hdf_compass.compass_viewer.array import ArrayFrame
+    from hdf_compass.hdf5_model import HDF5Store
+
+    app = compass_viewer.CompassApp(False)
+    store = HDF5Store(url)
+
+    def first_paint():
+        # ask the table for a typical visible region, as the grid does on paint
+        f = ArrayFrame(store['/data'])
+        f.Show()
+        table = f.grid.GetTable()
+        for row in range(60):
+            for col in range(20):
+                table.GetValue(row, col)
+        wx.Yield()
+        f.Destroy()
+
+    results['gui.first_grid_paint'] = timed(first_paint, args.repeat)
+
+    def scroll():
+        f = ArrayFrame(store['/data'])
+        table = f.grid.GetTable()
+        for k in range(args.tiles):
+            row0 = (k * TILESIZE) % store['/data'].shape[0]
+            for row in range(row0, row0 + 60):
+                for col in range(20):
+                    table.GetValue(row, col)
+        f.Destroy()
+
+    results['gui.scroll_tiles'] = timed(scroll, args.repeat)
+
+    def plot():
+        f = plotting.load('array').ContourPlotFrame(store['/data'][:, :])
+        f.Destroy()
+
+    results['gui.plot'] = timed(plot, args.repeat)
+
+    store.close()
+    app.Destroy()
+
+
+# --- Reporting ---------------------------------------------------------------
+
+def git_revision():
+    """ Current commit of the source tree, if available """
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=prj_root)
+        return out.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """ Print a comparison table between two result dicts """
+    print("%-28s %12s %12s %8s" % ("benchmark", "old [ms]", "new [ms]", "ratio"))
+    for name in sorted(new['results']):
+        if name not in old['results']:
+            continue
+        t_old = old['results'][name]['median'] * 1000.0
+        t_new = new['results'][name]['median'] * 1000.0
+        ratio = t_new / t_old if t_old > 0 else float('nan')
+        print("%-28s %12.2f %12.2f %8.2f" % (name, t_old, t_new, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HDF Compass benchmark suite")
+    parser.add_argument('-o', '--output', help="JSON file for the results")
+    parser.add_argument('--compare', help="JSON file with previous results to compare against")
+    parser.add_argument('--members', type=int, default=1000, help="members of the listed group")
+    parser.add_argument('--rows', type=int, default=2000, help="rows of the 2D datasets")
+    parser.add_argument('--cols', type=int, default=2000, help="columns of the 2D datasets")
+    parser.add_argument('--attrs', type=int, default=200, help="attributes of the 2D dataset")
+    parser.add_argument('--tiles', type=int, default=20, help="tiles read when scrolling")
+    parser.add_argument('--repeat', type=int, default=3, help="repetitions of each benchmark")
+    parser.add_argument('--gui', action='store_true', help="also benchmark the wx viewer (needs a display)")
+    parser.add_argument('--keep', action='store_true', help="keep the generated fixtures")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='hdf_compass_bench_')
+    try:
+        h5_path = os.path.join(folder, 'bench.h5')
+        bag_path = os.path.join(folder, 'bench.bag')
+        make_hdf5(h5_path, args.members, args.rows, args.cols, args.attrs)
+        make_bag(bag_path, args.rows, args.cols)
+
+        results = {}
+        bench_hdf5(path2url(h5_path), args, results)
+        bench_bag(path2url(bag_path), args, results)
+        if args.gui:
+            bench_gui(path2url(h5_path), args, results)
+    finally:
+        if args.keep:
+            print("fixtures in %s" % folder)
+        else:
+            shutil.rmtree(folder)
+
+    out = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'h5py': h5py.__version__,
+        'parameters': vars(args),
+        'results': results,
+    }
+
+    for name in sorted(results):
+        print("%-28s %10.2f ms" % (name, results[name]['median'] * 1000.0))
+
+    if args.output:
+        with open(args.output, 'w') as fod:
+            json.dump(out, fod, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fid:
+            compare(json.load(fid), out)
+
+
+if __name__ == '__main__':
+    main()